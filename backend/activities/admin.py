@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Activity, StreakEntry
+from .models import Activity, DailyUserRollup, ReminderDispatch, StreakEntry
 
 
 @admin.register(Activity)
@@ -56,3 +56,37 @@ class StreakEntryAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('activity__user')
+
+
+@admin.register(DailyUserRollup)
+class DailyUserRollupAdmin(admin.ModelAdmin):
+    """Read-only admin interface for the derived DailyUserRollup model"""
+    
+    list_display = ('user', 'date', 'completed_count', 'active_activity_count')
+    list_filter = ('date',)
+    search_fields = ('user__username', 'user__email')
+    ordering = ('-date',)
+    list_select_related = ('user',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ReminderDispatch)
+class ReminderDispatchAdmin(admin.ModelAdmin):
+    """Read-only admin interface for the reminder send ledger"""
+    
+    list_display = ('user', 'kind', 'local_date', 'status', 'attempts', 'sent_at')
+    list_filter = ('kind', 'status', 'local_date')
+    search_fields = ('user__username', 'user__email')
+    ordering = ('-local_date', 'id')
+    list_select_related = ('user',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,162 @@
+"""
+Analytics computed with grouped queries.
+
+Every figure comes from a fixed set of aggregate queries (activities grouped
+by category, activities grouped by creation day, daily rollups by day and by
+weekday, monthly summaries for the yearly figures), so the query count does not grow with the number of activities or
+entries. Per-activity streak numbers are read from the stored streak state
+and daily completions from the rollups instead of the entries.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractIsoWeekDay, TruncDate
+
+from .models import Activity, ActivityMonthSummary, DailyUserRollup
+from .streaks import current_streak_expression
+from .summaries import SUMMARY_FIELDS, yearly_totals
+
+# Supported values of the range parameter, in days
+ANALYTICS_RANGES = {
+    '7d': 7,
+    '30d': 30,
+    '90d': 90,
+    '365d': 365,
+}
+DEFAULT_ANALYTICS_RANGE = '30d'
+
+ROLLING_WINDOWS = (7, 30)
+
+WEEKDAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def category_breakdown(user, today):
+    """Activity count, current streak and completion totals per category in one grouped query"""
+    rows = Activity.objects.filter(user=user).values('category').annotate(
+        count=Count('id'),
+        total_streak=Sum(current_streak_expression(today)),
+        total_completions=Sum('completion_count'),
+    ).order_by('category')
+
+    labels = dict(Activity.CATEGORY_CHOICES)
+    breakdown = {}
+    for row in rows:
+        count = row['count']
+        breakdown[labels.get(row['category'], row['category'])] = {
+            'count': count,
+            'total_streak': row['total_streak'] or 0,
+            'total_completions': row['total_completions'] or 0,
+            'avg_streak': round((row['total_streak'] or 0) / count, 1),
+            'avg_completions': round((row['total_completions'] or 0) / count, 1),
+        }
+    return breakdown
+
+
+def completion_timeline(user, start_date, end_date):
+    """
+    Daily completions, active activities and completion rate with rolling averages.
+
+    Days without completions are filled in here; the rolling windows reach
+    back before start_date so the first days of the range are full averages.
+    """
+    history_start = start_date - timedelta(days=max(ROLLING_WINDOWS) - 1)
+
+    completions = dict(DailyUserRollup.objects.filter(
+        user=user,
+        date__gte=history_start,
+        date__lte=end_date,
+    ).values_list('date', 'completed_count'))
+
+    created = list(user.activities.annotate(
+        day=TruncDate('created_at')
+    ).values('day').annotate(created=Count('id')).order_by('day').values_list('day', 'created'))
+
+    # Activities that existed on each day, from the cumulative creation counts
+    active_before = sum(count for day, count in created if day < history_start)
+    created_on = {day: count for day, count in created if day >= history_start}
+
+    timeline = []
+    rates = []
+    active = active_before
+    current = history_start
+    while current <= end_date:
+        active += created_on.get(current, 0)
+        completed = completions.get(current, 0)
+        rate = min(100.0, completed / active * 100) if active else 0.0
+        rates.append(rate)
+
+        if current >= start_date:
+            point = {
+                'date': current.strftime('%Y-%m-%d'),
+                'completed': completed,
+                'active_activities': active,
+                'completion_rate': round(rate, 1),
+            }
+            for window in ROLLING_WINDOWS:
+                recent = rates[-window:]
+                point[f'rolling_{window}'] = round(sum(recent) / len(recent), 1)
+            timeline.append(point)
+
+        current += timedelta(days=1)
+
+    return timeline
+
+
+def weekday_completions(user, start_date, end_date):
+    """Completions per ISO weekday in the range, summed from the daily rollups in the database"""
+    counts = dict(DailyUserRollup.objects.filter(
+        user=user,
+        date__gte=start_date,
+        date__lte=end_date,
+    ).annotate(weekday=ExtractIsoWeekDay('date')).values('weekday').annotate(
+        completions=Sum('completed_count')
+    ).order_by().values_list('weekday', 'completions'))
+
+    return [
+        {'weekday': name, 'completions': counts.get(index, 0)}
+        for index, name in enumerate(WEEKDAY_NAMES, start=1)
+    ]
+
+
+def yearly_breakdown(user):
+    """Completions and longest run per year, composed from the monthly summaries of all activities"""
+    rows = ActivityMonthSummary.objects.filter(
+        activity__user=user
+    ).order_by('activity_id', 'month').values_list('activity_id', 'month', *SUMMARY_FIELDS)
+
+    years = {}
+    for activity_id, group in groupby(rows, key=lambda row: row[0]):
+        for year, totals in yearly_totals(row[1:] for row in group).items():
+            stats = years.setdefault(year, {'year': year, 'completions': 0, 'longest_run': 0})
+            stats['completions'] += totals['completions']
+            stats['longest_run'] = max(stats['longest_run'], totals['longest_run'])
+    return [years[year] for year in sorted(years)]
+
+
+def build_analytics(user, days, today):
+    """Assemble the analytics payload for the last `days` days up to today"""
+    start_date = today - timedelta(days=days - 1)
+
+    categories = category_breakdown(user, today)
+    total_activities = sum(stats['count'] for stats in categories.values())
+    total_completions = sum(stats['total_completions'] for stats in categories.values())
+    total_streak = sum(stats['total_streak'] for stats in categories.values())
+
+    timeline = completion_timeline(user, start_date, today)
+    range_completions = sum(point['completed'] for point in timeline)
+    range_rate = sum(point['completion_rate'] for point in timeline) / len(timeline)
+
+    return {
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': today.strftime('%Y-%m-%d'),
+        'total_activities': total_activities,
+        'total_completions': total_completions,
+        'average_streak': round(total_streak / total_activities, 1) if total_activities else 0,
+        'category_breakdown': categories,
+        'range_completions': range_completions,
+        'completion_rate': round(range_rate, 1),
+        'weekday_completions': weekday_completions(user, start_date, today),
+        'timeline': timeline,
+        'yearly': yearly_breakdown(user),
+    }
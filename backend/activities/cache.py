@@ -0,0 +1,102 @@
+"""
+Per-user response caching for the read-heavy endpoints.
+
+Every user has a generation counter in the shared cache that is bumped
+whenever one of their activities, entries or their profile changes (see
+activities.signals / users.signals). Cached responses and ETags are keyed by
+that generation and the user's local date, so a write invalidates all of the
+user's cached responses at once without tracking individual keys, and a
+client polling with If-None-Match gets a 304 after a single cache read.
+"""
+from functools import wraps
+import hashlib
+import logging
+import time
+
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from users.localtime import user_today
+from users.request_metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Generations outlive any cached response so an old value is never reused
+GENERATION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _generation_key(user_id):
+    return f'user_gen:{user_id}'
+
+
+def get_user_generation(user_id):
+    """Return the user's current cache generation, starting one if needed"""
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock so an evicted counter never repeats an old value
+        cache.add(key, time.time_ns(), GENERATION_TIMEOUT)
+        generation = cache.get(key, 0)
+    return generation
+
+
+def bump_user_generation(user_id):
+    """Invalidate every cached response of a user"""
+    key = _generation_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), GENERATION_TIMEOUT)
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against one strong ETag"""
+    tags = parse_etags(if_none_match)
+    return '*' in tags or etag in (tag.removeprefix('W/') for tag in tags)
+
+
+def cached_user_response(name):
+    """
+    Cache a view's response data per user, generation, date, layout and query string,
+    and answer conditional GETs from the same version with 304 Not Modified.
+    Only successful DRF responses are cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            user_id = request.user.pk
+            # The user's local date, so responses roll over at their midnight
+            version = f'{get_user_generation(user_id)}:{user_today(request.user).isoformat()}'
+            params = '&'.join(f'{key}={value}' for key, value in sorted(request.GET.items()))
+            # The negotiated renderer picks the layout when it comes from the Accept header
+            layout = getattr(request, 'accepted_renderer', None)
+            layout = layout.format if layout is not None else ''
+            digest = hashlib.sha1(f'{name}:{user_id}:{version}:{layout}:{params}'.encode()).hexdigest()
+            etag = f'"{digest}"'
+
+            if etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+                record_cache(True)
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+                response['ETag'] = etag
+                return response
+
+            key = f'response:{name}:{user_id}:{digest}'
+            data = cache.get(key)
+            record_cache(data is not None)
+            if data is not None:
+                response = Response(data)
+            else:
+                response = view(request, *args, **kwargs)
+                if not isinstance(response, Response) or response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data)
+
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            response['Vary'] = 'Accept, Authorization'
+            return response
+
+        return wrapper
+    return decorator
@@ -0,0 +1,169 @@
+"""
+Calendar payload builders for calendar_entries.
+
+The day-by-day layout repeats every activity for every day of the range. The
+compact layout sends activity metadata once, one completion bitset per
+activity (bit n of the little-endian bitset is day n of the range, base64
+encoded), per-day completion totals and only the notes that exist. It is
+built from the daily rollups rather than from the entries.
+
+The streaming variants read entries through a server-side cursor in date
+order and emit the day-by-day layout one day at a time, so memory stays flat
+regardless of the size of the range.
+"""
+import base64
+from datetime import timedelta
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import DailyUserRollup, StreakEntry
+from .rollups import completed_activities
+
+
+# Rows fetched per round trip when streaming
+STREAM_CHUNK_SIZE = 2000
+
+
+def calendar_entry_rows(user, start_date, end_date):
+    """(activity_id, date, completed, note) rows of a user's entries in a date range"""
+    return StreakEntry.objects.filter(
+        activity__user=user,
+        date__gte=start_date,
+        date__lte=end_date
+    ).values_list('activity_id', 'date', 'completed', 'note')
+
+
+def compact_calendar_rows(user, start_date, end_date):
+    """
+    (activity_id, date, completed, note) rows for the compact layout.
+
+    Completions are decoded from the daily rollups, one row per day instead
+    of one per entry; only entries with a note are read from StreakEntry, and
+    they are yielded as not completed so they only contribute the note.
+    """
+    activity_ids = list(user.activities.order_by('id').values_list('id', flat=True))
+    rollups = DailyUserRollup.objects.filter(
+        user=user,
+        date__gte=start_date,
+        date__lte=end_date,
+        completed_count__gt=0
+    ).values_list('date', 'completion_bitmap')
+
+    for date, bitmap in rollups:
+        for activity_id in completed_activities(bitmap, activity_ids):
+            yield activity_id, date, True, ''
+
+    notes = calendar_entry_rows(user, start_date, end_date).exclude(note='')
+    for activity_id, date, _, note in notes:
+        yield activity_id, date, False, note
+
+
+def iter_calendar_days(activities, rows, start_date, end_date):
+    """
+    Yield the day-by-day layout one day at a time.
+
+    activities are (id, title, color) tuples and rows must be ordered by date,
+    so only the current day's entries are held in memory.
+    """
+    total_activities = len(activities)
+    rows = iter(rows)
+    row = next(rows, None)
+
+    current_date = start_date
+    while current_date <= end_date:
+        day_entries = {}
+        while row is not None and row[1] <= current_date:
+            if row[1] == current_date:
+                day_entries[row[0]] = (row[2], row[3])
+            row = next(rows, None)
+
+        activities_data = []
+        total_completed = 0
+
+        for activity_id, title, color in activities:
+            completed, note = day_entries.get(activity_id, (False, ''))
+            if completed:
+                total_completed += 1
+
+            activities_data.append({
+                'id': activity_id,
+                'title': title,
+                'color': color,
+                'completed': completed,
+                'note': note
+            })
+
+        yield {
+            'date': current_date.strftime('%Y-%m-%d'),
+            'activities': activities_data,
+            'total_completed': total_completed,
+            'total_activities': total_activities
+        }
+
+        current_date += timedelta(days=1)
+
+
+def build_calendar_days(activities, rows, start_date, end_date):
+    """Day-by-day layout: one dict per day with every activity's status"""
+    activities = [(activity.id, activity.title, activity.color) for activity in activities]
+    return list(iter_calendar_days(activities, rows.order_by('date', 'activity_id'), start_date, end_date))
+
+
+def stream_calendar_days(user, start_date, end_date, ndjson=False):
+    """Encode the day-by-day layout incrementally as a JSON array or as NDJSON"""
+    activities = list(user.activities.values_list('id', 'title', 'color'))
+    rows = calendar_entry_rows(user, start_date, end_date).order_by('date', 'activity_id')
+    days = iter_calendar_days(activities, rows.iterator(chunk_size=STREAM_CHUNK_SIZE), start_date, end_date)
+    return encode_ndjson(days) if ndjson else encode_json_array(days)
+
+
+def encode_json_array(items):
+    """Encode an iterable as a JSON array one item at a time"""
+    yield '['
+    for index, item in enumerate(items):
+        yield (',' if index else '') + json.dumps(item, cls=DjangoJSONEncoder)
+    yield ']'
+
+
+def encode_ndjson(items):
+    """Encode an iterable as newline-delimited JSON"""
+    for item in items:
+        yield json.dumps(item, cls=DjangoJSONEncoder) + '\n'
+
+
+def build_compact_calendar(activities, rows, start_date, end_date):
+    """Columnar layout: activity metadata once, a completion bitset per activity, sparse notes"""
+    days = (end_date - start_date).days + 1
+    positions = {activity.id: index for index, activity in enumerate(activities)}
+    bitsets = [bytearray((days + 7) // 8) for _ in activities]
+    totals = [0] * days
+    notes = []
+
+    for activity_id, date, completed, note in rows:
+        index = positions.get(activity_id)
+        if index is None:
+            continue
+        offset = (date - start_date).days
+        if completed:
+            bitsets[index][offset >> 3] |= 1 << (offset & 7)
+            totals[offset] += 1
+        if note:
+            notes.append({'activity': activity_id, 'day': offset, 'note': note})
+
+    return {
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': end_date.strftime('%Y-%m-%d'),
+        'days': days,
+        'total_activities': len(activities),
+        'totals': totals,
+        'activities': [
+            {
+                'id': activity.id,
+                'title': activity.title,
+                'color': activity.color,
+                'completed': base64.b64encode(bitsets[index]).decode('ascii'),
+            }
+            for index, activity in enumerate(activities)
+        ],
+        'notes': notes,
+    }
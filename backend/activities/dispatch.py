@@ -0,0 +1,159 @@
+"""
+Reminder send ledger.
+
+Reminder runs go through ReminderDispatch rows keyed by (user, kind, local
+date). plan_dispatches() inserts a pending row for every due user and
+ignores rows that already exist, so planning a run twice never queues anyone
+twice. Workers claim batches of rows with SELECT ... FOR UPDATE SKIP LOCKED
+and put a lease on them, so several workers can split one run and the rows
+of a worker that died are claimed again once the lease expires. Eligibility
+is checked again when a batch is sent, and every row ends up sent, skipped
+(no longer due) or failed (claimed again until it has had MAX_ATTEMPTS).
+A crashed run resumes from the ledger with process_dispatches() alone,
+without rescanning users.
+
+Rows are marked as each mail chunk of their batch is delivered, so a worker
+dying mid-batch leaves only its unfinished chunks to be sent again once the
+lease expires.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+import os
+import socket
+import uuid
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from streakflow.metrics import REMINDER_BATCH_DURATION, REMINDERS
+from users.localtime import local_today
+from users.models import User
+
+from .mailer import chunked, deliver_messages
+from .models import ReminderDispatch
+from .reminders import due_reminders, is_due, reminder_candidates
+
+DISPATCH_LEASE = timedelta(minutes=10)
+CLAIM_BATCH_SIZE = 500
+PLAN_BATCH_SIZE = 1000
+MAX_ATTEMPTS = 3
+
+# The zone with the earliest date; rows for older dates are stale everywhere
+EARLIEST_ZONE = 'Etc/GMT+12'
+
+
+def plan_dispatches(kind, users, now=None):
+    """Queue a pending dispatch for every user in the queryset due a `kind` reminder; returns the number due"""
+    rows = (
+        ReminderDispatch(user_id=candidate.user.id, kind=kind, local_date=candidate.today)
+        for candidate in due_reminders(kind, users, now)
+    )
+    planned = 0
+    for chunk in chunked(rows, PLAN_BATCH_SIZE):
+        ReminderDispatch.objects.bulk_create(chunk, ignore_conflicts=True)
+        planned += len(chunk)
+    return planned
+
+
+def claimable(kind, now=None):
+    """Q of the `kind` dispatches a worker may claim: pending, with an expired lease, or failed with attempts left"""
+    lease_cutoff = (now or timezone.now()) - DISPATCH_LEASE
+    return Q(kind=kind, local_date__gte=local_today(EARLIEST_ZONE, now)) & (
+        Q(status=ReminderDispatch.STATUS_PENDING)
+        | Q(status=ReminderDispatch.STATUS_CLAIMED, claimed_at__lt=lease_cutoff)
+        | Q(status=ReminderDispatch.STATUS_FAILED, attempts__lt=MAX_ATTEMPTS)
+    )
+
+
+def claim_token():
+    """Identifies one claim by one worker"""
+    return f'{socket.gethostname()[:32]}-{os.getpid()}-{uuid.uuid4().hex[:12]}'
+
+
+def claim_dispatches(kind, batch_size=CLAIM_BATCH_SIZE, now=None):
+    """Claim up to batch_size `kind` dispatches for this worker; returns (claim token, dispatches)"""
+    token = claim_token()
+    condition = claimable(kind, now)
+    with transaction.atomic():
+        # Rows locked by another worker's claim are skipped rather than waited for
+        ids = list(
+            ReminderDispatch.objects.select_for_update(skip_locked=True).filter(condition).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return token, []
+        # Checked again, for databases without row locks
+        ReminderDispatch.objects.filter(condition, id__in=ids).update(
+            status=ReminderDispatch.STATUS_CLAIMED,
+            claimed_by=token,
+            claimed_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+    return token, list(ReminderDispatch.objects.filter(claimed_by=token, status=ReminderDispatch.STATUS_CLAIMED))
+
+
+def mark_dispatches(token, ids, status, **fields):
+    """Record the outcome of claimed dispatches that are still held by the claim"""
+    if ids:
+        ReminderDispatch.objects.filter(
+            id__in=ids,
+            claimed_by=token,
+            status=ReminderDispatch.STATUS_CLAIMED,
+        ).update(status=status, **fields)
+
+
+def send_dispatches(token, dispatches, build_message):
+    """
+    Send the reminders of claimed dispatches, checking they are still due on
+    their local date, and record each outcome as its mail chunk finishes;
+    returns a Counter of statuses.
+    """
+    by_date = defaultdict(list)
+    for dispatch in dispatches:
+        by_date[dispatch.local_date].append(dispatch)
+
+    messages = []
+    skipped = []
+    for date, group in by_date.items():
+        users = User.objects.filter(id__in=[dispatch.user_id for dispatch in group])
+        candidates = {candidate.user.id: candidate for candidate in reminder_candidates(users, today=date)}
+        for dispatch in group:
+            candidate = candidates.get(dispatch.user_id)
+            if candidate is None or not is_due(dispatch.kind, candidate):
+                skipped.append(dispatch.id)
+                continue
+            message = build_message(dispatch.kind, candidate)
+            message.dispatch_id = dispatch.id
+            messages.append(message)
+
+    mark_dispatches(token, skipped, ReminderDispatch.STATUS_SKIPPED)
+    counts = Counter({
+        ReminderDispatch.STATUS_SENT: 0,
+        ReminderDispatch.STATUS_SKIPPED: len(skipped),
+        ReminderDispatch.STATUS_FAILED: 0,
+    })
+
+    def record_chunk(sent, failed):
+        sent_ids = [message.dispatch_id for message in sent]
+        failed_ids = [message.dispatch_id for message in failed]
+        mark_dispatches(token, sent_ids, ReminderDispatch.STATUS_SENT, sent_at=timezone.now(), error='')
+        mark_dispatches(token, failed_ids, ReminderDispatch.STATUS_FAILED, error='Delivery failed after retries')
+        counts[ReminderDispatch.STATUS_SENT] += len(sent_ids)
+        counts[ReminderDispatch.STATUS_FAILED] += len(failed_ids)
+
+    deliver_messages(messages, on_chunk=record_chunk)
+    return counts
+
+
+def process_dispatches(kind, build_message, batch_size=CLAIM_BATCH_SIZE, now=None):
+    """Claim and send `kind` dispatches batch by batch until none are left; returns a Counter of statuses"""
+    counts = Counter()
+    while True:
+        token, dispatches = claim_dispatches(kind, batch_size, now)
+        if not dispatches:
+            return counts
+        with REMINDER_BATCH_DURATION.time(kind):
+            batch = send_dispatches(token, dispatches, build_message)
+        for status, count in batch.items():
+            REMINDERS.inc(kind, status, amount=count)
+        counts += batch
@@ -1,10 +1,11 @@
 import logging
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from django.utils import timezone
-from datetime import datetime, time
-from activities.models import Activity, StreakEntry
+from activities.email_templates import ReminderRenderer
+from activities.dispatch import plan_dispatches, process_dispatches
+from activities.reminders import is_due, reminder_candidates
+from activities.scheduling import DAILY, EVENING, MIDDAY, due_users
+from users.models import User
 
 logger = logging.getLogger(__name__)
 
@@ -12,40 +13,108 @@ class EmailReminderService:
     """Service for sending email reminders to users"""
     
     @staticmethod
-    def send_midday_reminder(user, force=False):
+    def user_candidate(user, today=None):
+        """One user's activities and incomplete activities for today, or None if they have no activities"""
+        return next(reminder_candidates(User.objects.filter(pk=user.pk), today=today), None)
+    
+    @staticmethod
+    def build_message(user, subject, plain_message, html_message=None):
+        message = EmailMultiAlternatives(
+            subject=subject,
+            body=plain_message,
+            from_email=settings.EMAIL_HOST_USER,
+            to=[user.email],
+        )
+        if html_message:
+            message.attach_alternative(html_message, 'text/html')
+        return message
+    
+    @staticmethod
+    def midday_message(user, activities, renderer=None):
+        """Midday reminder listing up to five of the user's activities"""
+        renderer = renderer or ReminderRenderer('midday_reminder')
+        plain_message, html_message = renderer.render({'user': user, 'activities': activities[:5]})
+        return EmailReminderService.build_message(user, 'Keep Your Streak Alive 🔥', plain_message, html_message)
+    
+    @staticmethod
+    def evening_message(user, incomplete_activities, renderer=None):
+        """Evening reminder listing the activities not completed today"""
+        renderer = renderer or ReminderRenderer('evening_reminder')
+        plain_message, html_message = renderer.render({'user': user, 'incomplete_activities': incomplete_activities})
+        return EmailReminderService.build_message(user, 'One Last Push for Today 🚀', plain_message, html_message)
+    
+    @staticmethod
+    def daily_message(user, today, incomplete_activities):
+        """Plain-text reminder sent at the user's reminder_time"""
+        subject = f"StreakFlow Reminder - {today.strftime('%B %d, %Y')}"
+        message = f"""
+            Hello {user.first_name or user.username},
+            
+            You have {len(incomplete_activities)} activities that haven't been completed today:
+            
+            """
+        for activity in incomplete_activities:
+            message += f"• {activity.title} (Current streak: {activity.current_streak} days)\n"
+        message += f"""
+            
+            Keep your streaks alive! Complete your activities today.
+            
+            Best regards,
+            StreakFlow Team
+            """
+        return EmailReminderService.build_message(user, subject, message)
+    
+    @staticmethod
+    def reminder_renderer(kind):
+        """Renderer shared by every `kind` reminder of a batch, None for the plain-text daily reminder"""
+        if kind == MIDDAY:
+            return ReminderRenderer('midday_reminder')
+        if kind == EVENING:
+            return ReminderRenderer('evening_reminder')
+        return None
+    
+    @staticmethod
+    def reminder_message(kind, candidate, renderer=None):
+        """The `kind` reminder for a due candidate"""
+        if kind == MIDDAY:
+            return EmailReminderService.midday_message(candidate.user, candidate.activities, renderer)
+        if kind == EVENING:
+            return EmailReminderService.evening_message(candidate.user, candidate.incomplete, renderer)
+        return EmailReminderService.daily_message(candidate.user, candidate.today, candidate.incomplete)
+    
+    @staticmethod
+    def resume_reminders(kind, now=None):
+        """Send the `kind` reminders left pending in the ledger by earlier runs; returns the number sent"""
+        # Templates and the shared parts of the message are prepared once for the whole run
+        renderer = EmailReminderService.reminder_renderer(kind)
+        counts = process_dispatches(
+            kind,
+            lambda kind, candidate: EmailReminderService.reminder_message(kind, candidate, renderer),
+            now=now,
+        )
+        logger.info(f"Reminder dispatches processed for {kind}: {dict(counts)}")
+        return counts['sent']
+    
+    @staticmethod
+    def deliver_reminders(kind, users, now=None):
+        """Queue the `kind` reminders of the due users in the queryset in the ledger and send them in batches"""
+        plan_dispatches(kind, users, now)
+        return EmailReminderService.resume_reminders(kind, now)
+    
+    @staticmethod
+    def send_midday_reminder(user, force=False, today=None):
         """Send midday reminder if user hasn't completed any activities today, or always if force=True"""
         try:
-            activities = Activity.objects.filter(user=user)
-            if not activities.exists():
+            # The user's own date, not the server's
+            candidate = EmailReminderService.user_candidate(user, today)
+            if candidate is None:
                 logger.info(f"No activities found for user {user.id}, skipping midday reminder")
                 if not force:
                     return False
-            today = timezone.now().date()
-            completed_today = StreakEntry.objects.filter(
-                activity__user=user,
-                date=today,
-                completed=True
-            ).exists()
-            if completed_today and not force:
+            elif not is_due(MIDDAY, candidate) and not force:
                 logger.info(f"User {user.id} has already completed activities today, skipping midday reminder")
                 return False
-            # Use all activities for the email context
-            user_activities = activities[:5]
-            context = {
-                'user': user,
-                'activities': user_activities,
-                'dashboard_url': f"{settings.FRONTEND_URL}/dashboard" if hasattr(settings, 'FRONTEND_URL') else "http://localhost:5173",
-            }
-            html_message = render_to_string('emails/midday_reminder.html', context)
-            plain_message = render_to_string('emails/midday_reminder.txt', context)
-            send_mail(
-                subject='Keep Your Streak Alive 🔥',
-                message=plain_message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
+            EmailReminderService.midday_message(user, candidate.activities if candidate else []).send()
             logger.info(f"Midday reminder sent to user {user.id} ({user.email}) [force={force}]")
             return True
         except Exception as e:
@@ -53,66 +122,53 @@ class EmailReminderService:
             return False
     
     @staticmethod
-    def send_evening_reminder(user, force=False):
+    def send_evening_reminder(user, force=False, today=None):
         """Send evening reminder if user has incomplete activities, or always if force=True"""
         try:
-            activities = Activity.objects.filter(user=user)
-            if not activities.exists():
+            # The user's own date, not the server's
+            candidate = EmailReminderService.user_candidate(user, today)
+            if candidate is None:
                 logger.info(f"No activities found for user {user.id}, skipping evening reminder")
                 if not force:
                     return False
-            today = timezone.now().date()
-            incomplete_activities = []
-            for activity in activities:
-                completed_today = StreakEntry.objects.filter(
-                    activity=activity,
-                    date=today,
-                    completed=True
-                ).exists()
-                if not completed_today:
-                    incomplete_activities.append(activity)
+            incomplete_activities = candidate.incomplete if candidate else []
             if not incomplete_activities and not force:
                 logger.info(f"User {user.id} has completed all activities today, skipping evening reminder")
                 return False
-            context = {
-                'user': user,
-                'incomplete_activities': incomplete_activities,
-                'dashboard_url': f"{settings.FRONTEND_URL}/dashboard" if hasattr(settings, 'FRONTEND_URL') else "http://localhost:5173",
-            }
-            html_message = render_to_string('emails/evening_reminder.html', context)
-            plain_message = render_to_string('emails/evening_reminder.txt', context)
-            send_mail(
-                subject='One Last Push for Today 🚀',
-                message=plain_message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
+            EmailReminderService.evening_message(user, incomplete_activities).send()
             logger.info(f"Evening reminder sent to user {user.id} ({user.email}) for {len(incomplete_activities)} incomplete activities [force={force}]")
             return True
         except Exception as e:
             logger.error(f"Error sending evening reminder to user {user.id}: {str(e)}")
             return False
-    
+
+    @staticmethod
+    def send_scheduled_reminders(now=None):
+        """Send the midday, evening and personal reminders due in the current scheduling slot"""
+        sent = {
+            kind: EmailReminderService.deliver_reminders(kind, due_users(kind, now), now)
+            for kind in (MIDDAY, EVENING, DAILY)
+        }
+        logger.info(f"Scheduled reminders sent: {sent}")
+        return sent
+
+    @staticmethod
+    def send_daily_reminders_to_all_users():
+        users = User.objects.filter(email_notifications=True, is_active=True)
+        sent_count = EmailReminderService.deliver_reminders(DAILY, users)
+        logger.info(f"Daily reminders sent to {sent_count} users")
+        return sent_count
+
     @staticmethod
     def send_midday_reminders_to_all_users():
-        from users.models import User
         users = User.objects.filter(is_active=True)
-        sent_count = 0
-        for user in users:
-            if EmailReminderService.send_midday_reminder(user):
-                sent_count += 1
+        sent_count = EmailReminderService.deliver_reminders(MIDDAY, users)
         logger.info(f"Midday reminders sent to {sent_count} users")
         return sent_count
     
     @staticmethod
     def send_evening_reminders_to_all_users():
-        from users.models import User
         users = User.objects.filter(is_active=True)
-        sent_count = 0
-        for user in users:
-            if EmailReminderService.send_evening_reminder(user):
-                sent_count += 1
+        sent_count = EmailReminderService.deliver_reminders(EVENING, users)
         logger.info(f"Evening reminders sent to {sent_count} users")
-        return sent_count 
\ No newline at end of file
+        return sent_count
@@ -0,0 +1,43 @@
+"""
+Reminder email rendering.
+
+Each reminder template is split in two: a layout (styles, header, footer,
+call to action) that is the same for every recipient, with a {{ body }}
+placeholder, and a small *_body template with the greeting and activity
+list. A ReminderRenderer fetches the template objects once, renders the
+layouts once with the shared context (the dashboard URL) and keeps the text
+on both sides of the placeholder, so rendering a message only renders the
+body templates. Template files are parsed once per process by the cached
+loader (see TEMPLATES in settings).
+"""
+from django.conf import settings
+from django.template.loader import get_template
+
+BODY_MARKER = '__reminder_body__'
+
+FORMATS = ('txt', 'html')
+
+
+def dashboard_url():
+    return f"{settings.FRONTEND_URL}/dashboard" if hasattr(settings, 'FRONTEND_URL') else "http://localhost:5173"
+
+
+class ReminderRenderer:
+    """Renders one reminder template for many recipients, with the shared parts rendered once"""
+
+    def __init__(self, name):
+        self.shared_context = {'dashboard_url': dashboard_url()}
+        self.parts = {}
+        for extension in FORMATS:
+            layout = get_template(f'emails/{name}.{extension}').render({**self.shared_context, 'body': BODY_MARKER})
+            before, after = layout.split(BODY_MARKER)
+            self.parts[extension] = (before, get_template(f'emails/{name}_body.{extension}'), after)
+
+    def render(self, context):
+        """(plain text, html) of the message for one recipient's context"""
+        context = {**self.shared_context, **context}
+        rendered = []
+        for extension in FORMATS:
+            before, body, after = self.parts[extension]
+            rendered.append(before + body.render(context) + after)
+        return tuple(rendered)
@@ -0,0 +1,168 @@
+"""
+Set-based write paths for streak entries.
+
+StreakEntry.save() looks the row up before writing and fires the signals
+that maintain the stored streak state one entry at a time. The functions here
+write with single upsert statements instead, so they bring the monthly
+summaries, streak state, daily rollups and the owner's cache generation up to
+date themselves. record_entry_write() does that for a write to one entry.
+"""
+from django.db import connection, transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from .cache import bump_user_generation
+from .models import Activity, StreakEntry
+from .rollups import RollupDay, apply_rollup_change, entry_rollup_annotations, refresh_daily_rollups
+from .streaks import STREAK_STATE_FIELDS, StreakState, advance_streak_state, recompute_streak_states
+from .summaries import refresh_month_summaries
+
+ROLLUP_READ_FIELDS = ('rollup_position', 'rollup_activity_count') + tuple(f'rollup_{field}' for field in RollupDay._fields)
+
+# Inserts today's entry as completed, or flips an existing one, in one statement.
+# A non-empty note replaces the stored one; xmax is 0 only on a freshly inserted row.
+TOGGLE_ENTRY_SQL = f"""
+    INSERT INTO {StreakEntry._meta.db_table} (date, activity_id, completed, note, created_at, updated_at)
+    VALUES (%s, %s, TRUE, %s, %s, %s)
+    ON CONFLICT (date, activity_id) DO UPDATE SET
+        completed = NOT {StreakEntry._meta.db_table}.completed,
+        note = CASE WHEN EXCLUDED.note <> '' THEN EXCLUDED.note ELSE {StreakEntry._meta.db_table}.note END,
+        updated_at = EXCLUDED.updated_at
+    RETURNING id, completed, xmax = 0
+"""
+
+DELETE_ACTIVITY_ENTRIES_SQL = f"DELETE FROM {StreakEntry._meta.db_table} WHERE activity_id = %s"
+
+
+def bulk_upsert_entries(user_id, items):
+    """
+    Insert or update many entries of one user's activities.
+
+    items are dicts with activity (id), date, completed and an optional note;
+    ownership must already be checked. When an (activity, date) pair occurs
+    more than once the last item wins. Entries sent without a note keep their
+    stored note. Returns the number of entries written and the new streak
+    state of every touched activity.
+    """
+    latest = {}
+    for item in items:
+        latest[(item['activity'], item['date'])] = item
+
+    now = timezone.now()
+    with_note = []
+    without_note = []
+    for (activity_id, date), item in latest.items():
+        entry = StreakEntry(
+            activity_id=activity_id,
+            date=date,
+            completed=item['completed'],
+            note=item.get('note') or '',
+            created_at=now,
+            updated_at=now,
+        )
+        (with_note if 'note' in item else without_note).append(entry)
+
+    with transaction.atomic():
+        for entries, update_fields in (
+            (with_note, ['completed', 'note', 'updated_at']),
+            (without_note, ['completed', 'updated_at']),
+        ):
+            if entries:
+                StreakEntry.objects.bulk_create(
+                    entries,
+                    update_conflicts=True,
+                    unique_fields=['date', 'activity'],
+                    update_fields=update_fields,
+                )
+        refresh_month_summaries(latest)
+        states = recompute_streak_states({activity_id for activity_id, _ in latest})
+        refresh_daily_rollups(user_id, {date for _, date in latest})
+
+    bump_user_generation(user_id)
+    return len(latest), states
+
+
+def delete_activity_entries(activity_id):
+    """
+    Delete all entries of an activity with one statement.
+
+    The cascade from deleting the activity would load every entry and delete
+    them 100 ids at a time for the entry signals, which ignore that cascade
+    anyway. Call inside the transaction that deletes the activity.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(DELETE_ACTIVITY_ENTRIES_SQL, [activity_id])
+
+
+def record_entry_write(activity_id, date, completed, added=0, completion_changed=True):
+    """
+    Bring the derived state in step with a write to one entry.
+
+    The activity's row is locked first, by the same query that reads its
+    streak state and the owner's rollup of the date, so concurrent writes to
+    its entries recount the month summary one after another. completed is the
+    entry's new state (False once deleted), added is 1 for a new entry and -1
+    for a deleted one. Returns the new streak state, or None when the
+    activity is being deleted.
+    """
+    # No savepoint when nested: the caller's transaction is rolled back on any error anyway
+    with transaction.atomic(savepoint=False):
+        row = Activity.objects.select_for_update().filter(pk=activity_id).annotate(
+            **entry_rollup_annotations(date)
+        ).values_list('user_id', *STREAK_STATE_FIELDS, *ROLLUP_READ_FIELDS).first()
+        if row is None:
+            return None
+
+        user_id = row[0]
+        state = StreakState(*row[1:5])
+        position, activity_count = row[5:7]
+        day = RollupDay(*row[7:]) if row[7] is not None else None
+
+        if completion_changed:
+            refresh_month_summaries([(activity_id, date)])
+            state = advance_streak_state(activity_id, date, completed, state)
+        apply_rollup_change(user_id, date, position, activity_count, day, completed, added)
+    return state
+
+
+def _toggle_entry_fallback(activity_id, date, note, now):
+    """Toggle with a conditional UPDATE, inserting when there was nothing to update"""
+    entries = StreakEntry.objects.filter(activity_id=activity_id, date=date)
+    changes = {
+        'completed': Case(When(completed=True, then=Value(False)), default=Value(True)),
+        'updated_at': now,
+    }
+    if note:
+        changes['note'] = note
+
+    if entries.update(**changes):
+        return *entries.values_list('id', 'completed').get(), False
+
+    entry = StreakEntry(activity_id=activity_id, date=date, completed=True, note=note, created_at=now, updated_at=now)
+    StreakEntry.objects.bulk_create([entry])
+    return entry.pk, True, True
+
+
+def toggle_entry(activity, date, note=''):
+    """
+    Atomically flip the completion of an activity's entry for a date.
+
+    A missing entry is created as completed. On PostgreSQL this is a single
+    INSERT ... ON CONFLICT DO UPDATE ... RETURNING; other databases run a
+    conditional UPDATE and an INSERT inside one transaction. The activity's
+    streak state fields are updated in place. Returns (entry_id, completed).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(TOGGLE_ENTRY_SQL, [date, activity.id, note, now, now])
+                entry_id, completed, inserted = cursor.fetchone()
+        else:
+            entry_id, completed, inserted = _toggle_entry_fallback(activity.id, date, note, now)
+
+        state = record_entry_write(activity.id, date, completed, added=int(inserted))
+
+    activity.streak_run, activity.streak_best, activity.last_completed_date, activity.completion_count = state
+    bump_user_generation(activity.user_id)
+    return entry_id, completed
@@ -2,7 +2,10 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
+from django.http import HttpResponse
 from django.utils import timezone
+from streakflow.metrics import CONTENT_TYPE, REGISTRY, metrics_setting
+import hmac
 import logging
 
 logger = logging.getLogger(__name__)
@@ -102,3 +105,18 @@ def test_auth(request):
         'is_authenticated': request.user.is_authenticated if hasattr(request, 'user') else False,
         'message': 'Authentication test information'
     }, status=status.HTTP_200_OK)
+
+
+def metrics(request):
+    """
+    Prometheus metrics of every worker process, for scrapers sending
+    `Authorization: Bearer <METRICS_TOKEN>`, or for staff when no token is configured
+    """
+    token = metrics_setting('TOKEN', '')
+    if token:
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+            return HttpResponse('Invalid or missing metrics token', status=401, content_type='text/plain')
+    elif not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponse('Staff only', status=403, content_type='text/plain')
+    return HttpResponse(REGISTRY.exposition(), content_type=CONTENT_TYPE)
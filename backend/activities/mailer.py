@@ -0,0 +1,158 @@
+"""
+Bulk reminder delivery.
+
+deliver() takes an iterable of ready-built EmailMessages and sends them in
+chunks of REMINDER_EMAIL['BATCH_SIZE'], each chunk in one send_messages()
+call over a single connection from get_connection(), across a bounded thread
+pool. Only a few chunks are queued ahead of the workers, so the messages can
+come from a generator over a server-side cursor without holding every message
+in memory. A shared rate limiter spaces sends across the workers. When a
+message fails, the rest of its chunk is sent again on a reopened connection
+after an exponential backoff, and the message itself is given up after
+REMINDER_EMAIL['RETRIES'] retries without failing the rest of its chunk. Callers that record outcomes pass on_chunk, which is called as
+each chunk finishes rather than once the whole run is done.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from itertools import islice
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 100,
+    'WORKERS': 8,
+    'RATE_PER_SECOND': 100,
+    'RETRIES': 3,
+    'RETRY_BACKOFF': 1.0,
+}
+
+
+def mail_setting(name):
+    return getattr(settings, 'REMINDER_EMAIL', {}).get(name, DEFAULTS[name])
+
+
+class RateLimiter:
+    """Spaces calls to wait() from any number of threads to at most `rate` per second"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def paced(messages, limiter, position):
+    """Yield messages as the limiter allows, keeping the index of the one being sent in position[0]"""
+    for index, message in enumerate(messages):
+        position[0] = index
+        limiter.wait()
+        yield message
+
+
+def send_chunk(messages, limiter, retries, backoff):
+    """
+    Send messages over one connection in a single send_messages() call; returns (number sent, failed messages).
+
+    Backends send in order and stop at the first error, so the messages
+    before the failing one are done. The rest of the chunk goes out in the
+    next call, with the failing message dropped once it has had retries + 1
+    attempts.
+    """
+    sent = 0
+    failed = []
+    attempts = 0
+    remaining = list(messages)
+    connection = get_connection()
+    try:
+        while remaining:
+            position = [0]
+            try:
+                connection.open()
+                sent += connection.send_messages(paced(remaining, limiter, position))
+                break
+            except Exception as e:
+                # The connection may be unusable after an error, reopen it for the next attempt
+                connection.close()
+                if position[0]:
+                    sent += position[0]
+                    remaining = remaining[position[0]:]
+                    attempts = 0
+                attempts += 1
+                if attempts > retries:
+                    message = remaining.pop(0)
+                    failed.append(message)
+                    attempts = 0
+                    logger.error(f"Giving up on reminder to {', '.join(message.to)} after {retries + 1} attempts: {str(e)}")
+                else:
+                    time.sleep(backoff * 2 ** (attempts - 1))
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def deliver_messages(messages, batch_size=None, workers=None, rate=None, retries=None, backoff=None, on_chunk=None):
+    """
+    Send messages in chunks over a bounded thread pool; returns (number sent, messages that failed every attempt).
+
+    on_chunk(sent messages, failed messages) is called from the calling thread as each chunk finishes.
+    """
+    batch_size = batch_size or mail_setting('BATCH_SIZE')
+    workers = workers or mail_setting('WORKERS')
+    limiter = RateLimiter(mail_setting('RATE_PER_SECOND') if rate is None else rate)
+    retries = mail_setting('RETRIES') if retries is None else retries
+    backoff = mail_setting('RETRY_BACKOFF') if backoff is None else backoff
+
+    sent = 0
+    failed = []
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reminder-mail') as pool:
+        # Chunk of every future still to be collected
+        pending = {}
+        for chunk in chunked(messages, batch_size):
+            # Keep at most two chunks per worker in flight
+            if len(pending) >= workers * 2:
+                wait(pending, return_when=FIRST_COMPLETED)
+            for future in [future for future in pending if future.done()]:
+                sent += collect(future, pending.pop(future), failed, on_chunk)
+            pending[pool.submit(send_chunk, chunk, limiter, retries, backoff)] = chunk
+        for future in as_completed(pending):
+            sent += collect(future, pending[future], failed, on_chunk)
+
+    logger.info(f"Delivered {sent} reminder emails in {time.monotonic() - started:.1f}s, {len(failed)} failed")
+    return sent, failed
+
+
+def collect(future, chunk, failed, on_chunk=None):
+    """Number sent by a finished chunk, adding its failed messages to failed and passing the outcome to on_chunk"""
+    chunk_sent, chunk_failed = future.result()
+    failed.extend(chunk_failed)
+    if on_chunk is not None:
+        failed_ids = {id(message) for message in chunk_failed}
+        on_chunk([message for message in chunk if id(message) not in failed_ids], chunk_failed)
+    return chunk_sent
+
+
+def deliver(messages, **options):
+    """Send messages in chunks over a bounded thread pool; returns the number sent"""
+    return deliver_messages(messages, **options)[0]
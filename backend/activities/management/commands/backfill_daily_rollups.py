@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from activities.cache import bump_user_generation
+from activities.models import Activity, DailyUserRollup, StreakEntry
+from activities.rollups import activity_positions, build_rollup_rows, rebuild_user_rollups
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily completion rollups of users from their streak entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only compare the stored rollups against a recount, without writing',
+        )
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            help='Only process this user',
+        )
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+
+        user_ids = Activity.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+        if options['user_id']:
+            user_ids = user_ids.filter(user_id=options['user_id'])
+
+        processed = 0
+        mismatched = 0
+        rows_written = 0
+
+        for user_id in user_ids.iterator():
+            processed += 1
+            if check_only:
+                if not self.matches(user_id):
+                    mismatched += 1
+                    self.stdout.write(self.style.WARNING(f'User {user_id}: daily rollups differ from a recount'))
+            else:
+                rows_written += rebuild_user_rollups(user_id)
+                bump_user_generation(user_id)
+
+        if check_only:
+            if mismatched:
+                raise CommandError(f'{mismatched} of {processed} users have stale daily rollups')
+            self.stdout.write(
+                self.style.SUCCESS(f'Daily rollups of all {processed} users match a recount.')
+            )
+        else:
+            logger.info(f"Rebuilt {rows_written} daily rollups for {processed} users")
+            self.stdout.write(
+                self.style.SUCCESS(f'Rebuilt {rows_written} daily rollups for {processed} users.')
+            )
+
+    def matches(self, user_id):
+        """Compare a user's stored rollups with a recount of their entries"""
+        rows = StreakEntry.objects.filter(
+            activity__user_id=user_id
+        ).order_by('date').values_list('date', 'activity_id', 'completed')
+        expected = list(build_rollup_rows(activity_positions(user_id), rows.iterator()))
+
+        stored = [
+            (date, completed_count, active_count, bytes(bitmap))
+            for date, completed_count, active_count, bitmap in DailyUserRollup.objects.filter(
+                user_id=user_id
+            ).order_by('date').values_list('date', 'completed_count', 'active_activity_count', 'completion_bitmap')
+        ]
+        return stored == expected
@@ -0,0 +1,240 @@
+from contextlib import ExitStack
+from datetime import timedelta
+import json
+import logging
+import subprocess
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from activities.cache import bump_user_generation
+from activities.models import StreakEntry
+from users.localtime import user_today
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+
+def endpoints(today):
+    """{name: path} of the benchmarked GET endpoints"""
+    return {
+        'activity_list': '/api/activities/',
+        'entry_list': '/api/activities/entries/',
+        'dashboard_stats': '/api/activities/dashboard/',
+        'calendar_entries_month': f'/api/activities/calendar/?start_date={today - timedelta(days=34)}&end_date={today}',
+        'calendar_entries_year': f'/api/activities/calendar/?start_date={today - timedelta(days=364)}&end_date={today}',
+        'analytics_30d': '/api/activities/analytics/?range=30d',
+        'analytics_365d': '/api/activities/analytics/?range=365d',
+        'user_stats': '/api/users/stats/',
+        'user_profile_stats': '/api/users/profile/stats/',
+    }
+
+
+def percentile(values, fraction):
+    """Linearly interpolated percentile of a non-empty list"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class QueryCounter:
+    """connection.execute_wrapper hook counting queries, which works without DEBUG"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Time the read endpoints of the API for one user through the test client and write JSON to compare between commits'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            help='User to request as (default: the first generate_synthetic_data user)',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Timed requests per endpoint',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=2,
+            help='Untimed requests per endpoint before the timed ones',
+        )
+        parser.add_argument(
+            '--cache',
+            choices=['cold', 'warm'],
+            default='cold',
+            help='Invalidate the user\'s cached responses before every request (cold) or let them be served from cache (warm)',
+        )
+        parser.add_argument(
+            '--endpoint',
+            action='append',
+            help='Only benchmark this endpoint; may be repeated',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results as JSON to this file',
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON written by an earlier run to print the changes against',
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        user = self.get_user(options['username'])
+        paths = endpoints(user_today(user))
+        names = options['endpoint'] or list(paths)
+        unknown = set(names) - set(paths)
+        if unknown:
+            raise CommandError(f"Unknown endpoints {', '.join(sorted(unknown))}; choose from {', '.join(paths)}")
+
+        client = APIClient()
+        # Authentication is stubbed out: requests run as the user without a Clerk token
+        client.force_authenticate(user)
+
+        results = {}
+        previous_level = logging.root.manager.disable
+        if options['verbosity'] < 2:
+            # Views log a line per request, which would drown the report
+            logging.disable(logging.INFO)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS]):
+                for name in names:
+                    results[name] = self.measure(client, user, paths[name], options)
+                    self.report(name, results[name])
+        finally:
+            logging.disable(previous_level)
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'commit': self.git_commit(),
+            'database': connections['default'].vendor,
+            'user': {
+                'username': user.username,
+                'activities': user.activities.count(),
+                'entries': StreakEntry.objects.filter(activity__user=user).count(),
+            },
+            'iterations': options['iterations'],
+            'warmup': options['warmup'],
+            'cache': options['cache'],
+            'endpoints': results,
+        }
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.filter(username__startswith='synthetic').order_by('id').first()
+        if user is None:
+            raise CommandError('No user to benchmark; run generate_synthetic_data or pass --username')
+        return user
+
+    def request(self, client, user, path, cache):
+        """GET path; returns (response, seconds, queries)"""
+        if cache == 'cold':
+            bump_user_generation(user.id)
+        counter = QueryCounter()
+        with self.wrapped(counter):
+            started = time.perf_counter()
+            response = client.get(path)
+            elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise CommandError(f'GET {path} returned {response.status_code}')
+        return response, elapsed, counter.count
+
+    def wrapped(self, counter):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        return stack
+
+    def measure(self, client, user, path, options):
+        for _ in range(options['warmup']):
+            self.request(client, user, path, options['cache'])
+
+        timings = []
+        queries = 0
+        response = None
+        for _ in range(options['iterations']):
+            response, elapsed, count = self.request(client, user, path, options['cache'])
+            timings.append(elapsed * 1000)
+            queries = max(queries, count)
+
+        # A separate request for memory, since tracing slows everything down
+        tracemalloc.start()
+        try:
+            self.request(client, user, path, options['cache'])
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'path': path,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'mean_ms': round(sum(timings) / len(timings), 2),
+            'min_ms': round(min(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': queries,
+            'peak_memory_kib': round(peak / 1024, 1),
+            'response_bytes': len(response.content),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:>24}: p50 {result["p50_ms"]:8.2f}ms  p95 {result["p95_ms"]:8.2f}ms  '
+            f'{result["queries"]:3d} queries  {result["peak_memory_kib"]:9.1f} KiB peak  {result["response_bytes"]} bytes'
+        )
+
+    def compare(self, path, results):
+        """Print the p50, query and memory changes against an earlier run"""
+        with open(path) as handle:
+            baseline = json.load(handle)
+        self.stdout.write(f'Compared with {path} (commit {baseline.get("commit") or "unknown"}):')
+        for name, result in results.items():
+            before = baseline.get('endpoints', {}).get(name)
+            if before is None:
+                self.stdout.write(f'{name:>24}: not in the baseline')
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0.0
+            line = (
+                f'{name:>24}: p50 {change:+6.1f}%  queries {result["queries"] - before["queries"]:+d}  '
+                f'peak memory {result["peak_memory_kib"] - before["peak_memory_kib"]:+.1f} KiB'
+            )
+            style = self.style.WARNING if change > 10 or result['queries'] > before['queries'] else self.style.SUCCESS
+            self.stdout.write(style(line))
+
+    def git_commit(self):
+        try:
+            completed = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5,
+            )
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return completed.stdout.strip() or None
@@ -0,0 +1,105 @@
+from datetime import timedelta
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils import timezone
+from activities.email_service import EmailReminderService
+from activities.email_templates import ReminderRenderer, dashboard_url
+from activities.models import Activity
+from users.models import User
+import logging
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES = {
+    'midday': ('midday_reminder', 'activities'),
+    'evening': ('evening_reminder', 'incomplete_activities'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure reminder email rendering throughput with in-memory recipients (nothing is saved or sent)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipients',
+            type=int,
+            default=10000,
+            help='Number of recipients to render for',
+        )
+        parser.add_argument(
+            '--activities',
+            type=int,
+            default=5,
+            help='Activities listed per recipient',
+        )
+        parser.add_argument(
+            '--type',
+            choices=list(TEMPLATES),
+            default='evening',
+            help='Reminder template to render',
+        )
+
+    def handle(self, *args, **options):
+        count = options['recipients']
+        name, list_name = TEMPLATES[options['type']]
+        recipients = self.build_recipients(count, options['activities'])
+
+        # Every recipient renders both full templates
+        def per_recipient(user, activities):
+            context = {'user': user, list_name: activities, 'dashboard_url': dashboard_url()}
+            for extension in ('txt', 'html'):
+                body = render_to_string(f'emails/{name}_body.{extension}', context)
+                render_to_string(f'emails/{name}.{extension}', {**context, 'body': body})
+
+        # Shared parts rendered once per batch, only the bodies per recipient
+        renderer = ReminderRenderer(name)
+
+        def batched(user, activities):
+            renderer.render({'user': user, list_name: activities})
+
+        # The full message as the reminder pipeline builds it
+        def messages(user, activities):
+            if options['type'] == 'midday':
+                EmailReminderService.midday_message(user, activities, renderer)
+            else:
+                EmailReminderService.evening_message(user, activities, renderer)
+
+        self.stdout.write(f'Rendering {options["type"]} reminders for {count} recipients with {options["activities"]} activities each')
+        baseline = None
+        for label, render in (('per recipient', per_recipient), ('batched', batched), ('batched + message', messages)):
+            elapsed = self.measure(render, recipients)
+            per_10k = elapsed / count * 10000
+            baseline = baseline or per_10k
+            self.stdout.write(
+                f'{label:>18}: {per_10k:7.2f}s per 10k recipients, '
+                f'{count / elapsed:8.0f} recipients/s ({baseline / per_10k:.1f}x)'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def build_recipients(self, count, activity_count):
+        """Unsaved users and activities shaped like the reminder query's results"""
+        today = timezone.now().date()
+        recipients = []
+        for index in range(count):
+            user = User(id=index + 1, username=f'bench{index}', first_name=f'Bench {index}', email=f'bench{index}@example.com')
+            activities = [
+                Activity(
+                    id=index * activity_count + number + 1,
+                    user=user,
+                    title=f'Habit {number} & more',
+                    streak_run=number,
+                    last_completed_date=today - timedelta(days=number % 2),
+                )
+                for number in range(activity_count)
+            ]
+            recipients.append((user, activities))
+        return recipients
+
+    def measure(self, render, recipients):
+        started = time.perf_counter()
+        for user, activities in recipients:
+            render(user, activities)
+        return time.perf_counter() - started
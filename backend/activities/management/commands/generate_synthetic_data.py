@@ -0,0 +1,225 @@
+from datetime import datetime, time, timedelta
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from activities.cache import bump_user_generation
+from activities.mailer import chunked
+from activities.models import Activity, ActivityMonthSummary, StreakEntry
+from activities.rollups import rebuild_user_rollups
+from activities.streaks import compute_streak_state
+from activities.summaries import summarize_dates
+from users.localtime import local_today
+from users.models import User
+import logging
+
+logger = logging.getLogger(__name__)
+
+PATTERNS = ('random', 'streaky', 'weekdays', 'mixed')
+
+ZONES = ('UTC', 'America/New_York', 'Europe/Berlin', 'Asia/Kolkata', 'Asia/Tokyo', 'America/Los_Angeles', 'Australia/Sydney')
+
+TITLES = ('Morning run', 'Read 20 pages', 'Meditate', 'Practice guitar', 'Journal', 'Stretch', 'Learn Spanish', 'Drink water', 'Code kata', 'Call a friend')
+
+
+class Command(BaseCommand):
+    help = 'Create synthetic users, activities and years of streak entries for benchmarking (never run against production)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=10,
+            help='Number of users to create',
+        )
+        parser.add_argument(
+            '--activities',
+            type=int,
+            default=5,
+            help='Activities per user',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=730,
+            help='Days of history up to today; each activity starts somewhere in the first half',
+        )
+        parser.add_argument(
+            '--pattern',
+            choices=PATTERNS,
+            default='mixed',
+            help='Completion pattern: independent days, runs, mostly weekdays, or a random pick per activity',
+        )
+        parser.add_argument(
+            '--completion-rate',
+            type=float,
+            default=0.7,
+            help='Share of days completed',
+        )
+        parser.add_argument(
+            '--run-length',
+            type=float,
+            default=7.0,
+            help='Average run of completed days for the streaky pattern',
+        )
+        parser.add_argument(
+            '--incomplete-rate',
+            type=float,
+            default=0.2,
+            help='Share of the days not completed that still have an entry marked incomplete',
+        )
+        parser.add_argument(
+            '--note-rate',
+            type=float,
+            default=0.05,
+            help='Share of entries with a note',
+        )
+        parser.add_argument(
+            '--prefix',
+            default='synthetic',
+            help='Username prefix of the generated users',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Delete the users with this prefix (and everything they own) first',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed, so a dataset can be recreated exactly',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk insert',
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['completion_rate'] < 1:
+            raise CommandError('--completion-rate must be at least 0 and below 1')
+        if options['days'] < 1 or options['run_length'] < 1:
+            raise CommandError('--days and --run-length must be at least 1')
+
+        prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=prefix)
+        if options['clear']:
+            deleted = existing.count()
+            existing.delete()
+            self.stdout.write(f'Deleted {deleted} existing {prefix} users')
+        elif existing.exists():
+            raise CommandError(f'Users named {prefix}* already exist; use --clear or another --prefix')
+
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        totals = {'activities': 0, 'entries': 0}
+
+        for index in range(options['users']):
+            with transaction.atomic():
+                user, activities, entries = self.create_user(index)
+            # The bulk inserts skip the signals, so the cached responses are invalidated here
+            bump_user_generation(user.id)
+            totals['activities'] += activities
+            totals['entries'] += entries
+            if options['verbosity'] > 1:
+                self.stdout.write(f'User {index + 1}/{options["users"]}: {activities} activities, {entries} entries')
+
+        logger.info(f"Generated {options['users']} synthetic users with {totals['activities']} activities and {totals['entries']} entries")
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {options["users"]} users, {totals["activities"]} activities and {totals["entries"]} streak entries.'
+        ))
+
+    def create_user(self, index):
+        """Create one user with their activities, entries and derived streak state; returns (user, activities, entries)"""
+        prefix = self.options['prefix']
+        zone = ZONES[index % len(ZONES)]
+        user = User.objects.create(
+            username=f'{prefix}{index}',
+            clerk_id=f'{prefix}_{index}',
+            email=f'{prefix}{index}@example.com',
+            first_name=f'Synthetic {index}',
+            timezone=zone,
+            email_notifications=False,
+        )
+        today = local_today(zone)
+        days = self.options['days']
+
+        histories = []
+        for number in range(self.options['activities']):
+            start = today - timedelta(days=self.rng.randint(days // 2, days - 1))
+            histories.append((start, self.history(start, today)))
+
+        # The stored streak state is computed from the generated dates, as the entry signals would have
+        activities = []
+        for number, (_, days_done) in enumerate(histories):
+            state = compute_streak_state([date for date, completed in days_done if completed])
+            activities.append(Activity(
+                user=user,
+                title=TITLES[number % len(TITLES)] + (f' {number // len(TITLES) + 1}' if number >= len(TITLES) else ''),
+                category=self.rng.choice(Activity.CATEGORY_CHOICES)[0],
+                streak_run=state.run,
+                streak_best=state.best,
+                last_completed_date=state.last_date,
+                completion_count=state.total,
+            ))
+        Activity.objects.bulk_create(activities)
+        if histories:
+            first_day = min(start for start, _ in histories)
+            Activity.objects.filter(user=user).update(created_at=timezone.make_aware(datetime.combine(first_day, time())))
+
+        batch_size = self.options['batch_size']
+        summaries = [
+            ActivityMonthSummary(activity=activity, month=month, **fields)
+            for activity, (_, days_done) in zip(activities, histories)
+            for month, fields in summarize_dates(date for date, completed in days_done if completed)
+        ]
+        ActivityMonthSummary.objects.bulk_create(summaries, batch_size=batch_size)
+
+        # bulk_create skips the entry signals, so the rollups are rebuilt below
+        rows = (
+            StreakEntry(
+                activity=activity,
+                date=date,
+                completed=completed,
+                note='Felt good today' if self.rng.random() < self.options['note_rate'] else '',
+            )
+            for activity, (_, days_done) in zip(activities, histories)
+            for date, completed in days_done
+        )
+        created = 0
+        for chunk in chunked(rows, batch_size):
+            StreakEntry.objects.bulk_create(chunk)
+            created += len(chunk)
+        rebuild_user_rollups(user.id)
+        return user, len(activities), created
+
+    def history(self, start, today):
+        """[(date, completed)] of the days with an entry from start to today"""
+        pattern = self.options['pattern']
+        if pattern == 'mixed':
+            pattern = self.rng.choice(PATTERNS[:-1])
+
+        rate = self.options['completion_rate']
+        # Two-state chain whose runs average run_length days and whose long-run share completed is rate
+        stop = 1 / self.options['run_length']
+        resume = min(1.0, stop * rate / (1 - rate))
+        done = self.rng.random() < rate
+
+        days = []
+        date = start
+        while date <= today:
+            if pattern == 'streaky':
+                done = self.rng.random() >= stop if done else self.rng.random() < resume
+            elif pattern == 'weekdays':
+                done = self.rng.random() < (rate if date.weekday() < 5 else rate / 4)
+            else:
+                done = self.rng.random() < rate
+            if done:
+                days.append((date, True))
+            elif self.rng.random() < self.options['incomplete_rate']:
+                days.append((date, False))
+            date += timedelta(days=1)
+        return days
@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from activities.cache import bump_user_generation
+from activities.models import Activity, ActivityMonthSummary
+from activities.streaks import compute_streak_state, iter_completed_dates
+from activities.summaries import SUMMARY_FIELDS, compose_streak_state, summarize_dates
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly completion summaries of activities from their streak entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only compare the stored summaries and the streaks composed from them against a raw recompute',
+        )
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            help='Only process activities of this user',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of activities recomputed per query',
+        )
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+        batch_size = options['batch_size']
+
+        activity_ids = Activity.objects.order_by('id').values_list('id', flat=True)
+        if options['user_id']:
+            activity_ids = activity_ids.filter(user_id=options['user_id'])
+
+        checked = 0
+        mismatched = 0
+        batch = []
+
+        for activity_id in activity_ids.iterator(chunk_size=batch_size):
+            batch.append(activity_id)
+            if len(batch) >= batch_size:
+                mismatched += self.process_batch(batch, check_only)
+                checked += len(batch)
+                batch = []
+        if batch:
+            mismatched += self.process_batch(batch, check_only)
+            checked += len(batch)
+
+        if check_only:
+            if mismatched:
+                raise CommandError(f'{mismatched} of {checked} activities have stale monthly summaries')
+            self.stdout.write(
+                self.style.SUCCESS(f'Monthly summaries of all {checked} activities match a raw recompute.')
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'Rebuilt monthly summaries of {checked} activities ({mismatched} corrected).')
+            )
+
+    def process_batch(self, activity_ids, check_only):
+        """Recompute the summaries of a batch of activities with one query and fix or report drift"""
+        expected = {activity_id: [] for activity_id in activity_ids}
+        raw_states = {activity_id: compute_streak_state([]) for activity_id in activity_ids}
+        for activity_id, dates in iter_completed_dates(activity_ids):
+            expected[activity_id] = [
+                (month, *(fields[name] for name in SUMMARY_FIELDS))
+                for month, fields in summarize_dates(dates)
+            ]
+            raw_states[activity_id] = compute_streak_state(dates)
+
+        stored = {activity_id: [] for activity_id in activity_ids}
+        for activity_id, *row in ActivityMonthSummary.objects.filter(
+            activity_id__in=activity_ids
+        ).order_by('activity_id', 'month').values_list('activity_id', 'month', *SUMMARY_FIELDS):
+            stored[activity_id].append(tuple(row))
+
+        stale = []
+        for activity_id in activity_ids:
+            composed = compose_streak_state(stored[activity_id])
+            if stored[activity_id] == expected[activity_id] and composed == tuple(raw_states[activity_id]):
+                continue
+
+            stale.append(activity_id)
+            if check_only:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'Activity {activity_id}: summaries compose to {composed}, '
+                        f'raw entries give {tuple(raw_states[activity_id])}'
+                    )
+                )
+
+        if stale and not check_only:
+            with transaction.atomic():
+                ActivityMonthSummary.objects.filter(activity_id__in=stale).delete()
+                ActivityMonthSummary.objects.bulk_create([
+                    ActivityMonthSummary(activity_id=activity_id, month=month, **dict(zip(SUMMARY_FIELDS, fields)))
+                    for activity_id in stale
+                    for month, *fields in expected[activity_id]
+                ])
+            for user_id in Activity.objects.filter(id__in=stale).values_list('user_id', flat=True).distinct():
+                bump_user_generation(user_id)
+            logger.info(f"Corrected monthly summaries of {len(stale)} activities")
+
+        return len(stale)
@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand, CommandError
+from activities.cache import bump_user_generation
+from activities.models import Activity
+from activities.streaks import (
+    STREAK_STATE_FIELDS,
+    compute_streak_states,
+    get_streak_state,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored streak state of activities from their streak entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only compare the stored state against a full recompute, without writing',
+        )
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            help='Only process activities of this user',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of activities recomputed per query',
+        )
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+        batch_size = options['batch_size']
+
+        activities = Activity.objects.order_by('id').only('id', 'user_id', *STREAK_STATE_FIELDS)
+        if options['user_id']:
+            activities = activities.filter(user_id=options['user_id'])
+
+        checked = 0
+        mismatched = 0
+        batch = []
+
+        for activity in activities.iterator(chunk_size=batch_size):
+            batch.append(activity)
+            if len(batch) >= batch_size:
+                mismatched += self.process_batch(batch, check_only)
+                checked += len(batch)
+                batch = []
+        if batch:
+            mismatched += self.process_batch(batch, check_only)
+            checked += len(batch)
+
+        if check_only:
+            if mismatched:
+                raise CommandError(f'{mismatched} of {checked} activities have a stale streak state')
+            self.stdout.write(
+                self.style.SUCCESS(f'Streak state of all {checked} activities matches a full recompute.')
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'Rebuilt streak state of {checked} activities ({mismatched} corrected).')
+            )
+
+    def process_batch(self, activities, check_only):
+        """Recompute a batch of activities with one query and fix or report drift"""
+        recomputed = compute_streak_states([activity.id for activity in activities])
+
+        stale = []
+        for activity in activities:
+            expected = recomputed[activity.id]
+            stored = get_streak_state(activity)
+            if stored == expected:
+                continue
+
+            stale.append(activity)
+            if check_only:
+                self.stdout.write(
+                    self.style.WARNING(f'Activity {activity.id}: stored {tuple(stored)}, expected {tuple(expected)}')
+                )
+            else:
+                activity.streak_run = expected.run
+                activity.streak_best = expected.best
+                activity.last_completed_date = expected.last_date
+                activity.completion_count = expected.total
+
+        if stale and not check_only:
+            Activity.objects.bulk_update(stale, STREAK_STATE_FIELDS)
+            # bulk_update skips the signals, so the cached responses are invalidated here
+            for user_id in {activity.user_id for activity in stale}:
+                bump_user_generation(user_id)
+            logger.info(f"Corrected streak state of {len(stale)} activities")
+
+        return len(stale)
@@ -13,6 +13,11 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be sent without actually sending emails',
         )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Only send the evening reminders left pending by an interrupted run, without rescanning users',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
@@ -26,42 +31,30 @@ class Command(BaseCommand):
             if dry_run:
                 # In dry run mode, just show what would be sent
                 from users.models import User
-                from activities.models import Activity, StreakEntry
-                from django.utils import timezone
+                from activities.reminders import due_reminders
+                from activities.scheduling import EVENING
                 
                 users = User.objects.filter(is_active=True)
                 eligible_users = 0
                 
-                for user in users:
-                    activities = Activity.objects.filter(user=user)
-                    if not activities.exists():
-                        continue
-                    
-                    today = timezone.now().date()
-                    incomplete_activities = []
-                    
-                    for activity in activities:
-                        completed_today = StreakEntry.objects.filter(
-                            activity=activity,
-                            date=today,
-                            completed=True
-                        ).exists()
-                        
-                        if not completed_today:
-                            incomplete_activities.append(activity)
-                    
-                    if incomplete_activities:
-                        eligible_users += 1
-                        self.stdout.write(
-                            f"Would send evening reminder to: {user.email} ({user.first_name or user.username}) - {len(incomplete_activities)} incomplete activities"
-                        )
+                # The same eligibility query the sender uses
+                for candidate in due_reminders(EVENING, users):
+                    user = candidate.user
+                    titles = ', '.join(activity.title for activity in candidate.incomplete)
+                    eligible_users += 1
+                    self.stdout.write(
+                        f"Would send evening reminder to: {user.email} ({user.first_name or user.username}) - {len(candidate.incomplete)} incomplete activities: {titles}"
+                    )
                 
                 self.stdout.write(
                     self.style.SUCCESS(f'Dry run complete. Would send {eligible_users} evening reminders.')
                 )
             else:
                 # Actually send the reminders
-                sent_count = EmailReminderService.send_evening_reminders_to_all_users()
+                if options['resume']:
+                    sent_count = EmailReminderService.resume_reminders('evening')
+                else:
+                    sent_count = EmailReminderService.send_evening_reminders_to_all_users()
                 
                 self.stdout.write(
                     self.style.SUCCESS(f'Successfully sent {sent_count} evening reminders.')
@@ -34,6 +34,17 @@ $$;
 """
 
 
+def enable_rls(apps, schema_editor):
+    # Row level security only exists on PostgreSQL; the SQLite fallback has nothing to do
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(ENABLE_RLS_SQL)
+
+
+def disable_rls(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DISABLE_RLS_SQL)
+
+
 class Migration(migrations.Migration):
 
     dependencies = [
@@ -42,5 +53,5 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RunSQL(sql=ENABLE_RLS_SQL, reverse_sql=DISABLE_RLS_SQL),
+        migrations.RunPython(enable_rls, disable_rls),
     ]
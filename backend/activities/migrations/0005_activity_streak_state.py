@@ -0,0 +1,70 @@
+# Generated by Django 5.2.4 on 2026-10-17 11:18
+
+from itertools import groupby
+
+from django.db import migrations, models
+
+
+def walk_completed_dates(dates):
+    """Frozen copy of the streak walk: (run, best, last_date, total) of ascending dates"""
+    run = best = total = 0
+    last_date = None
+    for date in dates:
+        if last_date is not None and (date - last_date).days == 1:
+            run += 1
+        else:
+            run = 1
+        best = max(best, run)
+        total += 1
+        last_date = date
+    return run, best, last_date, total
+
+
+def backfill_streak_state(apps, schema_editor):
+    Activity = apps.get_model("activities", "Activity")
+    StreakEntry = apps.get_model("activities", "StreakEntry")
+
+    rows = (
+        StreakEntry.objects.filter(completed=True)
+        .order_by("activity_id", "date")
+        .values_list("activity_id", "date")
+    )
+    for activity_id, group in groupby(rows.iterator(), key=lambda row: row[0]):
+        run, best, last_date, total = walk_completed_dates(date for _, date in group)
+        Activity.objects.filter(pk=activity_id).update(
+            streak_run=run,
+            streak_best=best,
+            last_completed_date=last_date,
+            completion_count=total,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("activities", "0004_enable_rls"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="completion_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="last_completed_date",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="streak_best",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="streak_run",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_streak_state, migrations.RunPython.noop),
+    ]
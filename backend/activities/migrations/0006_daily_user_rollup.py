@@ -0,0 +1,116 @@
+# Generated by Django 5.2.4 on 2026-10-17 11:31
+
+from itertools import groupby
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_rollup_rows(positions, rows):
+    """Frozen copy of the rollup count: (date, completed, active, bitmap) per day of (date, activity_id, completed) rows"""
+    size = (len(positions) + 7) // 8
+    for date, group in groupby(rows, key=lambda row: row[0]):
+        bitmap = bytearray(size)
+        completed_count = active_count = 0
+        for _, activity_id, completed in group:
+            position = positions.get(activity_id)
+            if position is None:
+                continue
+            active_count += 1
+            if completed:
+                completed_count += 1
+                bitmap[position >> 3] |= 1 << (position & 7)
+        if active_count:
+            yield date, completed_count, active_count, bytes(bitmap)
+
+
+def enable_rls(apps, schema_editor):
+    # Matches 0004_enable_rls for the new table
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "ALTER TABLE daily_user_rollups ENABLE ROW LEVEL SECURITY"
+        )
+
+
+def backfill_rollups(apps, schema_editor):
+    Activity = apps.get_model("activities", "Activity")
+    StreakEntry = apps.get_model("activities", "StreakEntry")
+    DailyUserRollup = apps.get_model("activities", "DailyUserRollup")
+
+    user_ids = Activity.objects.order_by().values_list("user_id", flat=True).distinct()
+    for user_id in user_ids.iterator():
+        activity_ids = (
+            Activity.objects.filter(user_id=user_id)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        positions = {
+            activity_id: position for position, activity_id in enumerate(activity_ids)
+        }
+        rows = (
+            StreakEntry.objects.filter(activity__user_id=user_id)
+            .order_by("date")
+            .values_list("date", "activity_id", "completed")
+        )
+        DailyUserRollup.objects.bulk_create(
+            [
+                DailyUserRollup(
+                    user_id=user_id,
+                    date=date,
+                    completed_count=completed_count,
+                    active_activity_count=active_count,
+                    completion_bitmap=bitmap,
+                )
+                for date, completed_count, active_count, bitmap in build_rollup_rows(
+                    positions, rows.iterator()
+                )
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("activities", "0005_activity_streak_state"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyUserRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("completed_count", models.PositiveIntegerField(default=0)),
+                ("active_activity_count", models.PositiveIntegerField(default=0)),
+                ("completion_bitmap", models.BinaryField(default=b"")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Daily User Rollup",
+                "verbose_name_plural": "Daily User Rollups",
+                "db_table": "daily_user_rollups",
+                "ordering": ["-date"],
+                "unique_together": {("user", "date")},
+            },
+        ),
+        migrations.RunPython(enable_rls, migrations.RunPython.noop),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.4 on 2026-10-17 11:35
+
+import django.db.models.deletion
+from itertools import groupby
+
+from django.db import migrations, models
+
+
+def summarize_dates(dates):
+    """Frozen copy of the month summary: (month, fields) for completed dates in ascending order"""
+    for month, group in groupby(dates, key=lambda date: date.replace(day=1)):
+        completions = longest = leading = run = 0
+        last_date = None
+        for date in group:
+            if last_date is not None and (date - last_date).days == 1:
+                run += 1
+            else:
+                run = 1
+            if date.day == run:
+                # The run started on the 1st
+                leading = run
+            longest = max(longest, run)
+            completions += 1
+            last_date = date
+        yield month, {
+            "completions": completions,
+            "longest_run": longest,
+            "leading_run": leading,
+            "last_run": run,
+            "last_completed_date": last_date,
+        }
+
+
+def enable_rls(apps, schema_editor):
+    # Matches 0004_enable_rls for the new table
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "ALTER TABLE activity_month_summaries ENABLE ROW LEVEL SECURITY"
+        )
+
+
+def backfill_month_summaries(apps, schema_editor):
+    StreakEntry = apps.get_model("activities", "StreakEntry")
+    ActivityMonthSummary = apps.get_model("activities", "ActivityMonthSummary")
+
+    rows = (
+        StreakEntry.objects.filter(completed=True)
+        .order_by("activity_id", "date")
+        .values_list("activity_id", "date")
+    )
+    summaries = []
+    for activity_id, group in groupby(rows.iterator(), key=lambda row: row[0]):
+        for month, fields in summarize_dates(date for _, date in group):
+            summaries.append(
+                ActivityMonthSummary(activity_id=activity_id, month=month, **fields)
+            )
+        if len(summaries) >= 1000:
+            ActivityMonthSummary.objects.bulk_create(summaries)
+            summaries = []
+    ActivityMonthSummary.objects.bulk_create(summaries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("activities", "0006_daily_user_rollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ActivityMonthSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField()),
+                ("completions", models.PositiveIntegerField(default=0)),
+                ("longest_run", models.PositiveIntegerField(default=0)),
+                ("leading_run", models.PositiveIntegerField(default=0)),
+                ("last_run", models.PositiveIntegerField(default=0)),
+                ("last_completed_date", models.DateField()),
+                (
+                    "activity",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="month_summaries",
+                        to="activities.activity",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Activity Month Summary",
+                "verbose_name_plural": "Activity Month Summaries",
+                "db_table": "activity_month_summaries",
+                "ordering": ["month"],
+                "unique_together": {("activity", "month")},
+            },
+        ),
+        migrations.RunPython(enable_rls, migrations.RunPython.noop),
+        migrations.RunPython(backfill_month_summaries, migrations.RunPython.noop),
+    ]
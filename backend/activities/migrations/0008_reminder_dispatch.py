@@ -0,0 +1,93 @@
+# Generated by Django 5.2.4 on 2026-10-17 11:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def enable_rls(apps, schema_editor):
+    # Matches 0004_enable_rls for the new table
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "ALTER TABLE reminder_dispatches ENABLE ROW LEVEL SECURITY"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("activities", "0007_activity_month_summary"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReminderDispatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("midday", "Midday"),
+                            ("evening", "Evening"),
+                            ("daily", "Daily"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("local_date", models.DateField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("claimed", "Claimed"),
+                            ("sent", "Sent"),
+                            ("skipped", "Skipped"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("claimed_by", models.CharField(blank=True, max_length=64)),
+                ("claimed_at", models.DateTimeField(blank=True, null=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reminder_dispatches",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Reminder Dispatch",
+                "verbose_name_plural": "Reminder Dispatches",
+                "db_table": "reminder_dispatches",
+                "ordering": ["-local_date", "id"],
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "status", "local_date"],
+                        name="reminder_di_kind_c37b55_idx",
+                    )
+                ],
+                "unique_together": {("user", "kind", "local_date")},
+            },
+        ),
+        migrations.RunPython(enable_rls, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
-from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import timedelta
+import calendar
+from users.localtime import user_today
 
 User = get_user_model()
 
@@ -36,6 +37,12 @@ class Activity(models.Model):
     description = models.TextField(blank=True)
     target_days = models.PositiveIntegerField(default=1)  # For weekly/custom frequency
     
+    # Stored streak state, kept in step with StreakEntry writes (see activities.streaks)
+    streak_run = models.PositiveIntegerField(default=0)  # Length of the run ending on last_completed_date
+    streak_best = models.PositiveIntegerField(default=0)
+    last_completed_date = models.DateField(null=True, blank=True)
+    completion_count = models.PositiveIntegerField(default=0)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -53,94 +60,71 @@ class Activity(models.Model):
     def __str__(self):
         return f"{self.title} ({self.user.username})"
     
+    # Attached by activities.streaks.attach_activity_metrics() / attach_recent_entries() for batch reads
+    prefetched_metrics = None
+    prefetched_recent_entries = None
+    
+    def local_today(self):
+        """Today's date in the owner's timezone"""
+        return user_today(self.user)
+    
     @property
     def current_streak(self):
-        """Calculate current streak"""
-        today = timezone.now().date()
-        entries = self.streak_entries.filter(completed=True).order_by('-date')
-        
-        if not entries.exists():
-            return 0
-        
-        streak = 0
-        current_date = today
-        
-        while True:
-            entry = entries.filter(date=current_date).first()
-            if entry and entry.completed:
-                streak += 1
-                current_date -= timedelta(days=1)
-            else:
-                break
-        
-        return streak
+        """Current streak, read from the stored streak state"""
+        if self.prefetched_metrics is not None:
+            return self.prefetched_metrics['current_streak']
+        today = self.local_today()
+        if self.last_completed_date == today:
+            return self.streak_run
+        return 0
     
     @property
     def best_streak(self):
-        """Calculate best streak"""
-        entries = self.streak_entries.filter(completed=True).order_by('date')
-        
-        if not entries.exists():
-            return 0
-        
-        max_streak = 0
-        current_streak = 0
-        prev_date = None
-        
-        for entry in entries:
-            if prev_date is None:
-                current_streak = 1
-            elif (entry.date - prev_date).days == 1:
-                current_streak += 1
-            else:
-                max_streak = max(max_streak, current_streak)
-                current_streak = 1
-            
-            prev_date = entry.date
-        
-        max_streak = max(max_streak, current_streak)
-        return max_streak
+        """Best streak, read from the stored streak state"""
+        if self.prefetched_metrics is not None:
+            return self.prefetched_metrics['best_streak']
+        return self.streak_best
     
     @property
     def total_completions(self):
-        """Calculate total number of completions"""
-        return self.streak_entries.filter(completed=True).count()
+        """Total number of completions, read from the stored streak state"""
+        if self.prefetched_metrics is not None:
+            return self.prefetched_metrics['total_completions']
+        return self.completion_count
     
     @property
     def completed_today(self):
         """Check if activity is completed today"""
-        today = timezone.now().date()
-        return self.streak_entries.filter(date=today, completed=True).exists()
+        if self.prefetched_metrics is not None:
+            return self.prefetched_metrics['completed_today']
+        today = self.local_today()
+        return self.last_completed_date == today
     
     @property
     def weekly_progress(self):
         """Calculate weekly progress percentage"""
-        today = timezone.now().date()
+        if self.prefetched_metrics is not None:
+            return self.prefetched_metrics['weekly_progress']
+        today = self.local_today()
         week_start = today - timedelta(days=today.weekday())
         week_end = week_start + timedelta(days=6)
         
+        completed_days = self.streak_entries.filter(
+            date__gte=week_start,
+            date__lte=week_end,
+            completed=True
+        ).count()
+        return self.weekly_progress_for(completed_days)
+    
+    def weekly_progress_for(self, completed_days):
+        """Weekly progress percentage for a number of days completed this week"""
         if self.frequency == 'daily':
-            total_days = min(7, (week_end - week_start).days + 1)
-            completed_days = self.streak_entries.filter(
-                date__gte=week_start,
-                date__lte=week_end,
-                completed=True
-            ).count()
-            return round((completed_days / total_days) * 100) if total_days > 0 else 0
+            return round((completed_days / 7) * 100)
         elif self.frequency == 'weekly':
             # For weekly activities, check if completed this week
-            return 100 if self.streak_entries.filter(
-                date__gte=week_start,
-                date__lte=week_end,
-                completed=True
-            ).exists() else 0
+            return 100 if completed_days > 0 else 0
         else:
             # For custom frequency, calculate based on target_days
-            completed_days = self.streak_entries.filter(
-                date__gte=week_start,
-                date__lte=week_end,
-                completed=True
-            ).count()
             return round((completed_days / self.target_days) * 100) if self.target_days > 0 else 0
 
 
@@ -187,3 +171,109 @@ class StreakEntry(models.Model):
                 existing.save()
                 return
         super().save(*args, **kwargs)
+
+
+class DailyUserRollup(models.Model):
+    """Per-user, per-day completion summary kept in step with StreakEntry writes (see activities.rollups)"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+    completed_count = models.PositiveIntegerField(default=0)
+    active_activity_count = models.PositiveIntegerField(default=0)  # Activities with an entry on this date
+    # Bit n (LSB first) is set when the user's n-th activity, ordered by id, was completed
+    completion_bitmap = models.BinaryField(default=b'')
+    
+    class Meta:
+        db_table = 'daily_user_rollups'
+        verbose_name = 'Daily User Rollup'
+        verbose_name_plural = 'Daily User Rollups'
+        unique_together = ['user', 'date']
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.date} {self.completed_count}/{self.active_activity_count}"
+
+
+class ActivityMonthSummary(models.Model):
+    """Per-activity, per-month completion summary kept in step with StreakEntry writes (see activities.summaries)"""
+    
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='month_summaries')
+    month = models.DateField()  # First day of the month
+    completions = models.PositiveIntegerField(default=0)
+    longest_run = models.PositiveIntegerField(default=0)  # Longest run of completed days inside the month
+    leading_run = models.PositiveIntegerField(default=0)  # Run starting on the 1st, 0 if the 1st is not completed
+    last_run = models.PositiveIntegerField(default=0)  # Run ending on last_completed_date
+    last_completed_date = models.DateField()
+    
+    class Meta:
+        db_table = 'activity_month_summaries'
+        verbose_name = 'Activity Month Summary'
+        verbose_name_plural = 'Activity Month Summaries'
+        unique_together = ['activity', 'month']
+        ordering = ['month']
+    
+    def __str__(self):
+        return f"{self.activity.title} - {self.month:%Y-%m} {self.completions}"
+    
+    @property
+    def starts_completed(self):
+        return self.leading_run > 0
+    
+    @property
+    def ends_completed(self):
+        return self.last_completed_date == month_end(self.month)
+
+
+class ReminderDispatch(models.Model):
+    """Ledger of reminder emails, one row per user, reminder kind and local date (see activities.dispatch)"""
+    
+    KIND_CHOICES = [
+        ('midday', 'Midday'),
+        ('evening', 'Evening'),
+        ('daily', 'Daily'),
+    ]
+    
+    STATUS_PENDING = 'pending'
+    STATUS_CLAIMED = 'claimed'
+    STATUS_SENT = 'sent'
+    STATUS_SKIPPED = 'skipped'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_CLAIMED, 'Claimed'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_SKIPPED, 'Skipped'),  # No longer due when its turn came
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reminder_dispatches')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    local_date = models.DateField()  # The user's date the reminder is for
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Lease of the worker sending it; an expired claim is picked up again
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'reminder_dispatches'
+        verbose_name = 'Reminder Dispatch'
+        verbose_name_plural = 'Reminder Dispatches'
+        unique_together = ['user', 'kind', 'local_date']
+        ordering = ['-local_date', 'id']
+        indexes = [
+            models.Index(fields=['kind', 'status', 'local_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.kind} {self.local_date} ({self.status})"
+
+
+def month_end(month):
+    """Last day of the month containing a date"""
+    return month.replace(day=calendar.monthrange(month.year, month.month)[1])
@@ -0,0 +1,66 @@
+"""
+Set-based reminder eligibility.
+
+Instead of one query per user and one per activity, the activities of every
+user in a queryset are read in one pass through a server-side cursor, each
+annotated with whether it has a completed entry on its owner's local date
+(an EXISTS subquery, with the local date computed in the query from the
+owner's timezone). The rows are grouped back into one ReminderCandidate per
+user with the incomplete activities already split out, and the reminder
+kinds only differ in which candidates they keep.
+"""
+from collections import namedtuple
+from itertools import groupby
+
+from django.db.models import Exists, OuterRef, Value
+
+from users.localtime import local_date_expression, local_dates
+
+from .models import Activity, StreakEntry
+from .scheduling import MIDDAY
+
+CANDIDATE_CHUNK_SIZE = 2000
+
+ReminderCandidate = namedtuple('ReminderCandidate', ['user', 'today', 'activities', 'incomplete'])
+
+
+def reminder_candidates(users, now=None, today=None):
+    """
+    Yield a ReminderCandidate for every user in the queryset who has at least
+    one activity, using each user's local date unless today is given.
+    """
+    if today is None:
+        zones = users.order_by().values_list('timezone', flat=True).distinct()
+        local_date = local_date_expression(local_dates(zones, now), 'user__timezone', now)
+    else:
+        local_date = Value(today)
+
+    completed = StreakEntry.objects.filter(activity=OuterRef('pk'), date=OuterRef('local_date'), completed=True)
+    activities = Activity.objects.filter(user__in=users).select_related('user').annotate(
+        local_date=local_date,
+    ).annotate(
+        done_today=Exists(completed),
+    ).order_by('user_id', '-created_at', '-id')
+
+    for user_id, group in groupby(activities.iterator(chunk_size=CANDIDATE_CHUNK_SIZE), key=lambda activity: activity.user_id):
+        group = list(group)
+        yield ReminderCandidate(
+            user=group[0].user,
+            today=group[0].local_date,
+            activities=group,
+            incomplete=[activity for activity in group if not activity.done_today],
+        )
+
+
+def is_due(kind, candidate):
+    """Midday reminders go to users with nothing completed today, the others to users with anything left"""
+    if kind == MIDDAY:
+        return len(candidate.incomplete) == len(candidate.activities)
+    return bool(candidate.incomplete)
+
+
+def due_reminders(kind, users, now=None):
+    """Yield the ReminderCandidates of the users in the queryset who should get a `kind` reminder"""
+    for candidate in reminder_candidates(users, now):
+        if is_due(kind, candidate):
+            yield candidate
@@ -0,0 +1,7 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class CompactCalendarRenderer(JSONRenderer):
+    """JSON renderer for the compact calendar layout, selected with ?format=compact or its media type"""
+    media_type = 'application/vnd.streakflow.calendar+json'
+    format = 'compact'
@@ -0,0 +1,233 @@
+"""
+Per-user daily completion rollups.
+
+DailyUserRollup holds one row per user and day with entries: how many
+activities were completed, how many had an entry at all, and a bitmap of the
+completed activities (bit n is the user's n-th activity ordered by id). Year
+views and completion-rate statistics read these rows instead of counting
+StreakEntry rows over long ranges.
+
+A write to a single entry adjusts the counts and the activity's bit of that
+one day (apply_rollup_change); bulk writes recount the touched dates. New
+activities get the highest id and so only ever append a bit; deleting an
+activity shifts the positions, so the user's rollups are rebuilt then.
+"""
+from collections import namedtuple
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Activity, DailyUserRollup, StreakEntry
+
+RollupDay = namedtuple('RollupDay', ['completed_count', 'active_activity_count', 'completion_bitmap'])
+
+# Rows written per bulk statement when rebuilding
+ROLLUP_BATCH_SIZE = 1000
+
+
+def build_rollup_rows(positions, rows):
+    """
+    Yield (date, completed_count, active_activity_count, bitmap) per day.
+
+    positions maps activity id to bit position; rows are (date, activity_id,
+    completed) ordered by date.
+    """
+    size = (len(positions) + 7) // 8
+    for date, group in groupby(rows, key=lambda row: row[0]):
+        bitmap = bytearray(size)
+        completed_count = active_count = 0
+        for _, activity_id, completed in group:
+            position = positions.get(activity_id)
+            if position is None:
+                continue
+            active_count += 1
+            if completed:
+                completed_count += 1
+                bitmap[position >> 3] |= 1 << (position & 7)
+        if active_count:
+            yield date, completed_count, active_count, bytes(bitmap)
+
+
+def activity_positions(user_id):
+    """Map each of the user's activity ids to its bitmap position"""
+    activity_ids = Activity.objects.filter(user_id=user_id).order_by('id').values_list('id', flat=True)
+    return {activity_id: position for position, activity_id in enumerate(activity_ids)}
+
+
+def completed_activities(bitmap, activity_ids):
+    """Ids of the completed activities in a rollup bitmap, given the user's activity ids ordered by id"""
+    bitmap = bytes(bitmap)
+    return [
+        activity_id for position, activity_id in enumerate(activity_ids)
+        if position >> 3 < len(bitmap) and bitmap[position >> 3] >> (position & 7) & 1
+    ]
+
+
+def position_expression(user, activity):
+    """Bitmap position of an activity: how many activities of its owner have a lower id"""
+    earlier = Activity.objects.filter(user_id=user, id__lt=activity).order_by().values('user_id')
+    return Coalesce(Subquery(earlier.annotate(count=Count('id')).values('count')), 0)
+
+
+def entry_rollup_annotations(date):
+    """
+    Annotations reading, for each activity of a queryset, what a write to its
+    entry on a date changes: the activity's bitmap position, the number of
+    activities of its owner and the owner's stored rollup of that date
+    """
+    siblings = Activity.objects.filter(user_id=OuterRef('user_id')).order_by().values('user_id')
+    rollup = DailyUserRollup.objects.filter(user_id=OuterRef('user_id'), date=date)
+    annotations = {
+        'rollup_position': position_expression(OuterRef('user_id'), OuterRef('pk')),
+        'rollup_activity_count': Subquery(siblings.annotate(count=Count('id')).values('count')),
+    }
+    for field in RollupDay._fields:
+        annotations[f'rollup_{field}'] = Subquery(rollup.values(field)[:1])
+    return annotations
+
+
+def apply_rollup_change(user_id, date, position, activity_count, day, completed, added):
+    """
+    Update a user's rollup of one date after a write to one entry.
+
+    day is the RollupDay read by entry_rollup_annotations(), or None when the
+    date had no rollup; completed is the entry's new state (False once it is
+    deleted) and added is 1 for a new entry, -1 for a deleted one, 0
+    otherwise. The row is only written while it still holds what was read, so
+    a missing row or a concurrent change falls back to a recount of the date.
+    """
+    if day is None:
+        recount_daily_rollup(user_id, date, activity_count)
+        return
+
+    stored_bitmap = bytes(day.completion_bitmap)
+    bitmap = bytearray(stored_bitmap.ljust((activity_count + 7) // 8, b'\0'))
+    mask = 1 << (position & 7)
+    was_completed = bool(bitmap[position >> 3] & mask)
+    if completed:
+        bitmap[position >> 3] |= mask
+    else:
+        bitmap[position >> 3] &= ~mask
+    active_count = day.active_activity_count + added
+
+    stored = DailyUserRollup.objects.filter(
+        user_id=user_id,
+        date=date,
+        completed_count=day.completed_count,
+        active_activity_count=day.active_activity_count,
+        completion_bitmap=stored_bitmap,
+    )
+    if active_count:
+        written = stored.update(
+            completed_count=day.completed_count + completed - was_completed,
+            active_activity_count=active_count,
+            completion_bitmap=bytes(bitmap),
+        )
+    else:
+        written, _ = stored.delete()
+    if not written:
+        recount_daily_rollup(user_id, date, activity_count)
+
+
+def recount_daily_rollup(user_id, date, activity_count):
+    """Recount a user's rollup of one date from its entries, given the user's number of activities"""
+    rows = StreakEntry.objects.filter(activity__user_id=user_id, date=date).annotate(
+        position=position_expression(user_id, OuterRef('activity_id'))
+    ).values_list('position', 'completed')
+
+    bitmap = bytearray((activity_count + 7) // 8)
+    completed_count = active_count = 0
+    for position, completed in rows:
+        active_count += 1
+        if completed:
+            completed_count += 1
+            bitmap[position >> 3] |= 1 << (position & 7)
+
+    if not active_count:
+        DailyUserRollup.objects.filter(user_id=user_id, date=date).delete()
+        return
+    DailyUserRollup.objects.bulk_create(
+        [DailyUserRollup(
+            user_id=user_id,
+            date=date,
+            completed_count=completed_count,
+            active_activity_count=active_count,
+            completion_bitmap=bytes(bitmap),
+        )],
+        update_conflicts=True,
+        unique_fields=['user', 'date'],
+        update_fields=list(RollupDay._fields),
+    )
+
+
+def refresh_daily_rollups(user_id, dates):
+    """Recount the rollups of a user for the given dates from their entries"""
+    dates = set(dates)
+    if not dates:
+        return
+
+    positions = activity_positions(user_id)
+    rows = StreakEntry.objects.filter(
+        activity__user_id=user_id,
+        date__in=dates
+    ).order_by('date').values_list('date', 'activity_id', 'completed')
+
+    rollups = [
+        DailyUserRollup(
+            user_id=user_id,
+            date=date,
+            completed_count=completed_count,
+            active_activity_count=active_count,
+            completion_bitmap=bitmap,
+        )
+        for date, completed_count, active_count, bitmap in build_rollup_rows(positions, rows)
+    ]
+
+    # Joins the caller's transaction without a savepoint; any error aborts it as a whole
+    with transaction.atomic(savepoint=False):
+        if rollups:
+            DailyUserRollup.objects.bulk_create(
+                rollups,
+                update_conflicts=True,
+                unique_fields=['user', 'date'],
+                update_fields=['completed_count', 'active_activity_count', 'completion_bitmap'],
+            )
+        # Days that no longer have any entry
+        DailyUserRollup.objects.filter(
+            user_id=user_id,
+            date__in=dates - {rollup.date for rollup in rollups}
+        ).delete()
+
+
+def rebuild_user_rollups(user_id, chunk_size=2000):
+    """Replace all rollups of a user with a recount of their entries"""
+    positions = activity_positions(user_id)
+    rows = StreakEntry.objects.filter(
+        activity__user_id=user_id
+    ).order_by('date').values_list('date', 'activity_id', 'completed')
+
+    written = 0
+    # After an activity delete this runs inside the delete's transaction, where a savepoint buys nothing
+    with transaction.atomic(savepoint=False):
+        DailyUserRollup.objects.filter(user_id=user_id).delete()
+        batch = []
+        for date, completed_count, active_count, bitmap in build_rollup_rows(
+            positions, rows.iterator(chunk_size=chunk_size)
+        ):
+            batch.append(DailyUserRollup(
+                user_id=user_id,
+                date=date,
+                completed_count=completed_count,
+                active_activity_count=active_count,
+                completion_bitmap=bitmap,
+            ))
+            if len(batch) >= ROLLUP_BATCH_SIZE:
+                DailyUserRollup.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            DailyUserRollup.objects.bulk_create(batch)
+            written += len(batch)
+    return written
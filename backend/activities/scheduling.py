@@ -0,0 +1,109 @@
+"""
+Timezone-bucketed reminder scheduling.
+
+Celery beat runs send_scheduled_reminders every REMINDER_INTERVAL (see
+CELERY_BEAT_SCHEDULE). Each run covers one slot of UTC time. For that slot the
+local wall-clock window of every IANA zone is computed in Python (zones are
+grouped by their window, so there are only a few dozen groups), and the users
+who are due are selected with one query on the (timezone, reminder_time)
+index: zones whose window contains midday or evening, or, for the personal
+reminder, each zone group with the matching reminder_time range. Users whose
+timezone is not a known zone name are scheduled with UTC, as get_zone() reads
+them everywhere else. A run only
+reads the users whose local time has just reached the reminder, so the work
+is spread across the day instead of hitting the whole table at once.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import available_timezones
+
+from django.db.models import Q
+from django.utils import timezone
+
+from users.localtime import local_now
+from users.models import User
+
+REMINDER_INTERVAL = timedelta(minutes=15)
+
+MIDDAY = 'midday'
+EVENING = 'evening'
+DAILY = 'daily'
+
+# Local times of the fixed reminders; DAILY uses each user's reminder_time
+REMINDER_TIMES = {
+    MIDDAY: time(12, 0),
+    EVENING: time(20, 0),
+}
+
+
+@lru_cache(maxsize=1)
+def zone_names():
+    """Every zone name a user can store, plus '' which is read as UTC"""
+    return frozenset(available_timezones()) | {''}
+
+
+def slot_start(now=None):
+    """Start of the scheduling slot containing now"""
+    now = now or timezone.now()
+    seconds = int(REMINDER_INTERVAL.total_seconds())
+    epoch = int(now.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=now.tzinfo)
+
+
+def zone_windows(slot):
+    """{local start of the slot: [zone names]} for every zone"""
+    windows = defaultdict(list)
+    for name in zone_names():
+        local = local_now(name, slot)
+        windows[(local.date(), local.time().replace(tzinfo=None))].append(name)
+    return windows
+
+
+def in_zones(names):
+    """Q selecting the users in the named zones, plus those with an unknown zone when UTC is one of them"""
+    condition = Q(timezone__in=names)
+    if '' in names:
+        condition |= ~Q(timezone__in=zone_names())
+    return condition
+
+
+def window_contains(start, moment):
+    """Whether a local time falls inside the slot window starting at start"""
+    end = (datetime.combine(datetime.min, start) + REMINDER_INTERVAL).time()
+    if end <= start:
+        # The window runs past midnight
+        return moment >= start
+    return start <= moment < end
+
+
+def due_users_filter(kind, now=None):
+    """Q selecting the users whose `kind` reminder falls in the current slot, or None if nobody's can"""
+    windows = zone_windows(slot_start(now))
+
+    if kind == DAILY:
+        condition = Q(pk__in=[])
+        for (date, start), names in windows.items():
+            end = (datetime.combine(date, start) + REMINDER_INTERVAL).time()
+            times = Q(reminder_time__gte=start)
+            if end > start:
+                times &= Q(reminder_time__lt=end)
+            condition |= in_zones(names) & times
+        return condition
+
+    reminder_time = REMINDER_TIMES[kind]
+    names = [
+        name
+        for (date, start), group in windows.items()
+        if window_contains(start, reminder_time)
+        for name in group
+    ]
+    return in_zones(names) if names else None
+
+
+def due_users(kind, now=None):
+    """Active users with notifications enabled whose `kind` reminder is due in the current slot"""
+    condition = due_users_filter(kind, now)
+    if condition is None:
+        return User.objects.none()
+    return User.objects.filter(condition, is_active=True, email_notifications=True)
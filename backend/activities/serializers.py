@@ -1,6 +1,17 @@
 from rest_framework import serializers
 from .models import Activity, StreakEntry
-from django.utils import timezone
+from .streaks import RECENT_ENTRIES_LIMIT, attach_activity_metrics, attach_recent_entries
+from django.db import models
+from users.localtime import user_today
+
+# Upper bound on the entries accepted by one bulk upsert request
+MAX_BULK_ENTRIES = 1000
+
+
+def request_today(serializer):
+    """Today in the requesting user's timezone"""
+    request = serializer.context.get('request')
+    return user_today(getattr(request, 'user', None))
 
 
 class StreakEntrySerializer(serializers.ModelSerializer):
@@ -13,11 +24,25 @@ class StreakEntrySerializer(serializers.ModelSerializer):
     
     def validate_date(self, value):
         """Validate that date is not in the future"""
-        if value > timezone.now().date():
+        if value > request_today(self):
             raise serializers.ValidationError("Cannot create entries for future dates")
         return value
 
 
+class ActivityListSerializer(serializers.ListSerializer):
+    """List serializer that loads metrics and recent entries for a whole page of activities at once"""
+    
+    def to_representation(self, data):
+        activities = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        pending = [activity for activity in activities if activity.prefetched_metrics is None]
+        if pending:
+            attach_activity_metrics(pending)
+        pending = [activity for activity in activities if activity.prefetched_recent_entries is None]
+        if pending:
+            attach_recent_entries(pending)
+        return super().to_representation(activities)
+
+
 class ActivitySerializer(serializers.ModelSerializer):
     """Serializer for Activity model with calculated fields"""
     
@@ -38,10 +63,13 @@ class ActivitySerializer(serializers.ModelSerializer):
                  'current_streak', 'best_streak', 'total_completions', 
                  'completed_today', 'weekly_progress', 'recent_entries')
         read_only_fields = ('id', 'user', 'created_at', 'updated_at')
+        list_serializer_class = ActivityListSerializer
     
     def get_recent_entries(self, obj):
         """Get recent entries for the activity"""
-        entries = obj.streak_entries.order_by('-date')[:7]  # Last 7 days
+        entries = obj.prefetched_recent_entries
+        if entries is None:
+            entries = obj.streak_entries.order_by('-date')[:RECENT_ENTRIES_LIMIT]
         return StreakEntrySerializer(entries, many=True).data
 
 
@@ -102,7 +130,7 @@ class StreakEntryCreateSerializer(serializers.ModelSerializer):
     
     def validate_date(self, value):
         """Validate that date is not in the future"""
-        if value > timezone.now().date():
+        if value > request_today(self):
             raise serializers.ValidationError("Cannot create entries for future dates")
         return value
 
@@ -119,4 +147,36 @@ class StreakEntryUpdateSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         if self.instance.activity.user != user:
             raise serializers.ValidationError("You can only update entries for your own activities")
-        return attrs 
\ No newline at end of file
+        return attrs
+
+class StreakEntryBulkItemSerializer(serializers.Serializer):
+    """One entry of a bulk upsert"""
+    
+    activity = serializers.IntegerField()
+    date = serializers.DateField()
+    completed = serializers.BooleanField()
+    note = serializers.CharField(required=False, allow_blank=True)
+    
+    def validate_date(self, value):
+        """Validate that date is not in the future"""
+        if value > request_today(self):
+            raise serializers.ValidationError("Cannot create entries for future dates")
+        return value
+
+
+class StreakEntryBulkSerializer(serializers.Serializer):
+    """Serializer for upserting many streak entries at once"""
+    
+    entries = StreakEntryBulkItemSerializer(many=True, allow_empty=False, max_length=MAX_BULK_ENTRIES)
+    
+    def validate_entries(self, value):
+        """Validate that every activity belongs to the user, with one query for the whole batch"""
+        user = self.context['request'].user
+        activity_ids = {item['activity'] for item in value}
+        owned = set(Activity.objects.filter(
+            user=user,
+            id__in=activity_ids
+        ).values_list('id', flat=True))
+        if activity_ids - owned:
+            raise serializers.ValidationError("You can only create entries for your own activities")
+        return value
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_user_generation
+from .entries import record_entry_write
+from .models import Activity, StreakEntry
+from .rollups import rebuild_user_rollups
+
+
+@receiver(post_save, sender=StreakEntry)
+def streak_entry_saved(sender, instance, created=False, raw=False, **kwargs):
+    """Keep the activity's stored streak state in step with entry writes"""
+    if raw:
+        # Fixture loading; run the rebuild commands afterwards
+        return
+    record_entry_write(instance.activity_id, instance.date, instance.completed, added=int(created))
+    bump_user_generation(instance.activity.user_id)
+
+
+@receiver(post_delete, sender=StreakEntry)
+def streak_entry_deleted(sender, instance, origin=None, **kwargs):
+    """Keep the activity's stored streak state in step with entry deletions"""
+    if origin is not None and getattr(origin, 'model', type(origin)) is not StreakEntry:
+        # Cascade from deleting the activity or its owner; nothing left to update
+        return
+    # Deleting an entry that was not completed only changes the day's rollup
+    record_entry_write(
+        instance.activity_id, instance.date, False, added=-1, completion_changed=instance.completed,
+    )
+    bump_user_generation(instance.activity.user_id)
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def activity_changed(sender, instance, **kwargs):
+    """Invalidate the owner's cached responses"""
+    bump_user_generation(instance.user_id)
+
+
+@receiver(post_delete, sender=Activity)
+def activity_deleted(sender, instance, origin=None, **kwargs):
+    """Rebuild the owner's daily rollups, whose bitmap positions shift when an activity goes away"""
+    if origin is not None and getattr(origin, 'model', type(origin)) is not Activity:
+        # Cascade from deleting the owner; their rollups go with them
+        return
+    rebuild_user_rollups(instance.user_id)
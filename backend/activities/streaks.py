@@ -0,0 +1,311 @@
+"""
+Stored streak state for activities.
+
+Every activity carries its streak state (length of the newest run, best run,
+last completed date and completion count) so reads are O(1). The state is
+kept in step with StreakEntry writes through advance_streak_state(), under
+the activity's row lock (see activities.entries.record_entry_write): extending
+the newest run is handled incrementally, anything else (backfilling a past
+date, un-completing or deleting an entry) falls back to a recompute from the
+activity's monthly summaries (see activities.summaries), which the caller
+refreshes first. compute_streak_states() recomputes from the raw entries
+instead, in the database on PostgreSQL (gaps and islands) and in Python
+elsewhere; rebuild_streaks uses it as the reference.
+
+calculate_activity_metrics() derives every metric the API exposes for a batch
+of activities from a single ordered query, with "today" taken in each
+owner's timezone, so list endpoints and dashboards
+cost the same number of queries for one activity or fifty.
+attach_recent_entries() does the same for the latest entries of each activity.
+"""
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import timedelta
+from itertools import groupby
+
+from django.db import connection
+from django.db.models import Case, F, IntegerField, When, Window
+from django.db.models.functions import RowNumber
+
+from streakflow.metrics import STREAK_COMPUTATION_DURATION
+from users.localtime import local_dates
+
+from .models import Activity, StreakEntry, User
+from .summaries import composed_streak_states
+
+StreakState = namedtuple('StreakState', ['run', 'best', 'last_date', 'total'])
+
+EMPTY_STREAK_STATE = StreakState(run=0, best=0, last_date=None, total=0)
+
+STREAK_STATE_FIELDS = ('streak_run', 'streak_best', 'last_completed_date', 'completion_count')
+
+RECENT_ENTRIES_LIMIT = 7
+
+# Gaps and islands: within one activity, date - ROW_NUMBER() over the completed
+# dates is constant along a run of consecutive days, so grouping by it yields
+# one row per run. The newest run gives the current run, the longest the best.
+STREAK_STATES_SQL = f"""
+    WITH completed AS (
+        SELECT activity_id, date,
+               date - CAST(ROW_NUMBER() OVER (PARTITION BY activity_id ORDER BY date) AS integer) AS island
+        FROM {StreakEntry._meta.db_table}
+        WHERE completed AND activity_id = ANY(%s)
+    ), runs AS (
+        SELECT activity_id, COUNT(*) AS length, MAX(date) AS last_date
+        FROM completed
+        GROUP BY activity_id, island
+    )
+    SELECT activity_id,
+           (ARRAY_AGG(length ORDER BY last_date DESC))[1] AS run,
+           MAX(length) AS best,
+           MAX(last_date) AS last_date,
+           SUM(length) AS total
+    FROM runs
+    GROUP BY activity_id
+"""
+
+
+def compute_streak_state(dates):
+    """Compute the streak state from completed dates in ascending order"""
+    run = best = total = 0
+    last_date = None
+
+    for date in dates:
+        if last_date is not None and (date - last_date).days == 1:
+            run += 1
+        else:
+            run = 1
+        best = max(best, run)
+        total += 1
+        last_date = date
+
+    return StreakState(run=run, best=best, last_date=last_date, total=total)
+
+
+def iter_completed_dates(activity_ids, start_date=None, end_date=None, chunk_size=2000):
+    """Yield (activity_id, dates) for the given activities from one ordered query"""
+    rows = StreakEntry.objects.filter(
+        activity_id__in=activity_ids,
+        completed=True
+    )
+    if start_date is not None:
+        rows = rows.filter(date__gte=start_date)
+    if end_date is not None:
+        rows = rows.filter(date__lte=end_date)
+    rows = rows.order_by('activity_id', 'date').values_list('activity_id', 'date')
+
+    for activity_id, group in groupby(rows.iterator(chunk_size=chunk_size), key=lambda row: row[0]):
+        yield activity_id, [date for _, date in group]
+
+
+def get_streak_state(activity):
+    """Return the stored streak state of an activity instance"""
+    return StreakState(
+        run=activity.streak_run,
+        best=activity.streak_best,
+        last_date=activity.last_completed_date,
+        total=activity.completion_count,
+    )
+
+
+def current_streak_expression(today):
+    """Database expression for an activity's current streak, from its stored state"""
+    return Case(
+        When(last_completed_date=today, then=F('streak_run')),
+        default=0,
+        output_field=IntegerField(),
+    )
+
+
+def save_streak_state(activity_id, state):
+    """Persist a streak state for an activity"""
+    Activity.objects.filter(pk=activity_id).update(
+        streak_run=state.run,
+        streak_best=state.best,
+        last_completed_date=state.last_date,
+        completion_count=state.total,
+    )
+
+
+def recompute_streak_state(activity_id):
+    """Recompute and store the streak state of a single activity from its monthly summaries"""
+    state = StreakState(*composed_streak_states([activity_id])[activity_id])
+    save_streak_state(activity_id, state)
+    return state
+
+
+@STREAK_COMPUTATION_DURATION.track('compute_streak_states')
+def compute_streak_states(activity_ids):
+    """
+    Compute the streak state of several activities from their entries in one round trip.
+
+    PostgreSQL runs the gaps-and-islands query so only one row per activity
+    leaves the database; other databases stream the completed dates and walk
+    them with compute_streak_state(). Returns {activity_id: StreakState}.
+    """
+    states = dict.fromkeys(activity_ids, EMPTY_STREAK_STATE)
+    if not states:
+        return states
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(STREAK_STATES_SQL, [list(states)])
+            for activity_id, run, best, last_date, total in cursor.fetchall():
+                states[activity_id] = StreakState(run=run, best=best, last_date=last_date, total=int(total))
+    else:
+        for activity_id, dates in iter_completed_dates(list(states)):
+            states[activity_id] = compute_streak_state(dates)
+    return states
+
+
+@STREAK_COMPUTATION_DURATION.track('recompute_streak_states')
+def recompute_streak_states(activity_ids):
+    """Recompute and store the streak state of several activities from their monthly summaries"""
+    states = {
+        activity_id: StreakState(*state)
+        for activity_id, state in composed_streak_states(activity_ids).items()
+    }
+
+    Activity.objects.bulk_update([
+        Activity(
+            pk=activity_id,
+            streak_run=state.run,
+            streak_best=state.best,
+            last_completed_date=state.last_date,
+            completion_count=state.total,
+        )
+        for activity_id, state in states.items()
+    ], STREAK_STATE_FIELDS)
+    return states
+
+
+def advance_streak_state(activity_id, entry_date, completed, state):
+    """
+    Store the streak state following a write to one entry.
+
+    state is the stored state, read while holding the activity's row lock.
+    """
+    newer_than_last = state.last_date is None or entry_date > state.last_date
+
+    if completed and newer_than_last:
+        # Completing a date after the last completion extends or restarts the newest run
+        if state.last_date is not None and (entry_date - state.last_date).days == 1:
+            run = state.run + 1
+        else:
+            run = 1
+        state = StreakState(
+            run=run,
+            best=max(state.best, run),
+            last_date=entry_date,
+            total=state.total + 1,
+        )
+        save_streak_state(activity_id, state)
+        return state
+
+    if newer_than_last or (completed and entry_date == state.last_date):
+        # Nothing completed changed
+        return state
+
+    # Backfills, un-completions and deletions can split or merge runs anywhere
+    return recompute_streak_state(activity_id)
+
+
+@STREAK_COMPUTATION_DURATION.track('calculate_activity_metrics')
+def calculate_activity_metrics(activities, today=None):
+    """
+    Compute the derived metrics of many activities in one pass.
+
+    The streak numbers come from the stored streak state, and the completed
+    dates of the current week are fetched for all activities with one ordered
+    query. "today" is each owner's local date unless given. Accepts Activity
+    instances or ids and returns {activity_id: metrics}.
+    """
+    activities = list(activities)
+    if activities and not isinstance(activities[0], Activity):
+        activities = list(Activity.objects.filter(id__in=activities))
+
+    if today is None:
+        todays = local_dates_for(activities)
+    else:
+        todays = {activity.id: today for activity in activities}
+    weeks = {
+        activity_id: (day - timedelta(days=day.weekday()), day + timedelta(days=6 - day.weekday()))
+        for activity_id, day in todays.items()
+    }
+
+    completed_dates = dict(iter_completed_dates(
+        [activity.id for activity in activities],
+        start_date=min((start for start, _ in weeks.values()), default=None),
+        end_date=max((end for _, end in weeks.values()), default=None),
+    ))
+
+    metrics = {}
+    for activity in activities:
+        today = todays[activity.id]
+        week_start, week_end = weeks[activity.id]
+        dates = completed_dates.get(activity.id, [])
+        state = get_streak_state(activity)
+
+        # Dates are ascending, so this week's completions sit at the tail
+        week_days = bisect_left(dates, week_end + timedelta(days=1)) - bisect_left(dates, week_start)
+
+        metrics[activity.id] = {
+            'current_streak': state.run if state.last_date == today else 0,
+            'best_streak': state.best,
+            'total_completions': state.total,
+            'completed_today': state.last_date == today,
+            'weekly_progress': activity.weekly_progress_for(week_days),
+        }
+
+    return metrics
+
+
+def local_dates_for(activities):
+    """
+    {activity_id: today in the owner's timezone} for a batch of activities.
+
+    Owners already loaded on the activities are used as they are; the rest
+    are looked up with one query. Dates are computed once per distinct zone.
+    """
+    zones = {}
+    missing = set()
+    for activity in activities:
+        if Activity.user.is_cached(activity):
+            zones[activity.user_id] = activity.user.timezone
+        else:
+            missing.add(activity.user_id)
+    missing -= set(zones)
+
+    if missing:
+        zones.update(User.objects.filter(id__in=missing).values_list('id', 'timezone'))
+
+    dates = local_dates(zones.values())
+    return {activity.id: dates[zones[activity.user_id]] for activity in activities}
+
+
+def attach_activity_metrics(activities, today=None):
+    """Compute metrics for a batch of activities and attach them for serialization"""
+    metrics = calculate_activity_metrics(activities, today=today)
+    for activity in activities:
+        activity.prefetched_metrics = metrics[activity.id]
+    return metrics
+
+
+def attach_recent_entries(activities, limit=RECENT_ENTRIES_LIMIT):
+    """Load the latest entries of every activity with one windowed query and attach them"""
+    entries = StreakEntry.objects.filter(
+        activity_id__in=[activity.id for activity in activities]
+    ).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('activity_id')],
+            order_by=F('date').desc(),
+        )
+    ).filter(row_number__lte=limit).order_by('activity_id', '-date')
+
+    recent = {activity.id: [] for activity in activities}
+    for entry in entries:
+        recent[entry.activity_id].append(entry)
+
+    for activity in activities:
+        activity.prefetched_recent_entries = recent[activity.id]
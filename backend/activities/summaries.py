@@ -0,0 +1,148 @@
+"""
+Per-activity monthly completion summaries.
+
+ActivityMonthSummary holds, for every month in which an activity was
+completed at least once, the number of completions, the longest run inside
+the month, the run starting on the 1st, and the run ending on the month's
+last completed date. Runs crossing month boundaries are stitched together by
+compose_streak_state(), so best streaks, current runs, lifetime and yearly
+totals come from at most twelve rows per year instead of every entry.
+
+Summaries of the touched months are recounted on every entry write, before
+the stored streak state is updated from them.
+"""
+from collections import defaultdict
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import ActivityMonthSummary, StreakEntry, month_end
+
+SUMMARY_FIELDS = ('completions', 'longest_run', 'leading_run', 'last_run', 'last_completed_date')
+
+
+def month_start(date):
+    """First day of the month containing a date"""
+    return date.replace(day=1)
+
+
+def summarize_month(month, dates):
+    """Summary fields of one month from its completed dates in ascending order"""
+    completions = longest = leading = run = 0
+    last_date = None
+
+    for date in dates:
+        if last_date is not None and (date - last_date).days == 1:
+            run += 1
+        else:
+            run = 1
+        if date.day == run:
+            # The run started on the 1st
+            leading = run
+        longest = max(longest, run)
+        completions += 1
+        last_date = date
+
+    return {
+        'completions': completions,
+        'longest_run': longest,
+        'leading_run': leading,
+        'last_run': run,
+        'last_completed_date': last_date,
+    }
+
+
+def summarize_dates(dates):
+    """Yield (month, summary fields) for completed dates in ascending order"""
+    for month, group in groupby(dates, key=month_start):
+        yield month, summarize_month(month, group)
+
+
+def compose_streak_state(months):
+    """
+    Compose (run, best, last_date, total) from monthly summaries.
+
+    months are (month, completions, longest_run, leading_run, last_run,
+    last_completed_date) tuples in ascending order. A run that reaches the end
+    of a month continues into the next month's leading run when the months
+    are adjacent.
+    """
+    run = best = total = 0
+    last_date = None
+    carry = 0  # Run ending on the last day of the previous month
+
+    for month, completions, longest_run, leading_run, last_run, last_completed_date in months:
+        if last_date is None or (month - last_date).days != 1:
+            carry = 0
+        starting_run = carry + leading_run if leading_run else 0
+
+        # The newest run is the leading run when no gap follows it
+        run = starting_run if last_completed_date.day == leading_run else last_run
+        best = max(best, longest_run, starting_run)
+        total += completions
+        last_date = last_completed_date
+        carry = run if last_completed_date == month_end(month) else 0
+
+    return run, best, last_date, total
+
+
+def composed_streak_states(activity_ids):
+    """Compose (run, best, last_date, total) for several activities from their summaries in one query"""
+    rows = ActivityMonthSummary.objects.filter(
+        activity_id__in=activity_ids
+    ).order_by('activity_id', 'month').values_list('activity_id', 'month', *SUMMARY_FIELDS)
+
+    states = {activity_id: (0, 0, None, 0) for activity_id in activity_ids}
+    for activity_id, group in groupby(rows, key=lambda row: row[0]):
+        states[activity_id] = compose_streak_state(row[1:] for row in group)
+    return states
+
+
+def yearly_totals(months):
+    """{year: {'completions', 'longest_run'}} from ascending monthly summary tuples of one activity"""
+    years = {}
+    for year, group in groupby(months, key=lambda row: row[0].year):
+        run, best, last_date, total = compose_streak_state(group)
+        years[year] = {'completions': total, 'longest_run': best}
+    return years
+
+
+def refresh_month_summaries(pairs):
+    """Recount the summaries of the given (activity_id, month) pairs from their entries"""
+    by_month = defaultdict(set)
+    for activity_id, month in pairs:
+        by_month[month_start(month)].add(activity_id)
+    if not by_month:
+        return
+
+    entries = Q()
+    for month, activity_ids in by_month.items():
+        entries |= Q(activity_id__in=activity_ids, date__gte=month, date__lte=month_end(month))
+
+    rows = StreakEntry.objects.filter(entries, completed=True).order_by(
+        'activity_id', 'date'
+    ).values_list('activity_id', 'date')
+
+    summaries = []
+    for activity_id, group in groupby(rows, key=lambda row: row[0]):
+        for month, fields in summarize_dates(date for _, date in group):
+            summaries.append(ActivityMonthSummary(activity_id=activity_id, month=month, **fields))
+            by_month[month].discard(activity_id)
+
+    # Entry writes call this inside their own transaction, where a savepoint would only add two queries
+    with transaction.atomic(savepoint=False):
+        if summaries:
+            ActivityMonthSummary.objects.bulk_create(
+                summaries,
+                update_conflicts=True,
+                unique_fields=['activity', 'month'],
+                update_fields=list(SUMMARY_FIELDS),
+            )
+        # What is left in by_month are months without completions
+        stale = Q()
+        for month, activity_ids in by_month.items():
+            if activity_ids:
+                stale |= Q(activity_id__in=activity_ids, month=month)
+        if stale:
+            ActivityMonthSummary.objects.filter(stale).delete()
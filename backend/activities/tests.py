@@ -1,3 +1,1141 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import random
+import tempfile
+from collections import namedtuple
+from importlib import import_module
+from io import StringIO
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
+from urllib.parse import urlsplit
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users import urls as user_urls
+from users.localtime import user_today
+
+from . import urls as activity_urls
+from .calendar import build_compact_calendar
+from .email_service import EmailReminderService
+from .email_templates import ReminderRenderer
+from .mailer import deliver
+from .dispatch import DISPATCH_LEASE, claim_dispatches, plan_dispatches
+from .models import Activity, ActivityMonthSummary, DailyUserRollup, ReminderDispatch, StreakEntry
+from .reminders import due_reminders
+from .rollups import RollupDay, apply_rollup_change
+from .scheduling import DAILY, EVENING, MIDDAY, due_users, slot_start
+from .serializers import ActivitySerializer
+from .streaks import EMPTY_STREAK_STATE, calculate_activity_metrics, compute_streak_state, compute_streak_states, get_streak_state, iter_completed_dates
+from .summaries import compose_streak_state, summarize_dates, yearly_totals
+
+User = get_user_model()
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_activities(user, count, days=10):
+    """Create activities with a few days of history each"""
+    today = timezone.now().date()
+    activities = []
+    for index in range(count):
+        activity = Activity.objects.create(user=user, title=f'Activity {index}')
+        for offset in range(days):
+            StreakEntry.objects.create(
+                activity=activity,
+                date=today - timedelta(days=offset),
+                completed=offset % 3 != 1,
+            )
+        activities.append(activity)
+    return activities
+
+
+class QueryCounter:
+    """execute_wrapper hook counting every query, including those after the test client resets connection.queries"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def request_query_count(client, method, url, data=None):
+    """(response, number of queries) of one request, with streamed content consumed"""
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        response = getattr(client, method)(url, data, format='json') if data is not None else getattr(client, method)(url)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+    return response, counter.count
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ActivityListQueryCountTests(TestCase):
+    """List serialization must cost the same number of queries for any page size"""
+
+    list_urls = [
+        '/api/activities/',
+        '/api/activities/search/',
+        '/api/activities/dashboard/',
+        '/api/activities/analytics/?range=90d',
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create(username='bench', clerk_id='user_bench')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        response, count = request_query_count(self.client, 'get', url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return count
+
+    def test_query_count_is_constant_as_activities_grow(self):
+        create_activities(self.user, 1)
+        baseline = {url: self.count_queries(url) for url in self.list_urls}
+
+        create_activities(self.user, 14)
+        for url in self.list_urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), baseline[url])
+
+    def test_recent_entries_match_per_activity_query(self):
+        activities = create_activities(self.user, 3, days=12)
+
+        data = ActivitySerializer(Activity.objects.filter(user=self.user), many=True).data
+        by_id = {item['id']: item['recent_entries'] for item in data}
+
+        for activity in activities:
+            expected = ActivitySerializer(activity).data['recent_entries']
+            self.assertEqual(len(expected), 7)
+            self.assertEqual(by_id[activity.id], expected)
+
+
+class ActivityMetricsTests(TestCase):
+    """Batched activity metrics must match the per-activity properties at a fixed query cost"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='metrics', clerk_id='user_metrics')
+
+    def test_batch_matches_per_activity_properties(self):
+        activities = create_activities(self.user, 6, days=12)
+        for activity, frequency in zip(activities, ('weekly', 'custom')):
+            activity.frequency = frequency
+            activity.target_days = 3
+            activity.save()
+
+        metrics = calculate_activity_metrics([activity.id for activity in activities])
+        for activity in Activity.objects.filter(user=self.user):
+            with self.subTest(activity=activity.title):
+                self.assertEqual(metrics[activity.id], {
+                    'current_streak': activity.current_streak,
+                    'best_streak': activity.best_streak,
+                    'total_completions': activity.total_completions,
+                    'completed_today': activity.completed_today,
+                    'weekly_progress': activity.weekly_progress,
+                })
+
+    def test_query_count_is_independent_of_activity_count(self):
+        for count in (1, 12):
+            with self.subTest(count=count):
+                Activity.objects.filter(user=self.user).delete()
+                create_activities(self.user, count, days=10)
+                activities = list(Activity.objects.filter(user=self.user).select_related('user'))
+                ids = [activity.id for activity in activities]
+
+                with self.assertNumQueries(1):
+                    calculate_activity_metrics(activities)
+                # Instances and owners' timezones are loaded first when only ids are given
+                with self.assertNumQueries(3):
+                    calculate_activity_metrics(ids)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResponseCacheTests(TestCase):
+    """Cached responses carry an ETag that changes with every write to the user's data"""
+
+    url = '/api/activities/dashboard/'
+
+    def setUp(self):
+        self.user = User.objects.create(username='etag', clerk_id='user_etag')
+        self.activity = create_activities(self.user, 1, days=3)[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_matching_if_none_match_returns_304(self):
+        etag = self.etag()
+        for header in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_partial_tags_do_not_match(self):
+        etag = self.etag()
+        for header in (etag[:-2] + '"', f'"x{etag[1:]}', etag.strip('"')):
+            with self.subTest(header=header):
+                self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=header).status_code, 200)
+
+    def test_write_changes_the_etag(self):
+        etag = self.etag()
+        self.client.post(f'/api/activities/complete/{self.activity.id}/', format='json')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_rebuild_commands_change_the_etag(self):
+        commands = [
+            ('rebuild_streaks', lambda: Activity.objects.filter(pk=self.activity.pk).update(streak_best=99)),
+            ('rebuild_month_summaries', lambda: self.activity.month_summaries.all().delete()),
+            ('backfill_daily_rollups', lambda: DailyUserRollup.objects.filter(user=self.user).delete()),
+        ]
+        for command, corrupt in commands:
+            with self.subTest(command=command):
+                corrupt()
+                etag = self.etag()
+                call_command(command, stdout=StringIO())
+                self.assertNotEqual(self.etag(), etag)
+
+
+def calendar_url(days, extra=''):
+    return lambda ctx: f'/api/activities/calendar/?start_date={ctx.today - timedelta(days=days)}&end_date={ctx.today}{extra}'
+
+
+EndpointCase = namedtuple('EndpointCase', ['name', 'method', 'url', 'data', 'limit', 'slack', 'status'])
+
+
+def endpoint(name, method, url, data=None, limit=0, slack=0, status=None):
+    """url and data are functions of the request context (activity, entry, today); status defaults to any success"""
+    return EndpointCase(name, method, url, data, limit, slack, status)
+
+
+# Every route of activities/urls.py and users/urls.py with the most queries it may take
+ENDPOINT_QUERY_LIMITS = [
+    endpoint('activity_list', 'get', lambda ctx: '/api/activities/', limit=5),
+    endpoint('activity_create', 'post', lambda ctx: '/api/activities/', lambda ctx: {'title': 'New habit'}, limit=1),
+    endpoint('activity_detail', 'get', lambda ctx: f'/api/activities/{ctx.activity.id}/', limit=4),
+    endpoint('activity_update', 'patch', lambda ctx: f'/api/activities/{ctx.activity.id}/', lambda ctx: {'title': 'Renamed'}, limit=2),
+    # The entries go in one statement. The user's daily rollups are rebuilt in bulk batches of up
+    # to 1000 rows, which SQLite's parameter limit cuts to 199: none are left after deleting a
+    # sole activity, and a year of history takes two batches here but one on PostgreSQL
+    endpoint('activity_delete', 'delete', lambda ctx: f'/api/activities/{ctx.activity.id}/', limit=12, slack=2),
+    endpoint('search_activities', 'get', lambda ctx: '/api/activities/search/?q=Habit', limit=4),
+    endpoint('entry_list', 'get', lambda ctx: '/api/activities/entries/', limit=2),
+    endpoint(
+        'entry_create', 'post', lambda ctx: '/api/activities/entries/',
+        lambda ctx: {'activity': ctx.activity.id, 'date': str(ctx.today - timedelta(days=400)), 'completed': True},
+        limit=12,
+    ),
+    endpoint('entry_detail', 'get', lambda ctx: f'/api/activities/entries/{ctx.entry.id}/', limit=1),
+    endpoint('entry_update', 'patch', lambda ctx: f'/api/activities/entries/{ctx.entry.id}/', lambda ctx: {'completed': False}, limit=10),
+    endpoint('entry_delete', 'delete', lambda ctx: f'/api/activities/entries/{ctx.entry.id}/', limit=9),
+    endpoint(
+        'bulk_upsert_entries', 'post', lambda ctx: '/api/activities/entries/bulk/',
+        lambda ctx: {'entries': [
+            {'activity': ctx.activity.id, 'date': str(ctx.today - timedelta(days=offset)), 'completed': True}
+            for offset in range(5)
+        ]},
+        limit=14,
+    ),
+    endpoint('export_entries', 'get', lambda ctx: '/api/activities/entries/export/', limit=1),
+    endpoint('dashboard_stats', 'get', lambda ctx: '/api/activities/dashboard/', limit=3),
+    endpoint('calendar_month', 'get', calendar_url(30), limit=2),
+    endpoint('calendar_year', 'get', calendar_url(365), limit=2),
+    endpoint('calendar_year_compact', 'get', calendar_url(365, '&format=compact'), limit=4),
+    endpoint('calendar_year_stream', 'get', calendar_url(365, '&stream=ndjson'), limit=2),
+    # The toggle, one locked read of the streak state and the day's rollup, the month summary recount,
+    # the streak state (recomputed here, as today gets uncompleted), the rollup update, then the week's dates
+    endpoint('complete_activity', 'post', lambda ctx: f'/api/activities/complete/{ctx.activity.id}/', limit=12),
+    endpoint('analytics_30d', 'get', lambda ctx: '/api/activities/analytics/?range=30d', limit=5),
+    endpoint('analytics_365d', 'get', lambda ctx: '/api/activities/analytics/?range=365d', limit=5),
+    endpoint('health_check', 'get', lambda ctx: '/api/activities/health/'),
+    endpoint('debug_auth', 'get', lambda ctx: '/api/activities/debug-auth/', limit=4),
+    endpoint('test_auth', 'get', lambda ctx: '/api/activities/test-auth/'),
+    endpoint('profile', 'get', lambda ctx: '/api/users/profile/'),
+    endpoint('profile_update', 'put', lambda ctx: '/api/users/profile/update/', lambda ctx: {'first_name': 'Quinn', 'timezone': 'UTC'}, limit=1),
+    endpoint('user_stats', 'get', lambda ctx: '/api/users/stats/', limit=2),
+    endpoint('user_profile_stats', 'get', lambda ctx: '/api/users/profile/stats/', limit=2),
+    endpoint('current_user_info', 'get', lambda ctx: '/api/users/current/'),
+    endpoint('all_users_info', 'get', lambda ctx: '/api/users/all/', limit=1),
+    endpoint('request_profiles', 'get', lambda ctx: '/api/users/profiles/'),
+    endpoint('request_profile_download', 'get', lambda ctx: '/api/users/profiles/0123456789abcdef/', status=404),
+]
+
+RequestContext = namedtuple('RequestContext', ['activity', 'entry', 'today'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EndpointQueryCountTests(TestCase):
+    """
+    Every endpoint stays within its pinned query count, and the count does not
+    grow with the number of activities or the days of history.
+    """
+
+    # (activities, days of history)
+    sizes = [(1, 7), (1, 365), (10, 7), (10, 365), (100, 7), (100, 365)]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {}
+        for activity_count, days in cls.sizes:
+            # Staff, for the admin-only user listing
+            user = User.objects.create(
+                username=f'queries{activity_count}x{days}', clerk_id=f'user_queries{activity_count}x{days}', is_staff=True,
+            )
+            today = user_today(user)
+            activities = Activity.objects.bulk_create(
+                Activity(user=user, title=f'Habit {index}') for index in range(activity_count)
+            )
+            StreakEntry.objects.bulk_create(
+                StreakEntry(activity=activity, date=today - timedelta(days=offset), completed=offset % 3 != 2)
+                for activity in activities
+                for offset in range(days)
+            )
+            # bulk_create skips the signals that keep the derived state
+            for command in ('rebuild_streaks', 'rebuild_month_summaries', 'backfill_daily_rollups'):
+                call_command(command, user_id=user.id, stdout=StringIO())
+            cls.users[activity_count, days] = user
+
+    def measure(self, case, user):
+        """Query count of the case's request as user, on a cold cache; the request's writes are rolled back"""
+        client = APIClient()
+        client.force_authenticate(user)
+        activity = user.activities.order_by('id').first()
+        context = RequestContext(activity, activity.streak_entries.order_by('-date').first(), user_today(user))
+
+        cache.clear()
+        savepoint = transaction.savepoint()
+        try:
+            response, count = request_query_count(
+                client, case.method, case.url(context), case.data(context) if case.data else None,
+            )
+        finally:
+            transaction.savepoint_rollback(savepoint)
+        if case.status:
+            self.assertEqual(response.status_code, case.status, case.name)
+        else:
+            self.assertLess(response.status_code, 300, f'{case.name}: {response.status_code}')
+        return count
+
+    def test_query_counts_are_pinned_and_flat(self):
+        for case in ENDPOINT_QUERY_LIMITS:
+            with self.subTest(endpoint=case.name):
+                counts = {size: self.measure(case, user) for size, user in self.users.items()}
+                self.assertLessEqual(max(counts.values()), case.limit, f'{case.name} queries by (activities, days): {counts}')
+                self.assertLessEqual(
+                    max(counts.values()) - min(counts.values()), case.slack,
+                    f'{case.name} queries grow with the data, by (activities, days): {counts}',
+                )
+
+    def test_every_route_is_covered(self):
+        context = RequestContext(Activity(id=1), StreakEntry(id=1), timezone.now().date())
+        covered = {resolve(urlsplit(case.url(context)).path).url_name for case in ENDPOINT_QUERY_LIMITS}
+        routes = {pattern.name for urls in (activity_urls, user_urls) for pattern in urls.urlpatterns}
+        self.assertEqual(routes - covered, set())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CalendarStreamingTests(TestCase):
+    """Streamed calendar responses must match the buffered layout"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='stream', clerk_id='user_stream')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_streamed_days_match_buffered_response(self):
+        create_activities(self.user, 3, days=20)
+        today = timezone.now().date()
+        url = f'/api/activities/calendar/?start_date={today - timedelta(days=30)}&end_date={today}'
+
+        expected = self.client.get(url).json()
+
+        response = self.client.get(f'{url}&stream=json')
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+
+        response = self.client.get(f'{url}&stream=ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+    def test_streaming_has_no_range_cap(self):
+        create_activities(self.user, 1)
+        today = timezone.now().date()
+        url = f'/api/activities/calendar/?start_date={today - timedelta(days=800)}&end_date={today}&stream=ndjson'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 801)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CompactCalendarTests(TestCase):
+    """The compact calendar layout must carry the same data as the day-by-day layout"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='compact', clerk_id='user_compact')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_compact_layout_matches_days(self):
+        activities = create_activities(self.user, 10, days=40)
+        StreakEntry.objects.filter(activity=activities[3], date__gt=timezone.now().date() - timedelta(days=5)).update(note='note')
+        today = timezone.now().date()
+        url = f'/api/activities/calendar/?start_date={today - timedelta(days=30)}&end_date={today}'
+
+        days = self.client.get(url).json()
+        compact = self.client.get(url, HTTP_ACCEPT='application/vnd.streakflow.calendar+json').json()
+        self.assertEqual(self.client.get(f'{url}&format=compact').json(), compact)
+
+        self.assertEqual(compact['totals'], [day['total_completed'] for day in days])
+        for index, activity in enumerate(compact['activities']):
+            bitset = base64.b64decode(activity['completed'])
+            completed = [bool(bitset[day >> 3] >> (day & 7) & 1) for day in range(compact['days'])]
+            self.assertEqual(completed, [day['activities'][index]['completed'] for day in days])
+        self.assertEqual(
+            sorted((note['activity'], note['day'], note['note']) for note in compact['notes']),
+            sorted(
+                (activity['id'], offset, activity['note'])
+                for offset, day in enumerate(days)
+                for activity in day['activities'] if activity['note']
+            ),
+        )
+
+
+    def test_bitsets_are_little_endian_per_day(self):
+        first, second = Activity(id=1, title='A', color='#111111'), Activity(id=2, title='B', color='#222222')
+        start = datetime(2026, 1, 1).date()
+        rows = [
+            (1, start, True, ''),
+            (1, start + timedelta(days=8), True, 'long week'),
+            (1, start + timedelta(days=9), True, ''),
+            (2, start + timedelta(days=3), False, 'skipped'),
+            (3, start, True, 'not listed'),
+        ]
+
+        compact = build_compact_calendar([first, second], rows, start, start + timedelta(days=9))
+        self.assertEqual(compact['days'], 10)
+        self.assertEqual(compact['total_activities'], 2)
+        # Day 0 is bit 0 of the first byte, days 8 and 9 are bits 0 and 1 of the second
+        self.assertEqual(base64.b64decode(compact['activities'][0]['completed']), bytes([0b00000001, 0b00000011]))
+        self.assertEqual(base64.b64decode(compact['activities'][1]['completed']), bytes(2))
+        self.assertEqual(compact['totals'], [1, 0, 0, 0, 0, 0, 0, 0, 1, 1])
+        self.assertEqual(compact['notes'], [
+            {'activity': 1, 'day': 8, 'note': 'long week'},
+            {'activity': 2, 'day': 3, 'note': 'skipped'},
+        ])
+        self.assertEqual(
+            [(activity['id'], activity['title'], activity['color']) for activity in compact['activities']],
+            [(1, 'A', '#111111'), (2, 'B', '#222222')],
+        )
+
+    def test_layouts_are_negotiated_and_cached_apart(self):
+        create_activities(self.user, 2, days=5)
+        today = timezone.now().date()
+        url = f'/api/activities/calendar/?start_date={today - timedelta(days=30)}&end_date={today}'
+
+        days = self.client.get(url)
+        compact = self.client.get(url, HTTP_ACCEPT='application/vnd.streakflow.calendar+json')
+        days_again = self.client.get(url)
+
+        self.assertTrue(days['Content-Type'].startswith('application/json'))
+        self.assertTrue(compact['Content-Type'].startswith('application/vnd.streakflow.calendar+json'))
+        self.assertIsInstance(days.json(), list)
+        self.assertEqual(compact.json()['days'], 31)
+        self.assertNotEqual(days['ETag'], compact['ETag'])
+        self.assertEqual(days_again.json(), days.json())
+
+    def test_range_limit_applies_to_the_compact_layout(self):
+        today = timezone.now().date()
+        url = f'/api/activities/calendar/?start_date={today - timedelta(days=366)}&end_date={today}&format=compact'
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkEntryUpsertTests(TestCase):
+    """Bulk upserts must leave the same entries and streak state as one-by-one writes"""
+
+    url = '/api/activities/entries/bulk/'
+
+    def setUp(self):
+        self.user = User.objects.create(username='bulk', clerk_id='user_bulk')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_upsert_updates_entries_and_streak_state(self):
+        activity = create_activities(self.user, 1, days=3)[0]
+        StreakEntry.objects.filter(activity=activity).update(note='kept')
+        today = timezone.now().date()
+        items = [
+            {'activity': activity.id, 'date': str(today - timedelta(days=offset)), 'completed': True}
+            for offset in range(10)
+        ]
+        items.append({'activity': activity.id, 'date': str(today - timedelta(days=5)), 'completed': False, 'note': 'rest'})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'entries': items}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['saved'], 10)
+        self.assertLessEqual(len(queries), 20)
+
+        self.assertEqual(StreakEntry.objects.filter(activity=activity).count(), 10)
+        self.assertEqual(StreakEntry.objects.get(activity=activity, date=today).note, 'kept')
+        self.assertEqual(StreakEntry.objects.get(activity=activity, date=today - timedelta(days=5)).note, 'rest')
+
+        activity.refresh_from_db()
+        self.assertEqual(
+            (activity.current_streak, activity.best_streak, activity.total_completions),
+            (5, 5, 9),
+        )
+        self.assertEqual(response.json()['activities'][0]['current_streak'], 5)
+
+    def test_rejects_other_users_activities(self):
+        other = User.objects.create(username='other', clerk_id='user_other')
+        activity = create_activities(other, 1, days=1)[0]
+        today = timezone.now().date()
+
+        response = self.client.post(self.url, [
+            {'activity': activity.id, 'date': str(today), 'completed': False}
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(StreakEntry.objects.get(activity=activity, date=today).completed)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CompletionToggleTests(TestCase):
+    """Toggling today's completion flips one row and returns the refreshed metrics"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='toggle', clerk_id='user_toggle')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_toggle_round_trip(self):
+        activity = Activity.objects.create(user=self.user, title='Read')
+        StreakEntry.objects.create(activity=activity, date=timezone.now().date() - timedelta(days=1), completed=True)
+        url = f'/api/activities/complete/{activity.id}/'
+
+        response = self.client.post(url, {'note': 'chapter 3'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertTrue(data['entry']['completed'])
+        self.assertEqual(data['activity']['current_streak'], 2)
+        self.assertTrue(data['activity']['completed_today'])
+        # Only the metrics, which the client merges into its copy of the activity
+        self.assertNotIn('title', data['activity'])
+
+        data = self.client.post(url, format='json').json()
+        self.assertFalse(data['entry']['completed'])
+        self.assertEqual(data['activity']['current_streak'], 0)
+        self.assertEqual(data['activity']['total_completions'], 1)
+
+        entry = StreakEntry.objects.get(activity=activity, date=timezone.now().date())
+        self.assertFalse(entry.completed)
+        self.assertEqual(entry.note, 'chapter 3')
+        activity.refresh_from_db()
+        self.assertEqual((activity.best_streak, activity.total_completions), (1, 1))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AnalyticsTests(TestCase):
+    """Analytics totals must agree with the per-activity properties"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='analytics', clerk_id='user_analytics')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_totals_match_activity_properties(self):
+        create_activities(self.user, 4, days=12)
+        activities = list(Activity.objects.filter(user=self.user))
+        Activity.objects.filter(pk=activities[1].pk).update(category='learning')
+
+        response = self.client.get('/api/activities/analytics/?range=7d')
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+
+        self.assertEqual(data['total_activities'], 4)
+        self.assertEqual(data['total_completions'], sum(a.total_completions for a in activities))
+        self.assertEqual(data['category_breakdown']['Learning']['total_streak'], activities[1].current_streak)
+        self.assertEqual(len(data['timeline']), 7)
+        self.assertEqual(sum(year['completions'] for year in data['yearly']), data['total_completions'])
+        self.assertEqual(
+            sum(day['completions'] for day in data['weekday_completions']),
+            StreakEntry.objects.filter(
+                activity__user=self.user,
+                completed=True,
+                date__gt=timezone.now().date() - timedelta(days=7),
+            ).count(),
+        )
+
+    def test_rejects_unknown_range(self):
+        response = self.client.get('/api/activities/analytics/?range=2y')
+        self.assertEqual(response.status_code, 400)
+
+
+class StoredStreakStateTests(TestCase):
+    """Entry writes keep the stored streak state of their activity up to date"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='stored', clerk_id='user_stored')
+        self.activity = Activity.objects.create(user=self.user, title='Run')
+        self.today = timezone.now().date()
+
+    def complete(self, *offsets):
+        for offset in offsets:
+            StreakEntry.objects.create(activity=self.activity, date=self.today - timedelta(days=offset), completed=True)
+        self.activity.refresh_from_db()
+        return get_streak_state(self.activity)
+
+    def test_extending_the_run(self):
+        self.complete(2, 1)
+        self.assertEqual(self.complete(0), (3, 3, self.today, 3))
+        self.assertEqual(self.activity.current_streak, 3)
+
+    def test_restarting_after_a_gap(self):
+        self.complete(5, 4, 3)
+        self.assertEqual(self.complete(1), (1, 3, self.today - timedelta(days=1), 4))
+        self.assertEqual(self.complete(0), (2, 3, self.today, 5))
+
+    def test_backfilling_a_past_date(self):
+        self.complete(4, 2, 1, 0)
+        # Filling the gap joins both runs
+        self.assertEqual(self.complete(3), (5, 5, self.today, 5))
+        # An older date outside the run only changes the total
+        self.assertEqual(self.complete(10), (5, 5, self.today, 6))
+
+    def test_migration_backfill_matches_the_walk(self):
+        migration = import_module('activities.migrations.0005_activity_streak_state')
+        self.complete(9, 8, 7, 3, 2, 0)
+        expected = get_streak_state(self.activity)
+        Activity.objects.filter(pk=self.activity.pk).update(
+            streak_run=0, streak_best=0, last_completed_date=None, completion_count=0,
+        )
+
+        migration.backfill_streak_state(django_apps, None)
+        self.activity.refresh_from_db()
+        self.assertEqual(get_streak_state(self.activity), expected)
+        self.assertEqual(expected, (1, 3, self.today, 6))
+
+
+class StreakComputationTests(TestCase):
+    """Streaks computed from the entries must match the stored properties on random histories"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='streaks', clerk_id='user_streaks')
+        self.today = timezone.now().date()
+
+    def create_random_histories(self, seed, count=8, days=60):
+        rng = random.Random(seed)
+        activities = []
+        for index in range(count):
+            activity = Activity.objects.create(user=self.user, title=f'Random {index}')
+            density = rng.random()
+            for offset in rng.sample(range(days), rng.randint(0, days)):
+                StreakEntry.objects.create(
+                    activity=activity,
+                    date=self.today - timedelta(days=offset),
+                    completed=rng.random() < density,
+                )
+            # Flip and delete a few entries so the stored state goes through recomputes
+            entries = list(activity.streak_entries.all())
+            for entry in rng.sample(entries, min(3, len(entries))):
+                if rng.random() < 0.5:
+                    entry.delete()
+                else:
+                    entry.completed = not entry.completed
+                    entry.save()
+            activities.append(activity)
+        return activities
+
+    def test_recompute_matches_stored_state(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                activities = self.create_random_histories(seed)
+                states = compute_streak_states([activity.id for activity in activities])
+
+                for activity in activities:
+                    activity.refresh_from_db()
+                    self.assertEqual(states[activity.id], get_streak_state(activity))
+
+    def test_states_of_activities_without_entries_are_empty(self):
+        activity = Activity.objects.create(user=self.user, title='Empty')
+        StreakEntry.objects.create(activity=activity, date=self.today, completed=False)
+        self.assertEqual(compute_streak_states([activity.id]), {activity.id: EMPTY_STREAK_STATE})
+        self.assertEqual(compute_streak_states([]), {})
+
+    @skipUnless(connection.vendor == 'postgresql', 'gaps-and-islands query runs on PostgreSQL only')
+    def test_sql_matches_python(self):
+        activities = self.create_random_histories(seed=42, count=20, days=120)
+        activity_ids = [activity.id for activity in activities]
+
+        expected = dict.fromkeys(activity_ids, compute_streak_state([]))
+        for activity_id, dates in iter_completed_dates(activity_ids):
+            expected[activity_id] = compute_streak_state(dates)
+
+        self.assertEqual(compute_streak_states(activity_ids), expected)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DailyRollupTests(TestCase):
+    """Daily rollups must match a recount of the entries after any kind of write"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='rollups', clerk_id='user_rollups')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rollups_follow_entry_and_activity_writes(self):
+        activities = create_activities(self.user, 4, days=15)
+        today = timezone.now().date()
+
+        self.client.post(f'/api/activities/complete/{activities[0].id}/', format='json')
+        self.client.post('/api/activities/entries/bulk/', [
+            {'activity': activities[2].id, 'date': str(today - timedelta(days=offset)), 'completed': True}
+            for offset in range(20)
+        ], format='json')
+        StreakEntry.objects.filter(activity=activities[3]).first().delete()
+        self.client.delete(f'/api/activities/{activities[1].id}/')
+        self.assertFalse(StreakEntry.objects.filter(activity_id=activities[1].id).exists())
+
+        call_command('backfill_daily_rollups', check=True, stdout=StringIO())
+
+        rollup = DailyUserRollup.objects.get(user=self.user, date=today - timedelta(days=18))
+        self.assertEqual((rollup.completed_count, rollup.active_activity_count), (1, 1))
+
+    def test_toggles_adjust_the_day_in_place(self):
+        # Nine activities, so the bitmap spans two bytes
+        activities = create_activities(self.user, 9, days=2)
+        yesterday = timezone.now().date() - timedelta(days=1)
+
+        for activity in activities[::2] + activities[7:]:
+            self.client.post(f'/api/activities/complete/{activity.id}/', format='json')
+        call_command('backfill_daily_rollups', check=True, stdout=StringIO())
+
+        # A read that another write overtook falls back to a recount of the date
+        StreakEntry.objects.filter(activity=activities[0], date=yesterday).update(completed=True)
+        apply_rollup_change(
+            self.user.id, yesterday, 0, len(activities), RollupDay(0, 0, b''), completed=True, added=0,
+        )
+        call_command('backfill_daily_rollups', check=True, stdout=StringIO())
+
+    def test_entry_writes_keep_rollups_and_summaries(self):
+        activities = create_activities(self.user, 3, days=4)
+        today = timezone.now().date()
+        entries_url = '/api/activities/entries/'
+
+        # A date without a rollup yet, then a second activity on it
+        for activity in activities[1:]:
+            response = self.client.post(entries_url, {
+                'activity': activity.id, 'date': str(today - timedelta(days=30)), 'completed': True,
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+        entry = StreakEntry.objects.get(activity=activities[0], date=today - timedelta(days=1))
+        self.client.patch(f'{entries_url}{entry.id}/', {'completed': True, 'note': 'late'}, format='json')
+        self.client.patch(f'{entries_url}{entry.id}/', {'note': 'edited'}, format='json')
+        # Not completed, so only the day's rollup changes
+        entry = StreakEntry.objects.get(activity=activities[2], date=today - timedelta(days=1))
+        self.client.delete(f'{entries_url}{entry.id}/')
+
+        for command in ('backfill_daily_rollups', 'rebuild_month_summaries', 'rebuild_streaks'):
+            call_command(command, check=True, stdout=StringIO())
+
+    def test_migration_backfill_matches_a_recount(self):
+        migration = import_module('activities.migrations.0006_daily_user_rollup')
+        create_activities(self.user, 10, days=5)
+        DailyUserRollup.objects.filter(user=self.user).delete()
+
+        migration.backfill_rollups(django_apps, None)
+        call_command('backfill_daily_rollups', check=True, stdout=StringIO())
+
+    def test_backfill_rebuilds_rollups(self):
+        create_activities(self.user, 2)
+        DailyUserRollup.objects.filter(user=self.user).update(completed_count=0)
+
+        with self.assertRaises(CommandError):
+            call_command('backfill_daily_rollups', check=True, stdout=StringIO())
+        call_command('backfill_daily_rollups', stdout=StringIO())
+        call_command('backfill_daily_rollups', check=True, stdout=StringIO())
+
+
+class MonthSummaryTests(TestCase):
+    """Streaks composed from monthly summaries must match a raw recompute"""
+
+    def test_composition_matches_raw_dates(self):
+        rng = random.Random(7)
+        start = timezone.now().date() - timedelta(days=1500)
+        for density in (0.2, 0.6, 0.9, 0.98, 1.0):
+            with self.subTest(density=density):
+                dates = [start + timedelta(days=offset) for offset in range(1500) if rng.random() < density]
+                months = [
+                    (month, fields['completions'], fields['longest_run'], fields['leading_run'],
+                     fields['last_run'], fields['last_completed_date'])
+                    for month, fields in summarize_dates(dates)
+                ]
+                self.assertEqual(compose_streak_state(months), tuple(compute_streak_state(dates)))
+
+                years = yearly_totals(months)
+                for year, totals in years.items():
+                    year_dates = [date for date in dates if date.year == year]
+                    self.assertEqual(totals['completions'], len(year_dates))
+                    self.assertEqual(totals['longest_run'], compute_streak_state(year_dates).best)
+
+    def test_summaries_follow_writes(self):
+        user = User.objects.create(username='months', clerk_id='user_months')
+        activity = Activity.objects.create(user=user, title='Run')
+        today = timezone.now().date()
+        for offset in range(70):
+            StreakEntry.objects.create(activity=activity, date=today - timedelta(days=offset), completed=offset % 11 != 4)
+        StreakEntry.objects.filter(activity=activity, date=today - timedelta(days=40)).first().delete()
+        entry = StreakEntry.objects.get(activity=activity, date=today - timedelta(days=15))
+        entry.completed = not entry.completed
+        entry.save()
+
+        call_command('rebuild_month_summaries', check=True, stdout=StringIO())
+        call_command('rebuild_streaks', check=True, stdout=StringIO())
+
+        activity.month_summaries.update(completions=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_month_summaries', check=True, stdout=StringIO())
+        call_command('rebuild_month_summaries', stdout=StringIO())
+        call_command('rebuild_month_summaries', check=True, stdout=StringIO())
+
+    def test_migration_backfill_matches_the_summaries(self):
+        migration = import_module('activities.migrations.0007_activity_month_summary')
+        user = User.objects.create(username='frozen', clerk_id='user_frozen')
+        create_activities(user, 2, days=75)
+        expected = list(ActivityMonthSummary.objects.order_by('activity_id', 'month').values())
+        ActivityMonthSummary.objects.all().delete()
+
+        migration.backfill_month_summaries(django_apps, None)
+        stored = list(ActivityMonthSummary.objects.order_by('activity_id', 'month').values())
+        self.assertEqual([dict(row, id=None) for row in stored], [dict(row, id=None) for row in expected])
+
+
+class ReminderSchedulingTests(TestCase):
+    """Each slot selects only the users whose local time just reached a reminder"""
+
+    def setUp(self):
+        self.utc = User.objects.create(username='utc', clerk_id='user_utc', email='utc@example.com')
+        self.auckland = User.objects.create(
+            username='auckland', clerk_id='user_auckland', timezone='Pacific/Auckland', reminder_time=time(1, 10),
+        )
+        self.honolulu = User.objects.create(username='honolulu', clerk_id='user_honolulu', timezone='Pacific/Honolulu')
+        User.objects.create(username='muted', clerk_id='user_muted', email_notifications=False)
+
+    def due(self, kind, now):
+        with CaptureQueriesContext(connection) as queries:
+            due = {user.username: user_today(user, now).isoformat() for user in due_users(kind, now)}
+        self.assertLessEqual(len(queries), 1)
+        return due
+
+    def test_slot_start(self):
+        now = datetime(2026, 3, 10, 12, 14, 59, tzinfo=dt_timezone.utc)
+        self.assertEqual(slot_start(now), datetime(2026, 3, 10, 12, 0, tzinfo=dt_timezone.utc))
+
+    def test_midday_and_evening_by_zone(self):
+        # 12:07 UTC is 01:07 on the 11th in Auckland (UTC+13) and 02:07 in Honolulu
+        now = datetime(2026, 3, 10, 12, 7, tzinfo=dt_timezone.utc)
+        self.assertEqual(self.due(MIDDAY, now), {'utc': '2026-03-10'})
+        self.assertEqual(self.due(EVENING, datetime(2026, 3, 10, 7, 0, tzinfo=dt_timezone.utc)), {'auckland': '2026-03-10'})
+        self.assertEqual(self.due(EVENING, datetime(2026, 3, 10, 7, 15, tzinfo=dt_timezone.utc)), {})
+
+    def test_personal_reminder_time(self):
+        now = datetime(2026, 3, 10, 12, 7, tzinfo=dt_timezone.utc)
+        self.assertEqual(self.due(DAILY, now), {'auckland': '2026-03-11'})
+        # 09:00 in Honolulu
+        self.assertEqual(self.due(DAILY, datetime(2026, 3, 10, 19, 0, tzinfo=dt_timezone.utc)), {'honolulu': '2026-03-10'})
+
+    def test_unknown_zones_are_scheduled_as_utc(self):
+        User.objects.create(username='mars', clerk_id='user_mars', timezone='Mars/Olympus_Mons', reminder_time=time(12, 5))
+        now = datetime(2026, 3, 10, 12, 7, tzinfo=dt_timezone.utc)
+        self.assertEqual(self.due(MIDDAY, now), {'utc': '2026-03-10', 'mars': '2026-03-10'})
+        self.assertEqual(self.due(DAILY, now), {'auckland': '2026-03-11', 'mars': '2026-03-10'})
+        self.assertEqual(self.due(EVENING, datetime(2026, 3, 10, 20, 0, tzinfo=dt_timezone.utc)), {'utc': '2026-03-10', 'mars': '2026-03-10'})
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class ReminderEligibilityTests(TestCase):
+    """Reminder eligibility is worked out for all users at once, on each user's local date"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.users = []
+        for index, zone in enumerate(['UTC', 'Pacific/Kiritimati', 'Pacific/Honolulu', 'UTC']):
+            user = User.objects.create(
+                username=f'remind{index}', clerk_id=f'user_remind{index}', email=f'remind{index}@example.com', timezone=zone,
+            )
+            today = user_today(user, self.now)
+            for number in range(3):
+                activity = Activity.objects.create(user=user, title=f'Habit {index}.{number}')
+                # User 0 finished everything, user 1 one activity, user 2 nothing
+                done = index == 0 or (index == 1 and number == 0)
+                StreakEntry.objects.create(activity=activity, date=today, completed=done)
+                # Yesterday's completions never count for today
+                StreakEntry.objects.create(activity=activity, date=today - timedelta(days=1), completed=True)
+            self.users.append(user)
+        # User 3 has no activities
+        self.users[3].activities.all().delete()
+
+    def due(self, kind):
+        with self.assertNumQueries(2):
+            return {
+                candidate.user.username: sorted(activity.title for activity in candidate.incomplete)
+                for candidate in due_reminders(kind, User.objects.all(), self.now)
+            }
+
+    def test_candidates_per_local_date(self):
+        self.assertEqual(self.due(EVENING), {
+            'remind1': ['Habit 1.1', 'Habit 1.2'],
+            'remind2': ['Habit 2.0', 'Habit 2.1', 'Habit 2.2'],
+        })
+        self.assertEqual(list(self.due(MIDDAY)), ['remind2'])
+
+    def test_dry_run_and_send_use_the_same_query(self):
+        out = StringIO()
+        call_command('send_evening_reminders', dry_run=True, stdout=out)
+        self.assertIn('Would send 2 evening reminders', out.getvalue())
+        self.assertIn('remind1@example.com (remind1) - 2 incomplete activities: Habit 1.2, Habit 1.1', out.getvalue())
+
+        self.assertEqual(EmailReminderService.send_evening_reminders_to_all_users(), 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['remind1@example.com', 'remind2@example.com'])
+
+
+class FlakyEmailBackend(LocmemEmailBackend):
+    """Locmem backend that sends in order, like SMTP, and fails the first attempt of messages whose subject starts with 'flaky'"""
+
+    connections = 0
+    calls = 0
+    failed = set()
+
+    def __init__(self, *args, **kwargs):
+        FlakyEmailBackend.connections += 1
+        super().__init__(*args, **kwargs)
+
+    def send_messages(self, messages):
+        FlakyEmailBackend.calls += 1
+        sent = 0
+        for message in messages:
+            if message.subject.startswith('flaky') and message.subject not in self.failed:
+                self.failed.add(message.subject)
+                raise ConnectionError('connection reset')
+            sent += super().send_messages([message])
+        return sent
+
+
+@override_settings(EMAIL_BACKEND='activities.tests.FlakyEmailBackend')
+class ReminderDeliveryTests(TestCase):
+    """Reminders are sent in chunks over reused connections with per-message retry"""
+
+    def setUp(self):
+        FlakyEmailBackend.connections = 0
+        FlakyEmailBackend.calls = 0
+        FlakyEmailBackend.failed = set()
+
+    def messages(self, count, subject='reminder'):
+        return (EmailMessage(f'{subject} {index}', 'body', 'from@example.com', [f'user{index}@example.com']) for index in range(count))
+
+    def test_chunks_share_connections(self):
+        self.assertEqual(deliver(self.messages(250), batch_size=50, workers=3, rate=0), 250)
+        self.assertEqual(len(mail.outbox), 250)
+        self.assertEqual(len({message.to[0] for message in mail.outbox}), 250)
+        # One connection and one send_messages() call per chunk rather than per message
+        self.assertEqual(FlakyEmailBackend.connections, 5)
+        self.assertEqual(FlakyEmailBackend.calls, 5)
+
+    def test_failed_messages_are_retried(self):
+        messages = list(self.messages(10)) + list(self.messages(3, subject='flaky'))
+        self.assertEqual(deliver(messages, batch_size=4, workers=2, rate=0, backoff=0), 13)
+        # Only the rest of a chunk is sent again after a failure, so nobody gets a message twice
+        self.assertEqual(sorted(message.subject for message in mail.outbox), sorted(message.subject for message in messages))
+        # Four chunks, plus one call per failure
+        self.assertEqual(FlakyEmailBackend.calls, 7)
+
+    def test_gives_up_after_retries(self):
+        with self.assertLogs('activities.mailer', 'ERROR'):
+            self.assertEqual(deliver(self.messages(3, subject='flaky'), retries=0, rate=0, backoff=0), 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+
+@override_settings(FRONTEND_URL='https://app.example.com')
+class ReminderRenderingTests(TestCase):
+    """Reminder layouts are rendered once per renderer, bodies once per recipient"""
+
+    def test_renders_layout_once(self):
+        renderer = ReminderRenderer('evening_reminder')
+        ana = User(username='ana', first_name='Ana')
+        bo = User(username='bo')
+        activities = [Activity(user=ana, title='Read & write')]
+
+        with mock.patch('django.template.base.Template.render', return_value='') as render:
+            renderer.render({'user': ana, 'incomplete_activities': activities})
+            # Only the text and html bodies
+            self.assertEqual(render.call_count, 2)
+
+        plain, html = renderer.render({'user': ana, 'incomplete_activities': activities})
+        self.assertIn('Hey Ana!', plain)
+        self.assertIn('Read &amp; write - 0 day streak', html)
+        self.assertIn('https://app.example.com/dashboard', html)
+        self.assertTrue(html.rstrip().endswith('</html>'))
+        plain, html = renderer.render({'user': bo, 'incomplete_activities': []})
+        self.assertIn('Hey bo!', plain)
+        self.assertNotIn('Ana', html)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_email_rendering', recipients=20, type='midday', stdout=out)
+        self.assertIn('per 10k recipients', out.getvalue())
+
+
+class WorkerDied(BaseException):
+    """Stands in for the process going away mid-send"""
+
+
+class RejectingEmailBackend(LocmemEmailBackend):
+    """Locmem backend that refuses messages to the addresses in `rejected` and dies on those in `fatal`"""
+
+    rejected = set()
+    fatal = set()
+
+    def send_messages(self, messages):
+        sent = 0
+        for message in messages:
+            if set(message.to) & self.fatal:
+                raise WorkerDied()
+            if set(message.to) & self.rejected:
+                raise ConnectionError('mailbox unavailable')
+            sent += super().send_messages([message])
+        return sent
+
+
+@override_settings(
+    EMAIL_BACKEND='activities.tests.RejectingEmailBackend',
+    REMINDER_EMAIL={'RETRIES': 0, 'RATE_PER_SECOND': 0},
+)
+class ReminderDispatchTests(TestCase):
+    """Reminder runs go through the ledger, so reruns and resumed runs never send twice"""
+
+    def setUp(self):
+        RejectingEmailBackend.rejected = set()
+        RejectingEmailBackend.fatal = set()
+        self.users = []
+        for index in range(3):
+            user = User.objects.create(username=f'ledger{index}', clerk_id=f'user_ledger{index}', email=f'ledger{index}@example.com')
+            Activity.objects.create(user=user, title='Stretch')
+            self.users.append(user)
+
+    def statuses(self):
+        return dict(ReminderDispatch.objects.values_list('user__username', 'status'))
+
+    def test_rerun_sends_once(self):
+        self.assertEqual(EmailReminderService.send_evening_reminders_to_all_users(), 3)
+        self.assertEqual(EmailReminderService.send_evening_reminders_to_all_users(), 0)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(set(self.statuses().values()), {ReminderDispatch.STATUS_SENT})
+        # Another kind has its own ledger rows
+        self.assertEqual(EmailReminderService.send_midday_reminders_to_all_users(), 3)
+
+    def test_resume_after_crash(self):
+        self.assertEqual(plan_dispatches(EVENING, User.objects.all()), 3)
+        self.assertEqual(plan_dispatches(EVENING, User.objects.all()), 3)
+        self.assertEqual(ReminderDispatch.objects.count(), 3)
+
+        # A worker claims two rows and dies before sending them
+        token, claimed = claim_dispatches(EVENING, batch_size=2)
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(EmailReminderService.resume_reminders(EVENING), 1)
+
+        # Its lease runs out and the rows are claimed again
+        ReminderDispatch.objects.filter(claimed_by=token).update(claimed_at=timezone.now() - DISPATCH_LEASE - timedelta(seconds=1))
+        out = StringIO()
+        call_command('send_evening_reminders', resume=True, stdout=out)
+        self.assertIn('Successfully sent 2 evening reminders', out.getvalue())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(len({message.to[0] for message in mail.outbox}), 3)
+
+    @override_settings(REMINDER_EMAIL={'RETRIES': 0, 'RATE_PER_SECOND': 0, 'BATCH_SIZE': 1, 'WORKERS': 1})
+    def test_delivered_chunks_are_marked_before_the_batch_ends(self):
+        RejectingEmailBackend.fatal = {'ledger2@example.com'}
+        with self.assertRaises(WorkerDied):
+            EmailReminderService.send_evening_reminders_to_all_users()
+        self.assertEqual(self.statuses(), {
+            'ledger0': ReminderDispatch.STATUS_SENT,
+            'ledger1': ReminderDispatch.STATUS_SENT,
+            'ledger2': ReminderDispatch.STATUS_CLAIMED,
+        })
+
+        # Only the unfinished row is claimed again, and only once its lease has expired
+        RejectingEmailBackend.fatal = set()
+        self.assertEqual(claim_dispatches(EVENING)[1], [])
+        token, claimed = claim_dispatches(EVENING, now=timezone.now() + DISPATCH_LEASE + timedelta(seconds=1))
+        self.assertEqual([dispatch.user_id for dispatch in claimed], [self.users[2].id])
+
+    def test_rows_no_longer_due_are_skipped(self):
+        plan_dispatches(EVENING, User.objects.all())
+        activity = self.users[0].activities.get()
+        StreakEntry.objects.create(activity=activity, date=user_today(self.users[0]), completed=True)
+
+        self.assertEqual(EmailReminderService.resume_reminders(EVENING), 2)
+        self.assertEqual(self.statuses()['ledger0'], ReminderDispatch.STATUS_SKIPPED)
+
+    def test_failed_rows_stop_after_max_attempts(self):
+        RejectingEmailBackend.rejected = {'ledger1@example.com'}
+        with self.assertLogs('activities.mailer', 'ERROR'):
+            self.assertEqual(EmailReminderService.send_evening_reminders_to_all_users(), 2)
+        failed = ReminderDispatch.objects.get(user=self.users[1])
+        self.assertEqual((failed.status, failed.attempts), (ReminderDispatch.STATUS_FAILED, 3))
+
+        RejectingEmailBackend.rejected = set()
+        self.assertEqual(EmailReminderService.resume_reminders(EVENING), 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BenchmarkToolsTests(TestCase):
+    """Synthetic data matches what the signals would store, and the API benchmark writes comparable JSON"""
+
+    def test_generated_data_and_benchmark_report(self):
+        call_command('generate_synthetic_data', users=2, activities=3, days=90, seed=1, stdout=StringIO())
+
+        user = User.objects.get(username='synthetic0')
+        self.assertEqual(user.activities.count(), 3)
+        self.assertTrue(StreakEntry.objects.filter(activity__user=user, completed=True).exists())
+        # The derived state written alongside the entries needs no correction
+        for command in ('rebuild_streaks', 'rebuild_month_summaries', 'backfill_daily_rollups'):
+            call_command(command, check=True, stdout=StringIO())
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmark.json')
+            call_command(
+                'benchmark_api', iterations=2, warmup=0, output=output,
+                endpoint=['dashboard_stats', 'calendar_entries_month'], stdout=StringIO(),
+            )
+            with open(output) as handle:
+                report = json.load(handle)
+
+        self.assertEqual(report['user']['username'], 'synthetic0')
+        self.assertEqual(set(report['endpoints']), {'dashboard_stats', 'calendar_entries_month'})
+        result = report['endpoints']['dashboard_stats']
+        self.assertGreater(result['queries'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+        self.assertGreater(result['peak_memory_kib'], 0)
@@ -13,6 +13,8 @@ urlpatterns = [
     # Streak Entries
     path('entries/', views.StreakEntryListView.as_view(), name='entry_list'),
     path('entries/<int:pk>/', views.StreakEntryDetailView.as_view(), name='entry_detail'),
+    path('entries/bulk/', views.bulk_upsert_streak_entries, name='bulk_upsert_entries'),
+    path('entries/export/', views.export_entries, name='export_entries'),
     
     # Dashboard and Calendar
     path('dashboard/', views.dashboard_stats, name='dashboard_stats'),
@@ -1,20 +1,36 @@
 from rest_framework import status, generics, permissions, filters
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, renderer_classes
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.utils import timezone
-from datetime import datetime, timedelta
-from django.db.models import Q, Count, Avg
+from datetime import datetime
+from django.db import transaction
+from django.db.models import Q
 from django.contrib.auth import get_user_model
-from django.db import connection
+from django.http import StreamingHttpResponse
 import logging
 from users.authentication import ClerkAuthentication
+from users.localtime import user_today
 from users.utils import get_or_create_user_with_clerk_data
 
 logger = logging.getLogger(__name__)
 
 from .models import Activity, StreakEntry
+from .analytics import ANALYTICS_RANGES, DEFAULT_ANALYTICS_RANGE, build_analytics
+from .cache import cached_user_response
+from .entries import bulk_upsert_entries, delete_activity_entries, toggle_entry
+from .calendar import (
+    STREAM_CHUNK_SIZE,
+    build_calendar_days,
+    build_compact_calendar,
+    calendar_entry_rows,
+    compact_calendar_rows,
+    encode_ndjson,
+    stream_calendar_days,
+)
+from .renderers import CompactCalendarRenderer
+from .streaks import attach_activity_metrics, calculate_activity_metrics
 from .serializers import (
     ActivitySerializer,
     ActivityCreateSerializer,
@@ -22,12 +38,18 @@ from .serializers import (
     StreakEntrySerializer,
     StreakEntryCreateSerializer,
     StreakEntryUpdateSerializer,
+    StreakEntryBulkSerializer,
     DashboardStatsSerializer,
     CalendarEntrySerializer
 )
 
 User = get_user_model()
 
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
 
 class ActivityListView(generics.ListCreateAPIView):
     """List and create activities with Clerk authentication"""
@@ -65,6 +87,11 @@ class ActivityDetailView(generics.RetrieveUpdateDestroyAPIView):
         if self.request.method in ['PUT', 'PATCH']:
             return ActivityUpdateSerializer
         return ActivitySerializer
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            delete_activity_entries(instance.id)
+            instance.delete()
 
 
 class StreakEntryListView(generics.ListCreateAPIView):
@@ -103,48 +130,42 @@ class StreakEntryDetailView(generics.RetrieveUpdateDestroyAPIView):
         return StreakEntrySerializer
 
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@authentication_classes([ClerkAuthentication])
+def bulk_upsert_streak_entries(request):
+    """Create or update many streak entries in one request with Clerk authentication"""
+    user = get_or_create_user_with_clerk_data(request.user)
+    data = {'entries': request.data} if isinstance(request.data, list) else request.data
+    serializer = StreakEntryBulkSerializer(data=data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+    
+    saved, states = bulk_upsert_entries(user.id, serializer.validated_data['entries'])
+    metrics = calculate_activity_metrics(list(states))
+    
+    return Response({
+        'saved': saved,
+        'activities': [{'id': activity_id, **values} for activity_id, values in metrics.items()]
+    })
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 @authentication_classes([ClerkAuthentication])
+@cached_user_response('dashboard_stats')
 def dashboard_stats(request):
     """Get dashboard statistics with Clerk authentication"""
-    clerk_id = request.user.clerk_id
-    user, created = User.objects.get_or_create(
-        clerk_id=clerk_id,
-        defaults={
-            'username': request.user.username or request.user.email,
-            'email': request.user.email,
-            'first_name': request.user.first_name or '',
-            'last_name': request.user.last_name or '',
-        }
-    )
-    
-    # Optimize query with select_related and limit to prevent memory issues
-    activities = user.activities.all().select_related('user')[:50]  # Limit to 50 activities
-    
-    # Calculate stats efficiently
-    total_activities = activities.count()
-    active_streaks = 0
-    completed_today = 0
-    total_streak = 0
-    total_weekly_progress = 0
-    
-    # Use database queries instead of Python loops for better performance
-    today = timezone.now().date()
-    
-    for activity in activities:
-        # Get current streak efficiently
-        current_streak = activity.current_streak
-        if current_streak > 0:
-            active_streaks += 1
-        total_streak += current_streak
-        
-        # Check if completed today efficiently
-        if activity.completed_today:
-            completed_today += 1
-        
-        # Calculate weekly progress efficiently
-        total_weekly_progress += activity.weekly_progress
+    user = get_or_create_user_with_clerk_data(request.user)
+    
+    # Limit to 50 activities; metrics for all of them come from one batch query
+    activities = list(user.activities.all().select_related('user')[:50])
+    metrics = attach_activity_metrics(activities)
+    
+    total_activities = len(activities)
+    active_streaks = sum(1 for m in metrics.values() if m['current_streak'] > 0)
+    completed_today = sum(1 for m in metrics.values() if m['completed_today'])
+    total_streak = sum(m['current_streak'] for m in metrics.values())
+    total_weekly_progress = sum(m['weekly_progress'] for m in metrics.values())
     
     # Calculate averages
     average_streak = round(total_streak / total_activities, 1) if total_activities > 0 else 0
@@ -176,42 +197,28 @@ def complete_activity(request, activity_id):
     except Activity.DoesNotExist:
         return Response({'error': 'Activity not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    today = timezone.now().date()
-    note = request.data.get('note', '')
+    today = user_today(user)
+    note = request.data.get('note') or ''
     
-    # Check if entry exists for today
-    try:
-        entry = StreakEntry.objects.get(date=today, activity=activity)
-        # Toggle completion status
-        entry.completed = not entry.completed
-        if note:
-            entry.note = note
-        entry.save()
-        action = 'completed' if entry.completed else 'uncompleted'
-    except StreakEntry.DoesNotExist:
-        # Create new entry as completed
-        entry = StreakEntry.objects.create(
-            date=today,
-            activity=activity,
-            completed=True,
-            note=note
-        )
-        action = 'completed'
+    entry_id, completed = toggle_entry(activity, today, note)
+    action = 'completed' if completed else 'uncompleted'
     
-    # Return updated activity data
-    activity_data = ActivitySerializer(activity).data
+    # Only the metrics change, so return those instead of the whole activity
+    metrics = calculate_activity_metrics([activity], today=today)[activity.id]
     return Response({
         'message': f'Activity {action} successfully',
-        'activity': activity_data
+        'entry': {'id': entry_id, 'date': today.strftime('%Y-%m-%d'), 'completed': completed},
+        'activity': {'id': activity.id, **metrics}
     })
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 @authentication_classes([ClerkAuthentication])
+@renderer_classes([JSONRenderer, CompactCalendarRenderer])
+@cached_user_response('calendar_entries')
 def calendar_entries(request):
     """Get calendar entries for a date range with Clerk authentication"""
-    start_time = timezone.now()
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
     
@@ -226,140 +233,40 @@ def calendar_entries(request):
         return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, 
                       status=status.HTTP_400_BAD_REQUEST)
     
+    stream = request.GET.get('stream')
+    if stream not in (None, 'json', 'ndjson'):
+        return Response({'error': 'stream must be json or ndjson'}, 
+                      status=status.HTTP_400_BAD_REQUEST)
+    
+    user = get_or_create_user_with_clerk_data(request.user)
+    
+    if stream:
+        # Streamed day by day with flat memory, so no range or activity caps apply
+        return StreamingHttpResponse(
+            stream_calendar_days(user, start_date, end_date, ndjson=stream == 'ndjson'),
+            content_type=STREAM_CONTENT_TYPES[stream]
+        )
+    
     # Limit date range to prevent memory issues (max 365 days for full year)
     date_diff = (end_date - start_date).days
     if date_diff > 365:
         return Response({'error': 'Date range cannot exceed 365 days'}, 
                       status=status.HTTP_400_BAD_REQUEST)
     
-    clerk_id = request.user.clerk_id
-    user, created = User.objects.get_or_create(
-        clerk_id=clerk_id,
-        defaults={
-            'username': request.user.username or request.user.email,
-            'email': request.user.email,
-            'first_name': request.user.first_name or '',
-            'last_name': request.user.last_name or '',
-        }
-    )
-    
-    # Optimize queries with select_related and prefetch_related
     # Limit activities to prevent memory issues with users who have many activities
-    activities = user.activities.all().select_related('user')[:100]  # Limit to 100 activities
+    activities = list(user.activities.all()[:100])  # Limit to 100 activities
     total_activities = len(activities)
     
-    # For large date ranges, process in chunks to avoid memory issues
-    if date_diff > 90:
-        # Process in 3-month chunks for better memory management
-        chunk_size = 90
-        calendar_data = []
-        
-        current_chunk_start = start_date
-        while current_chunk_start <= end_date:
-            current_chunk_end = min(current_chunk_start + timedelta(days=chunk_size - 1), end_date)
-            
-            # Get entries for this chunk
-            entries = StreakEntry.objects.filter(
-                activity__user=user,
-                date__gte=current_chunk_start,
-                date__lte=current_chunk_end
-            ).select_related('activity').order_by('date', 'activity_id')
-            
-            # Create a dictionary for fast lookup: {(date, activity_id): entry}
-            entries_dict = {}
-            for entry in entries:
-                key = (entry.date, entry.activity_id)
-                entries_dict[key] = entry
-            
-            # Process this chunk
-            current_date = current_chunk_start
-            while current_date <= current_chunk_end:
-                # Prepare activities data for this date
-                activities_data = []
-                total_completed = 0
-                
-                for activity in activities:
-                    # Fast lookup instead of filtering
-                    entry = entries_dict.get((current_date, activity.id))
-                    completed = entry.completed if entry else False
-                    
-                    if completed:
-                        total_completed += 1
-                    
-                    activities_data.append({
-                        'id': activity.id,
-                        'title': activity.title,
-                        'color': activity.color,
-                        'completed': completed,
-                        'note': entry.note if entry else ''
-                    })
-                
-                calendar_data.append({
-                    'date': current_date.strftime('%Y-%m-%d'),
-                    'activities': activities_data,
-                    'total_completed': total_completed,
-                    'total_activities': total_activities
-                })
-                
-                current_date += timedelta(days=1)
-            
-            # Move to next chunk
-            current_chunk_start = current_chunk_end + timedelta(days=1)
+    if request.accepted_renderer.format == CompactCalendarRenderer.format:
+        rows = compact_calendar_rows(user, start_date, end_date)
+        calendar_data = build_compact_calendar(activities, rows, start_date, end_date)
     else:
-        # For smaller date ranges, process all at once
-        entries = StreakEntry.objects.filter(
-            activity__user=user,
-            date__gte=start_date,
-            date__lte=end_date
-        ).select_related('activity').order_by('date', 'activity_id')
-        
-        # Create a dictionary for fast lookup: {(date, activity_id): entry}
-        entries_dict = {}
-        for entry in entries:
-            key = (entry.date, entry.activity_id)
-            entries_dict[key] = entry
-        
-        calendar_data = []
-        current_date = start_date
-        
-        while current_date <= end_date:
-            # Prepare activities data for this date
-            activities_data = []
-            total_completed = 0
-            
-            for activity in activities:
-                # Fast lookup instead of filtering
-                entry = entries_dict.get((current_date, activity.id))
-                completed = entry.completed if entry else False
-                
-                if completed:
-                    total_completed += 1
-                
-                activities_data.append({
-                    'id': activity.id,
-                    'title': activity.title,
-                    'color': activity.color,
-                    'completed': completed,
-                    'note': entry.note if entry else ''
-                })
-            
-            calendar_data.append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'activities': activities_data,
-                'total_completed': total_completed,
-                'total_activities': total_activities
-            })
-            
-            current_date += timedelta(days=1)
-    
-    # Log performance metrics
-    end_time = timezone.now()
-    duration = (end_time - start_time).total_seconds()
-    query_count = len(connection.queries)
-    
-    logger.info(f"Calendar entries request completed: {len(calendar_data)} days, "
-                f"{total_activities} activities, {query_count} queries, "
-                f"{duration:.2f}s duration")
+        rows = calendar_entry_rows(user, start_date, end_date)
+        calendar_data = build_calendar_days(activities, rows, start_date, end_date)
+    
+    # Query counts and timings are logged by RequestMetricsMiddleware
+    logger.info(f"Calendar entries request completed: {date_diff + 1} days, "
+                f"{total_activities} activities")
     
     return Response(calendar_data)
 
@@ -367,53 +274,45 @@ def calendar_entries(request):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 @authentication_classes([ClerkAuthentication])
+def export_entries(request):
+    """Stream all of the user's streak entries as NDJSON, optionally limited to a date range"""
+    user = get_or_create_user_with_clerk_data(request.user)
+    entries = StreakEntry.objects.filter(activity__user=user)
+    
+    try:
+        if request.GET.get('start_date'):
+            entries = entries.filter(date__gte=datetime.strptime(request.GET['start_date'], '%Y-%m-%d').date())
+        if request.GET.get('end_date'):
+            entries = entries.filter(date__lte=datetime.strptime(request.GET['end_date'], '%Y-%m-%d').date())
+    except ValueError:
+        return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, 
+                      status=status.HTTP_400_BAD_REQUEST)
+    
+    rows = entries.order_by('date', 'activity_id').values(
+        'id', 'activity_id', 'date', 'completed', 'note', 'created_at', 'updated_at'
+    ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+    
+    response = StreamingHttpResponse(encode_ndjson(rows), content_type=STREAM_CONTENT_TYPES['ndjson'])
+    response['Content-Disposition'] = 'attachment; filename="streak-entries.ndjson"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@authentication_classes([ClerkAuthentication])
+@cached_user_response('analytics')
 def analytics(request):
     """Get analytics data with Clerk authentication"""
-    clerk_id = request.user.clerk_id
-    user, created = User.objects.get_or_create(
-        clerk_id=clerk_id,
-        defaults={
-            'username': request.user.username or request.user.email,
-            'email': request.user.email,
-            'first_name': request.user.first_name or '',
-            'last_name': request.user.last_name or '',
-        }
-    )
-    
-    activities = user.activities.all()
-    
-    # Basic analytics
-    total_activities = activities.count()
-    total_completions = sum(activity.total_completions for activity in activities)
-    average_streak = sum(activity.current_streak for activity in activities) / total_activities if total_activities > 0 else 0
-    
-    # Category breakdown
-    category_stats = {}
-    for activity in activities:
-        category = activity.get_category_display()
-        if category not in category_stats:
-            category_stats[category] = {
-                'count': 0,
-                'total_streak': 0,
-                'total_completions': 0
-            }
-        category_stats[category]['count'] += 1
-        category_stats[category]['total_streak'] += activity.current_streak
-        category_stats[category]['total_completions'] += activity.total_completions
-    
-    # Calculate averages for categories
-    for category in category_stats:
-        count = category_stats[category]['count']
-        category_stats[category]['avg_streak'] = round(category_stats[category]['total_streak'] / count, 1)
-        category_stats[category]['avg_completions'] = round(category_stats[category]['total_completions'] / count, 1)
+    range_name = request.GET.get('range', DEFAULT_ANALYTICS_RANGE)
+    if range_name not in ANALYTICS_RANGES:
+        return Response({'error': f"range must be one of {', '.join(ANALYTICS_RANGES)}"}, 
+                      status=status.HTTP_400_BAD_REQUEST)
     
-    return Response({
-        'total_activities': total_activities,
-        'total_completions': total_completions,
-        'average_streak': round(average_streak, 1),
-        'category_breakdown': category_stats,
-        'message': 'Analytics endpoint - more features coming soon!'
-    })
+    user = get_or_create_user_with_clerk_data(request.user)
+    
+    data = build_analytics(user, ANALYTICS_RANGES[range_name], user_today(user))
+    data['range'] = range_name
+    return Response(data)
 
 
 @api_view(['GET'])
@@ -424,16 +323,7 @@ def search_activities(request):
     query = request.GET.get('q', '')
     category = request.GET.get('category', '')
     
-    clerk_id = request.user.clerk_id
-    user, created = User.objects.get_or_create(
-        clerk_id=clerk_id,
-        defaults={
-            'username': request.user.username or request.user.email,
-            'email': request.user.email,
-            'first_name': request.user.first_name or '',
-            'last_name': request.user.last_name or '',
-        }
-    )
+    user = get_or_create_user_with_clerk_data(request.user)
     
     activities = Activity.objects.filter(user=user)
     
@@ -1,6 +1,7 @@
 import os
+import time
 from celery import Celery
-from django.conf import settings
+from celery.signals import task_postrun, task_prerun
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'streakflow.settings')
@@ -15,6 +16,25 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+# Task run times for the /metrics endpoint, keyed by task id between the two signals
+_task_started = {}
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def observe_task_duration(task_id=None, task=None, state=None, **kwargs):
+    from streakflow.metrics import CELERY_TASK_DURATION, REGISTRY
+
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_DURATION.observe(time.perf_counter() - started, task.name, state or 'UNKNOWN')
+    REGISTRY.maybe_flush()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -24,58 +44,19 @@ def debug_task(self):
 @app.task
 def send_daily_reminders():
     """Send daily reminders to users for their activities"""
-    from django.core.mail import send_mail
-    from django.template.loader import render_to_string
-    from django.utils import timezone
-    from users.models import User
-    from activities.models import Activity
-    
-    today = timezone.now().date()
-    
-    # Get all users with email notifications enabled
-    users = User.objects.filter(email_notifications=True, is_active=True)
+    from activities.email_service import EmailReminderService
     
-    for user in users:
-        # Get user's activities that haven't been completed today
-        incomplete_activities = []
-        for activity in user.activities.all():
-            if not activity.completed_today:
-                incomplete_activities.append(activity)
-        
-        if incomplete_activities:
-            # Send reminder email
-            subject = f"StreakFlow Reminder - {today.strftime('%B %d, %Y')}"
-            
-            # Simple email template
-            message = f"""
-            Hello {user.first_name or user.username},
-            
-            You have {len(incomplete_activities)} activities that haven't been completed today:
-            
-            """
-            
-            for activity in incomplete_activities:
-                message += f"• {activity.title} (Current streak: {activity.current_streak} days)\n"
-            
-            message += f"""
-            
-            Keep your streaks alive! Complete your activities today.
-            
-            Best regards,
-            StreakFlow Team
-            """
-            
-            try:
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=settings.EMAIL_HOST_USER,
-                    recipient_list=[user.email],
-                    fail_silently=True,
-                )
-                print(f"Reminder sent to {user.email}")
-            except Exception as e:
-                print(f"Failed to send reminder to {user.email}: {e}")
+    # Users with email notifications enabled and activities left today, sent in batches
+    return EmailReminderService.send_daily_reminders_to_all_users()
+
+
+# Timezone-bucketed reminders, run by beat every 15 minutes
+@app.task
+def send_scheduled_reminders():
+    """Send the reminders of the users whose local time just reached midday, evening or their reminder_time"""
+    from activities.email_service import EmailReminderService
+
+    return EmailReminderService.send_scheduled_reminders()
 
 
 # Weekly summary task
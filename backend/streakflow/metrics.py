@@ -0,0 +1,361 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Recording a value only appends (labels, value) to a deque, which is atomic
+under the GIL, so instrumentation takes no lock and costs a few hundred
+nanoseconds. The pending values are folded into per-label totals when the
+registry is read or flushed. With gunicorn every worker process has its
+own values: when METRICS['MULTIPROCESS_DIR'] is set, each process writes a
+snapshot to <dir>/metrics-<pid>-<token>.json at most every FLUSH_INTERVAL
+seconds (maybe_flush() is called after requests and Celery tasks, and at
+exit), and the /metrics view sums the snapshots of all processes. The token
+is random per process, so a reused PID never overwrites the snapshot of an
+earlier process. When a snapshot's PID is no longer running, collect() adds
+it to <dir>/archive.json and deletes it, so the directory does not grow with
+every restarted worker and counters never go backwards. The directory must
+be local to one host, since PIDs are checked with os.kill().
+"""
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+import atexit
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SNAPSHOT_FILENAME = re.compile(r'^metrics-(\d+)(-\w+)?\.json$')
+ARCHIVE_FILENAME = 'archive.json'
+LOCK_FILENAME = 'collect.lock'
+
+
+def metrics_setting(name, default):
+    return getattr(settings, 'METRICS', {}).get(name, default)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name = name
+        # The samples carry the _total suffix, and HELP and TYPE must name the same metric
+        self.exposed_name = f'{name}_total'
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.pending = deque()
+        self.values = {}
+        registry.register(self)
+
+    def inc(self, *labels, amount=1):
+        self.pending.append((labels, amount))
+
+    def drain(self):
+        """Fold the pending increments into the totals; appends made meanwhile are kept for the next drain"""
+        pending = self.pending
+        values = self.values
+        while pending:
+            labels, amount = pending.popleft()
+            values[labels] = values.get(labels, 0) + amount
+
+    def snapshot(self):
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+    def merge(self, totals, rows):
+        for labels, value in rows:
+            labels = tuple(labels)
+            totals[labels] = totals.get(labels, 0) + value
+
+    def render(self, totals):
+        for labels, value in sorted(totals.items()):
+            yield f'{self.exposed_name}{format_labels(self.labelnames, labels)} {format_value(value)}'
+
+
+class Histogram:
+    """Histogram of observed values with optional labels; buckets are upper bounds in ascending order"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.exposed_name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.pending = deque()
+        self.values = {}  # labels: [count per bucket..., count above the last bucket, sum]
+        registry.register(self)
+
+    def observe(self, value, *labels):
+        self.pending.append((labels, value))
+
+    def drain(self):
+        """Fold the pending observations into the totals; appends made meanwhile are kept for the next drain"""
+        pending = self.pending
+        values = self.values
+        buckets = self.buckets
+        while pending:
+            labels, value = pending.popleft()
+            row = values.get(labels)
+            if row is None:
+                row = values[labels] = [0] * (len(buckets) + 1) + [0.0]
+            row[bisect_left(buckets, value)] += 1
+            row[-1] += value
+
+    def time(self, *labels):
+        """Context manager observing the seconds spent in the block"""
+        return Timer(self, labels)
+
+    def track(self, *labels):
+        """Decorator observing the seconds spent in each call of a function"""
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.pending.append((labels, time.perf_counter() - started))
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        return [[list(labels), list(row)] for labels, row in self.values.items()]
+
+    def merge(self, totals, rows):
+        for labels, row in rows:
+            labels = tuple(labels)
+            total = totals.get(labels)
+            if total is None:
+                totals[labels] = list(row)
+            else:
+                for index, value in enumerate(row):
+                    total[index] += value
+
+    def render(self, totals):
+        for labels, row in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), row):
+                cumulative += count
+                le = f'le="{format_value(float(bound))}"'
+                yield f'{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(row[-1])}'
+            yield f'{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}'
+
+
+class Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class Registry:
+    """The metrics of this process, with snapshots shared between processes through a directory"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.last_flush = 0.0
+        self.pid = None
+        self.token = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.drain()
+            return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def snapshot_path(self, directory):
+        pid = os.getpid()
+        if pid != self.pid:
+            # First flush of this process, or the first after a fork
+            self.pid = pid
+            self.token = uuid.uuid4().hex[:12]
+        return os.path.join(directory, f'metrics-{pid}-{self.token}.json')
+
+    def flush(self):
+        """Write this process's snapshot, replacing the previous one atomically"""
+        directory = metrics_setting('MULTIPROCESS_DIR', '')
+        self.last_flush = time.monotonic()
+        if not directory:
+            self.snapshot()
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = self.snapshot_path(directory)
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(temporary, path)
+
+    def maybe_flush(self):
+        """Flush (and without a directory, just fold pending values) when the last flush is older than FLUSH_INTERVAL seconds"""
+        if time.monotonic() - self.last_flush >= metrics_setting('FLUSH_INTERVAL', 5):
+            self.flush()
+
+    def collect(self):
+        """{metric name: merged values} over every process's snapshot, this process's current values included"""
+        snapshots = [self.snapshot()]
+        directory = metrics_setting('MULTIPROCESS_DIR', '')
+        if directory and os.path.isdir(directory):
+            # Concurrent scrapes must not archive the same snapshot twice
+            with open(os.path.join(directory, LOCK_FILENAME), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                snapshots.extend(self.read_snapshots(directory))
+
+        totals = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, rows in snapshot.items():
+                if name in self.metrics:
+                    self.metrics[name].merge(totals[name], rows)
+        return totals
+
+    def read_snapshots(self, directory):
+        """The snapshots of the running processes and the archive, after archiving those of exited processes"""
+        own = self.snapshot_path(directory)
+        live = []
+        exited = []
+        for filename in sorted(os.listdir(directory)):
+            match = SNAPSHOT_FILENAME.match(filename)
+            path = os.path.join(directory, filename)
+            if match is None or path == own:
+                continue
+            snapshot = read_json(path)
+            if snapshot is None:
+                continue
+            if process_exists(int(match.group(1))):
+                live.append(snapshot)
+            else:
+                exited.append((path, snapshot))
+
+        archive_path = os.path.join(directory, ARCHIVE_FILENAME)
+        archive = read_json(archive_path) or {}
+        if exited:
+            for _, snapshot in exited:
+                for name, rows in snapshot.items():
+                    archive.setdefault(name, []).extend(rows)
+            # Fold the rows of each known metric into one per label set
+            for name, rows in archive.items():
+                if name in self.metrics:
+                    totals = {}
+                    self.metrics[name].merge(totals, rows)
+                    archive[name] = [[list(labels), value] for labels, value in totals.items()]
+            temporary = f'{archive_path}.tmp'
+            with open(temporary, 'w') as handle:
+                json.dump(archive, handle)
+            os.replace(temporary, archive_path)
+            for path, _ in exited:
+                os.remove(path)
+        return live + [archive]
+
+    def exposition(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f'# HELP {metric.exposed_name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.exposed_name} {metric.kind}')
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+
+
+def read_json(path):
+    """Parsed JSON of a file, or None when it is missing or half written"""
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running under another user
+        return True
+    return True
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+
+REQUEST_DURATION = Histogram(
+    REGISTRY, 'streakflow_http_request_duration_seconds',
+    'Time to answer /api/ requests, by view, method and status',
+    ('view', 'method', 'status'),
+)
+AUTH_DURATION = Histogram(
+    REGISTRY, 'streakflow_clerk_auth_duration_seconds',
+    'Time spent in ClerkAuthentication.authenticate',
+)
+JWKS_FETCH_DURATION = Histogram(
+    REGISTRY, 'streakflow_jwks_fetch_duration_seconds',
+    'Time to fetch Clerk signing keys, by outcome',
+    ('outcome',),
+)
+STREAK_COMPUTATION_DURATION = Histogram(
+    REGISTRY, 'streakflow_streak_computation_duration_seconds',
+    'Time spent computing streak metrics and states, by function',
+    ('function',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+REMINDERS = Counter(
+    REGISTRY, 'streakflow_reminders',
+    'Reminder dispatches processed, by kind and outcome',
+    ('kind', 'status'),
+)
+REMINDER_BATCH_DURATION = Histogram(
+    REGISTRY, 'streakflow_reminder_batch_duration_seconds',
+    'Time to check, render and deliver one claimed batch of reminders, by kind',
+    ('kind',),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+CELERY_TASK_DURATION = Histogram(
+    REGISTRY, 'streakflow_celery_task_duration_seconds',
+    'Celery task run time, by task and final state',
+    ('task', 'state'),
+    buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0),
+)
@@ -3,6 +3,7 @@ Django settings for streakflow project.
 """
 
 from pathlib import Path
+from celery.schedules import crontab
 from decouple import config
 import os
 
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'users.middleware.RequestMetricsMiddleware',  # Server-Timing and metrics logs for /api/ requests
+    'users.middleware.RequestProfilingMiddleware',  # Opt-in stack and SQL profiles of slow /api/ requests
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,8 +64,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Templates are parsed once per process, reminder emails render them for every recipient
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -157,6 +166,8 @@ CACHES = {
                 'max_connections': config('REDIS_MAX_CONNECTIONS', default=50, cast=int),
                 'retry_on_timeout': True,
             },
+            # Cache reads sit on the authentication path; treat Redis outages as misses
+            'IGNORE_EXCEPTIONS': True,
         },
         'KEY_PREFIX': 'streakflow',
         'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),  # 5 minutes default
@@ -192,6 +203,36 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'users.exception_handlers.custom_exception_handler',
 }
 
+# Per-request query, cache and timing metrics, see users/middleware.py
+REQUEST_METRICS = {
+    # Share of /api/ requests measured, between 0 and 1
+    'SAMPLE_RATE': config('REQUEST_METRICS_SAMPLE_RATE', default=1.0, cast=float),
+}
+
+# Profiles of slow requests, listed on /api/users/profiles/ (see users/profiling.py)
+REQUEST_PROFILING = {
+    # Sample the stacks and record the SQL of every /api/ request
+    'ENABLED': config('REQUEST_PROFILING_ENABLED', default=False, cast=bool),
+    # Requests of users with profile_requests set are kept when at least this slow
+    'THRESHOLD_MS': config('REQUEST_PROFILING_THRESHOLD_MS', default=500, cast=int),
+    # Requests sent with this value in an X-Profile header are always kept
+    'TOKEN': config('REQUEST_PROFILING_TOKEN', default=''),
+    'INTERVAL_MS': config('REQUEST_PROFILING_INTERVAL_MS', default=5, cast=float),
+    # Kept profiles stay in the cache for RETENTION seconds, and only the newest MAX_PROFILES are listed
+    'MAX_PROFILES': config('REQUEST_PROFILING_MAX_PROFILES', default=100, cast=int),
+    'RETENTION': config('REQUEST_PROFILING_RETENTION', default=86400, cast=int),
+}
+
+# Prometheus metrics served on /metrics (see streakflow/metrics.py)
+METRICS = {
+    # Shared directory where every gunicorn worker and Celery process writes its snapshot; empty for a single process
+    'MULTIPROCESS_DIR': config('METRICS_MULTIPROCESS_DIR', default=''),
+    # Seconds between snapshot writes of a process
+    'FLUSH_INTERVAL': config('METRICS_FLUSH_INTERVAL', default=5.0, cast=float),
+    # Bearer token of the scraper; without one only staff can read /metrics
+    'TOKEN': config('METRICS_TOKEN', default=''),
+}
+
 # JWT Settings - Optimized for better user experience
 from datetime import timedelta
 SIMPLE_JWT = {
@@ -247,6 +288,7 @@ CORS_ALLOW_HEADERS = [
     'origin',
     'user-agent',
     'x-csrftoken',
+    'x-profile',
     'x-requested-with',
 ]
 
@@ -258,6 +300,19 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 
+# Bulk reminder delivery, see activities/mailer.py
+REMINDER_EMAIL = {
+    # Messages sent over one SMTP connection
+    'BATCH_SIZE': config('REMINDER_EMAIL_BATCH_SIZE', default=100, cast=int),
+    # Connections open at once
+    'WORKERS': config('REMINDER_EMAIL_WORKERS', default=8, cast=int),
+    # Messages per second across all workers, 0 for no limit
+    'RATE_PER_SECOND': config('REMINDER_EMAIL_RATE_PER_SECOND', default=100, cast=float),
+    # Attempts after the first for a failed message, with exponential backoff
+    'RETRIES': config('REMINDER_EMAIL_RETRIES', default=3, cast=int),
+    'RETRY_BACKOFF': config('REMINDER_EMAIL_RETRY_BACKOFF', default=1.0, cast=float),
+}
+
 # Celery Settings
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://localhost:6379/0')
@@ -266,6 +321,14 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Reminders are picked per timezone slot, see activities/scheduling.py
+CELERY_BEAT_SCHEDULE = {
+    'send-scheduled-reminders': {
+        'task': 'streakflow.celery.send_scheduled_reminders',
+        'schedule': crontab(minute='*/15'),
+    },
+}
+
 # Custom User Model
 AUTH_USER_MODEL = 'users.User'
 
@@ -276,6 +339,12 @@ CLERK = {
     'JWT_ALGORITHM': 'RS256',
     'JWT_AUDIENCE': config('CLERK_JWT_AUDIENCE', default=''),
     'JWT_ISSUER': config('CLERK_JWT_ISSUER', default=''),
+    # Signing keys are cached per process and refreshed in the background after this many seconds
+    'JWKS_CACHE_TTL': config('CLERK_JWKS_CACHE_TTL', default=3600, cast=int),
+    'JWKS_MIN_REFETCH_INTERVAL': config('CLERK_JWKS_MIN_REFETCH_INTERVAL', default=30, cast=int),
+    'JWKS_FETCH_TIMEOUT': config('CLERK_JWKS_FETCH_TIMEOUT', default=5, cast=int),
+    # Verified token payloads kept per process so repeated requests skip RSA verification
+    'TOKEN_CACHE_SIZE': config('CLERK_TOKEN_CACHE_SIZE', default=1024, cast=int),
 }
 
 # Frontend URL for email links
@@ -322,6 +391,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'users.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': True,
+        },
         'django.request': {
             'handlers': ['console'],
             'level': 'WARNING',
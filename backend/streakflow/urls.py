@@ -28,6 +28,9 @@ urlpatterns = [
     
     path('admin/', admin.site.urls),
     
+    # Prometheus scrape target
+    path('metrics', health_views.metrics, name='metrics'),
+    
     # API URLs
     path('api/', include([
         path('users/', include('users.urls')),
@@ -8,7 +8,7 @@ class UserAdmin(BaseUserAdmin):
     """Admin interface for User model"""
     
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'is_active', 'date_joined')
-    list_filter = ('is_staff', 'is_active', 'is_superuser', 'date_joined', 'email_notifications')
+    list_filter = ('is_staff', 'is_active', 'is_superuser', 'date_joined', 'email_notifications', 'profile_requests')
     search_fields = ('username', 'email', 'first_name', 'last_name')
     ordering = ('-date_joined',)
     
@@ -17,6 +17,7 @@ class UserAdmin(BaseUserAdmin):
         ('Personal info', {'fields': ('first_name', 'last_name', 'email', 'bio', 'profile_picture', 'timezone')}),
         ('Preferences', {'fields': ('email_notifications', 'reminder_time')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
+        ('Diagnostics', {'fields': ('profile_requests',)}),
         ('Important dates', {'fields': ('last_login', 'date_joined')}),
     )
     
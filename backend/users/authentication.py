@@ -1,21 +1,171 @@
 import jwt
-from jwt import PyJWKClient
+from jwt import PyJWKSet
 from django.contrib.auth import get_user_model
 from rest_framework import authentication
 from rest_framework.exceptions import AuthenticationFailed
 from django.conf import settings
+from streakflow.metrics import AUTH_DURATION, JWKS_FETCH_DURATION
+from users.request_metrics import record_token_cache, timed
+from users.utils import resolve_clerk_user
+from collections import OrderedDict
+import hashlib
 import requests
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
+class JWKSCache:
+    """
+    Process-wide cache of Clerk's signing keys, keyed by kid.
+    
+    Keys are served from memory; once they are older than the TTL a background
+    thread re-fetches them while requests keep using the current set. A token
+    signed with an unknown kid (key rotation) triggers a synchronous re-fetch,
+    rate limited so bogus kids cannot hammer Clerk. If a fetch fails the stale
+    keys stay in use.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jwks_url = None
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._next_refresh_attempt = 0.0
+        self._last_forced_fetch = 0.0
+        self._refreshing = False
+    
+    def get_signing_key(self, jwks_url, kid):
+        """Return the signing key for a kid, fetching the key set only when needed"""
+        options = settings.CLERK
+        now = time.monotonic()
+        
+        if jwks_url != self._jwks_url:
+            # Issuer changed (or first use): start from an empty set
+            with self._lock:
+                if jwks_url != self._jwks_url:
+                    self._jwks_url = jwks_url
+                    self._keys = {}
+                    self._fetched_at = 0.0
+        
+        key = self._keys.get(kid)
+        if key is not None:
+            if now - self._fetched_at > options.get('JWKS_CACHE_TTL', 3600) and now >= self._next_refresh_attempt:
+                self._refresh_in_background(jwks_url)
+            return key
+        
+        # Unknown kid: Clerk may have rotated its keys, re-fetch right away
+        with self._lock:
+            key = self._keys.get(kid)
+            if key is None:
+                min_interval = options.get('JWKS_MIN_REFETCH_INTERVAL', 30)
+                if not self._keys or now - self._last_forced_fetch >= min_interval:
+                    self._last_forced_fetch = now
+                    try:
+                        self._fetch(jwks_url)
+                    except Exception as e:
+                        if not self._keys:
+                            raise
+                        logger.warning(f"JWKS re-fetch for unknown kid failed, keeping cached keys: {str(e)}")
+                key = self._keys.get(kid)
+        
+        if key is None:
+            raise jwt.InvalidTokenError(f'Unable to find a signing key that matches kid "{kid}"')
+        return key
+    
+    def _fetch(self, jwks_url):
+        """Fetch the key set and swap it in"""
+        started = time.monotonic()
+        try:
+            response = requests.get(jwks_url, timeout=settings.CLERK.get('JWKS_FETCH_TIMEOUT', 5))
+            response.raise_for_status()
+            jwk_set = PyJWKSet.from_dict(response.json())
+        except Exception:
+            JWKS_FETCH_DURATION.observe(time.monotonic() - started, 'error')
+            raise
+        JWKS_FETCH_DURATION.observe(time.monotonic() - started, 'ok')
+        
+        self._keys = {jwk.key_id: jwk for jwk in jwk_set.keys if jwk.key_id}
+        self._fetched_at = time.monotonic()
+        logger.info(f"Fetched {len(self._keys)} JWKS keys in {self._fetched_at - started:.3f}s")
+    
+    def _refresh_in_background(self, jwks_url):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, args=(jwks_url,), daemon=True).start()
+    
+    def _background_refresh(self, jwks_url):
+        try:
+            with self._lock:
+                self._fetch(jwks_url)
+        except Exception as e:
+            # Serve the stale keys and retry a bit later
+            self._next_refresh_attempt = time.monotonic() + settings.CLERK.get('JWKS_MIN_REFETCH_INTERVAL', 30)
+            logger.warning(f"Background JWKS refresh failed, serving stale keys: {str(e)}")
+        finally:
+            self._refreshing = False
+
+
+class VerifiedTokenCache:
+    """Small LRU of verified token payloads; each entry expires at its token's exp"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+    
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+    
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, exp = entry
+            if exp <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+    
+    def set(self, token, payload):
+        exp = payload.get('exp')
+        max_size = settings.CLERK.get('TOKEN_CACHE_SIZE', 1024)
+        if not exp or max_size <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (payload, exp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+jwks_cache = JWKSCache()
+verified_tokens = VerifiedTokenCache()
+
+
 class ClerkAuthentication(authentication.BaseAuthentication):
     """Custom authentication backend for Clerk"""
     
     def authenticate(self, request):
+        # Reported in the request's Server-Timing header and the auth histogram
+        with timed('auth'), AUTH_DURATION.time():
+            return self.authenticate_header_token(request)
+    
+    def authenticate_header_token(self, request):
         auth_header = request.META.get('HTTP_AUTHORIZATION')
         print(f"🔐 ClerkAuthentication.authenticate() called")
         print(f"🔐 Auth header: {auth_header[:50] + '...' if auth_header and len(auth_header) > 50 else auth_header}")
@@ -53,13 +203,18 @@ class ClerkAuthentication(authentication.BaseAuthentication):
             raise AuthenticationFailed(f'Authentication failed: {str(e)}')
     
     def verify_clerk_token(self, token):
-        """Verify JWT token with Clerk using PyJWKClient"""
+        """Verify JWT token with Clerk using the cached signing keys"""
+        payload = verified_tokens.get(token)
+        record_token_cache(payload is not None)
+        if payload is not None:
+            return payload
+        
         try:
             clerk_issuer = settings.CLERK.get('JWT_ISSUER', '')
             jwks_url = f"{clerk_issuer}/.well-known/jwks.json"
 
-            jwks_client = PyJWKClient(jwks_url)
-            signing_key = jwks_client.get_signing_key_from_jwt(token)
+            kid = jwt.get_unverified_header(token).get('kid')
+            signing_key = jwks_cache.get_signing_key(jwks_url, kid)
 
             payload = jwt.decode(
                 token,
@@ -72,6 +227,7 @@ class ClerkAuthentication(authentication.BaseAuthentication):
                     "leeway": 30          # Allow 30 seconds leeway for clock skew
                 }
             )
+            verified_tokens.set(token, payload)
             return payload
         except jwt.ExpiredSignatureError as e:
             logger.warning(f"JWT token has expired: {str(e)}")
@@ -142,99 +298,13 @@ class ClerkAuthentication(authentication.BaseAuthentication):
             return None
     
     def get_or_create_user(self, user_data):
-        """Get or create user from Clerk data, always update with latest Clerk info"""
-        clerk_id = user_data.get('sub')  # Clerk user ID
-        if not clerk_id:
+        """Resolve the user row for the token's Clerk ID, creating or updating it only when needed"""
+        if not user_data.get('sub'):
             logger.error("No user ID found in token payload")
             raise AuthenticationFailed('No user ID in token')
-
-        logger.info(f"Processing user creation/update for Clerk ID: {clerk_id}")
-
-        # Extract Clerk fields from JWT
-        email = user_data.get('email', '')
-        given_name = user_data.get('given_name')
-        family_name = user_data.get('family_name')
-        name = user_data.get('name')
-        first_name = user_data.get('first_name')
-        last_name = user_data.get('last_name')
         
-        logger.info(f"JWT user data - email: {email}, given_name: {given_name}, family_name: {family_name}, name: {name}")
-
-        # If JWT doesn't have user data, try to fetch from Clerk API
-        if not any([email, given_name, family_name, name, first_name, last_name]):
-            api_user_data = self.fetch_user_from_clerk_api(clerk_id)
-            if api_user_data:
-                # Extract data from API response
-                email = api_user_data.get('email_addresses', [{}])[0].get('email_address', '') if api_user_data.get('email_addresses') else ''
-                first_name = api_user_data.get('first_name', '')
-                last_name = api_user_data.get('last_name', '')
-                name = api_user_data.get('full_name', '')
-
-        # Prefer given_name/family_name, then name, then first_name/last_name
-        if given_name or family_name:
-            use_first = given_name or ''
-            use_last = family_name or ''
-        elif name:
-            parts = name.split()
-            use_first = parts[0]
-            use_last = ' '.join(parts[1:]) if len(parts) > 1 else ''
-        else:
-            use_first = first_name or ''
-            use_last = last_name or ''
-
-        # Generate a better username
-        if use_first and use_last:
-            username = f"{use_first.lower()}{use_last.lower().replace(' ', '')}"
-        elif use_first:
-            username = use_first.lower()
-        elif email:
-            username = email.split('@')[0]
-        else:
-            username = f"user_{clerk_id[:8]}"
-
-        # Ensure username is unique
-        base_username = username
-        counter = 1
-        while User.objects.filter(username=username).exclude(clerk_id=clerk_id).exists():
-            username = f"{base_username}{counter}"
-            counter += 1
-
         try:
-            user, created = User.objects.get_or_create(
-                clerk_id=clerk_id,
-                defaults={
-                    'username': username,
-                    'email': email,
-                    'first_name': use_first,
-                    'last_name': use_last,
-                }
-            )
-            
-            if created:
-                logger.info(f"Created new user: {username} with Clerk ID: {clerk_id}")
-            else:
-                logger.info(f"Found existing user: {username} with Clerk ID: {clerk_id}")
-            
-            # Always update user with latest Clerk info
-            updated = False
-            if user.email != email and email:
-                user.email = email
-                updated = True
-            if user.first_name != use_first and use_first:
-                user.first_name = use_first
-                updated = True
-            if user.last_name != use_last and use_last:
-                user.last_name = use_last
-                updated = True
-            if user.username != username and username:
-                user.username = username
-                updated = True
-            if updated:
-                user.save()
-                logger.info(f"Updated user info for: {username}")
-            
-            return user
-            
+            return resolve_clerk_user(user_data, fetch_profile=self.fetch_user_from_clerk_api)
         except Exception as e:
-            logger.error(f"Error creating/updating user with Clerk ID {clerk_id}: {str(e)}")
-            raise AuthenticationFailed(f'Failed to create or update user: {str(e)}') 
\ No newline at end of file
+            logger.error(f"Error creating/updating user with Clerk ID {user_data.get('sub')}: {str(e)}")
+            raise AuthenticationFailed(f'Failed to create or update user: {str(e)}')
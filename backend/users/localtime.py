@@ -0,0 +1,86 @@
+"""
+Per-user local dates.
+
+Users store an IANA zone name in User.timezone. A user's "today" is the date
+in that zone, not the server's UTC date. Zone objects are cached by name, and
+the batch helpers convert the current instant once per distinct zone rather
+than once per user, so jobs over many users can bucket them by local date in
+a single pass, or compute the local date inside a query with
+local_date_expression().
+"""
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from functools import lru_cache
+import logging
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.contrib.auth import get_user_model
+from django.db.models import Case, DateField, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1024)
+def get_zone(name):
+    """Zone for an IANA name, falling back to UTC for unknown or empty names"""
+    if not name:
+        return dt_timezone.utc
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {name!r}, using UTC")
+        return dt_timezone.utc
+
+
+def local_now(zone_name, now=None):
+    """Current datetime in a zone"""
+    return (now or timezone.now()).astimezone(get_zone(zone_name))
+
+
+def local_today(zone_name, now=None):
+    """Current date in a zone"""
+    return local_now(zone_name, now).date()
+
+
+def user_today(user, now=None):
+    """Current date for a user, in their timezone"""
+    return local_today(getattr(user, 'timezone', None), now)
+
+
+def local_dates(zone_names, now=None):
+    """{zone_name: local date} with one conversion per distinct zone"""
+    now = now or timezone.now()
+    return {name: local_today(name, now) for name in set(zone_names)}
+
+
+def bucket_by_local_date(items, zone_name=lambda item: item.timezone, now=None):
+    """Group items (users by default) by the current date in their zone: {date: [items]}"""
+    items = list(items)
+    dates = local_dates((zone_name(item) for item in items), now)
+    buckets = defaultdict(list)
+    for item in items:
+        buckets[dates[zone_name(item)]].append(item)
+    return dict(buckets)
+
+
+def user_local_dates(user_ids, now=None):
+    """{user_id: local date} for many users with one query"""
+    rows = list(get_user_model().objects.filter(id__in=user_ids).values_list('id', 'timezone'))
+    dates = local_dates((zone_name for _, zone_name in rows), now)
+    return {user_id: dates[zone_name] for user_id, zone_name in rows}
+
+
+def local_date_expression(zone_dates, field='timezone', now=None):
+    """
+    Case expression of a row's local date from its zone name field, given
+    {zone_name: local date}. Names missing from zone_dates get the UTC date.
+    """
+    by_date = defaultdict(list)
+    for name, date in zone_dates.items():
+        by_date[date].append(name)
+    return Case(
+        *[When(**{f'{field}__in': names}, then=Value(date)) for date, names in by_date.items()],
+        default=Value(local_today('UTC', now)),
+        output_field=DateField(),
+    )
@@ -1,6 +1,15 @@
+from contextlib import ExitStack
+import hmac
 import logging
+import random
+import time
+from django.conf import settings
+from django.db import connections
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
+from streakflow.metrics import REGISTRY, REQUEST_DURATION
+from users.profiling import SAMPLER, Capture, profiling_setting, save_profile
+from users.request_metrics import RequestMetrics, activate, add_timing, current_metrics, deactivate
 
 logger = logging.getLogger(__name__)
 
@@ -23,3 +32,112 @@ class TokenExpirationMiddleware(MiddlewareMixin):
                     logger.info(f"Token expiration detected for {request.path}")
         
         return response
+
+
+class RequestMetricsMiddleware:
+    """
+    Record query count, database time, cache hits and misses, authentication
+    and response serialization time and response size of a sample of /api/
+    requests. The numbers are returned in a Server-Timing header and logged as
+    one key=value line per request. The latency of every /api/ request also
+    goes into the streakflow.metrics request histogram.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        options = getattr(settings, 'REQUEST_METRICS', {})
+        self.sample_rate = options.get('SAMPLE_RATE', 1.0)
+    
+    def __call__(self, request):
+        if not request.path.startswith('/api/'):
+            return self.get_response(request)
+        
+        started = time.perf_counter()
+        if random.random() < self.sample_rate:
+            response = self.measure(request)
+        else:
+            response = self.get_response(request)
+        
+        # Every /api/ request goes into the latency histogram, sampled or not
+        view = request.resolver_match.view_name if request.resolver_match else 'unmatched'
+        REQUEST_DURATION.observe(time.perf_counter() - started, view, request.method, str(response.status_code))
+        REGISTRY.maybe_flush()
+        return response
+    
+    def measure(self, request):
+        metrics = RequestMetrics()
+        token = activate(metrics)
+        try:
+            # Works without DEBUG, unlike connection.queries
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.database_wrapper))
+                response = self.get_response(request)
+        finally:
+            deactivate(token)
+        
+        metrics.finish(response)
+        response['Server-Timing'] = metrics.server_timing()
+        fields = ' '.join(f'{key}={value}' for key, value in metrics.as_dict().items())
+        logger.info(
+            f"request_metrics method={request.method} path={request.path} status={response.status_code} {fields}",
+            extra={'request_metrics': metrics.as_dict()},
+        )
+        return response
+    
+    def process_template_response(self, request, response):
+        """Time the rendering of DRF responses, which happens after the view returns"""
+        if current_metrics() is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: add_timing('serialize', time.perf_counter() - started))
+        return response
+
+
+class RequestProfilingMiddleware:
+    """
+    Sample the call stacks and record the SQL of /api/ requests while
+    REQUEST_PROFILING['ENABLED'] is on, and keep the profile of requests sent
+    with the X-Profile token or of slow requests by users with profile_requests.
+    The id of a kept profile is returned in the X-Profile-Id header.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = profiling_setting('ENABLED')
+        self.token = profiling_setting('TOKEN')
+        self.threshold = profiling_setting('THRESHOLD_MS') / 1000
+    
+    def forced(self, request):
+        header = request.headers.get('X-Profile', '')
+        return bool(self.token and header) and hmac.compare_digest(header.encode(), self.token.encode())
+    
+    def __call__(self, request):
+        if not self.enabled or not request.path.startswith('/api/'):
+            return self.get_response(request)
+        
+        # Only forced requests can be kept before the threshold, so only they are captured from the start
+        forced = self.forced(request)
+        capture = Capture(delay=0.0 if forced else self.threshold)
+        started = time.perf_counter()
+        SAMPLER.register(capture)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(capture.database_wrapper))
+                response = self.get_response(request)
+        finally:
+            SAMPLER.unregister()
+        duration = time.perf_counter() - started
+        
+        # DRF has set request.user by now, Clerk-authenticated users included
+        if forced:
+            trigger = 'header'
+        elif duration >= self.threshold and getattr(getattr(request, 'user', None), 'profile_requests', False):
+            trigger = 'user'
+        else:
+            return response
+        
+        profile_id = save_profile(request, response, capture, duration, trigger)
+        response['X-Profile-Id'] = profile_id
+        logger.info(f"Kept profile {profile_id} of {request.method} {request.path} ({duration * 1000:.0f}ms, {trigger})")
+        return response
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-17 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0002_user_clerk_id"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                fields=["timezone", "reminder_time"], name="users_tz_reminder_idx"
+            ),
+        ),
+    ]
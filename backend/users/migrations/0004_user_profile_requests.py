@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_user_timezone_reminder_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="profile_requests",
+            field=models.BooleanField(default=False),
+        ),
+    ]
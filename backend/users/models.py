@@ -17,6 +17,9 @@ class User(AbstractUser):
     email_notifications = models.BooleanField(default=True)
     reminder_time = models.TimeField(default='09:00:00')
     
+    # Keep a stack and SQL profile of this user's slow requests (see users/profiling.py)
+    profile_requests = models.BooleanField(default=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -24,6 +27,10 @@ class User(AbstractUser):
         db_table = 'users'
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            # Reminder scheduling selects users by timezone and reminder_time
+            models.Index(fields=['timezone', 'reminder_time'], name='users_tz_reminder_idx'),
+        ]
     
     def __str__(self):
         return self.username
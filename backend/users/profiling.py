@@ -0,0 +1,211 @@
+"""
+Profiles of slow requests.
+
+RequestProfilingMiddleware (users.middleware) registers each /api/ request
+with a sampling profiler while REQUEST_PROFILING['ENABLED'] is on. One
+daemon thread per process reads the stacks of the registered request
+threads every INTERVAL_MS through sys._current_frames() and counts them.
+A capture is only armed once its request has run for THRESHOLD_MS, or right
+away for requests with the X-Profile header, so requests that finish sooner
+pay for a dict insert and an execute_wrapper that passes their SQL straight
+through. A request is kept when it carries the X-Profile header with
+REQUEST_PROFILING['TOKEN'], or when it belongs to a user with
+profile_requests set and took at least THRESHOLD_MS; its stacks and SQL then
+cover the time from arming on.
+
+Kept profiles go to the default cache for RETENTION seconds, and only the
+newest MAX_PROFILES are listed. Stacks are in the collapsed format
+("outer;inner;leaf count") that flamegraph.pl and speedscope read.
+"""
+from collections import Counter
+import os
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+DEFAULTS = {
+    'ENABLED': False,
+    'THRESHOLD_MS': 500,
+    'TOKEN': '',
+    'INTERVAL_MS': 5,
+    'MAX_PROFILES': 100,
+    'RETENTION': 24 * 3600,
+}
+
+INDEX_KEY = 'request_profiles:index'
+
+# Bounds on the size of one stored profile
+MAX_QUERIES = 500
+MAX_SQL_LENGTH = 2000
+MAX_STACK_DEPTH = 80
+
+
+def profiling_setting(name):
+    return getattr(settings, 'REQUEST_PROFILING', {}).get(name, DEFAULTS[name])
+
+
+def frame_label(frame, prefixes):
+    code = frame.f_code
+    filename = code.co_filename
+    for prefix in prefixes:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    return f'{code.co_qualname} ({filename}:{frame.f_lineno})'
+
+
+class Capture:
+    """Stack samples and SQL statements of one request, recorded once it is armed after delay seconds"""
+
+    # Stripped from file names in stack labels, longest first
+    prefixes = sorted({f'{path}{os.sep}' for path in sys.path if path} | {f'{settings.BASE_DIR}{os.sep}'}, key=len, reverse=True)
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.arm_at = time.perf_counter() + delay
+        self.armed = delay <= 0
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.samples = 0
+        self.queries = []
+        self.query_count = 0
+        self.db_time = 0.0
+        self.closed = False
+
+    def add_stack(self, frame):
+        labels = []
+        while frame is not None and len(labels) < MAX_STACK_DEPTH:
+            labels.append(frame_label(frame, self.prefixes))
+            frame = frame.f_back
+        key = ';'.join(reversed(labels))
+        with self.lock:
+            if not self.closed:
+                self.stacks[key] += 1
+                self.samples += 1
+
+    def database_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook keeping the statements and their time"""
+        if not self.armed:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db_time += elapsed
+            self.query_count += 1
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({'sql': sql[:MAX_SQL_LENGTH], 'many': many, 'ms': round(elapsed * 1000, 2)})
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+
+    def collapsed_stacks(self):
+        return [f'{stack} {count}' for stack, count in self.stacks.most_common()]
+
+
+class StackSampler:
+    """Samples the stacks of registered threads from one background thread"""
+
+    def __init__(self):
+        self.active = {}  # Thread ident: Capture
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def register(self, capture):
+        self.active[threading.get_ident()] = capture
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                # Started lazily, so each forked worker process gets its own thread
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self.run, name='request-profiler', daemon=True)
+                    self.thread.start()
+
+    def unregister(self):
+        capture = self.active.pop(threading.get_ident(), None)
+        if capture is not None:
+            capture.close()
+        return capture
+
+    def run(self):
+        while True:
+            time.sleep(profiling_setting('INTERVAL_MS') / 1000)
+            if not self.active:
+                continue
+            now = time.perf_counter()
+            armed = []
+            for ident, capture in list(self.active.items()):
+                if not capture.armed and now >= capture.arm_at:
+                    capture.armed = True
+                if capture.armed:
+                    armed.append((ident, capture))
+            if not armed:
+                continue
+            frames = sys._current_frames()
+            for ident, capture in armed:
+                frame = frames.get(ident)
+                if frame is not None:
+                    capture.add_stack(frame)
+
+
+SAMPLER = StackSampler()
+
+
+def profile_key(profile_id):
+    return f'request_profiles:{profile_id}'
+
+
+def save_profile(request, response, capture, duration, trigger):
+    """Store the capture of a finished request; returns the profile id"""
+    profile_id = uuid.uuid4().hex[:16]
+    user = getattr(request, 'user', None)
+    profile = {
+        'id': profile_id,
+        'created_at': timezone.now().isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'query_string': request.META.get('QUERY_STRING', ''),
+        'status': response.status_code,
+        'user_id': user.pk if getattr(user, 'is_authenticated', False) else None,
+        'trigger': trigger,
+        'duration_ms': round(duration * 1000, 1),
+        'interval_ms': profiling_setting('INTERVAL_MS'),
+        # Stacks and queries are only recorded from this point of the request on
+        'capture_delay_ms': round(capture.delay * 1000, 1),
+        'samples': capture.samples,
+        'stacks': capture.collapsed_stacks(),
+        'query_count': capture.query_count,
+        'db_ms': round(capture.db_time * 1000, 1),
+        'queries': capture.queries,
+    }
+    retention = profiling_setting('RETENTION')
+    cache.set(profile_key(profile_id), profile, retention)
+
+    # Workers updating the index at the same moment can drop an id; the profile itself still expires on its own
+    index = [profile_id] + (cache.get(INDEX_KEY) or [])
+    cache.set(INDEX_KEY, index[:profiling_setting('MAX_PROFILES')], retention)
+    return profile_id
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first"""
+    ids = cache.get(INDEX_KEY) or []
+    profiles = cache.get_many([profile_key(profile_id) for profile_id in ids])
+    summaries = []
+    for profile_id in ids:
+        profile = profiles.get(profile_key(profile_id))
+        if profile is not None:
+            summaries.append({
+                key: value for key, value in profile.items() if key not in ('stacks', 'queries')
+            })
+    return summaries
+
+
+def get_profile(profile_id):
+    return cache.get(profile_key(profile_id))
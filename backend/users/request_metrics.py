@@ -0,0 +1,122 @@
+"""
+Per-request metrics.
+
+RequestMetricsMiddleware (users.middleware) creates a RequestMetrics for each
+sampled /api/ request and makes it current for the request's context. The
+database is measured through connection.execute_wrapper, and the code on the
+request path reports cache lookups and timed sections through the functions
+below, which do nothing outside a sampled request.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import contextvars
+import time
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Counters and timings of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Verified token lookups, kept apart from the response cache
+        self.token_cache_hits = 0
+        self.token_cache_misses = 0
+        self.timings = defaultdict(float)  # Section name: seconds
+        self.response_size = None
+
+    def database_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook counting queries and their time"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    def finish(self, response):
+        self.duration = time.perf_counter() - self.started
+        if not getattr(response, 'streaming', False):
+            self.response_size = len(response.content)
+
+    def server_timing(self):
+        """Server-Timing header value, durations in milliseconds"""
+        parts = [f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"']
+        for name, seconds in sorted(self.timings.items()):
+            parts.append(f'{name};dur={seconds * 1000:.1f}')
+        parts.append(f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"')
+        if self.token_cache_hits or self.token_cache_misses:
+            parts.append(f'token-cache;desc="{self.token_cache_hits} hits, {self.token_cache_misses} misses"')
+        parts.append(f'total;dur={self.duration * 1000:.1f}')
+        return ', '.join(parts)
+
+    def as_dict(self):
+        return {
+            'duration_ms': round(self.duration * 1000, 1),
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'token_cache_hits': self.token_cache_hits,
+            'token_cache_misses': self.token_cache_misses,
+            **{f'{name}_ms': round(seconds * 1000, 1) for name, seconds in sorted(self.timings.items())},
+            'response_bytes': self.response_size,
+        }
+
+
+def activate(metrics):
+    """Make metrics current for this context; returns a token for deactivate()"""
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def current_metrics():
+    return _current.get()
+
+
+def record_cache(hit):
+    """Count a response cache hit or miss on the current request"""
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+def record_token_cache(hit):
+    """Count a verified token cache hit or miss on the current request"""
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.token_cache_hits += 1
+        else:
+            metrics.token_cache_misses += 1
+
+
+def add_timing(name, seconds):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.timings[name] += seconds
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's `name` timing"""
+    if _current.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, time.perf_counter() - started)
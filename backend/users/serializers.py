@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from activities.scheduling import zone_names
 
 User = get_user_model()
 
@@ -25,4 +26,10 @@ class UserUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('first_name', 'last_name', 'bio', 'profile_picture', 
-                 'timezone', 'email_notifications', 'reminder_time') 
\ No newline at end of file
+                 'timezone', 'email_notifications', 'reminder_time')
+    
+    def validate_timezone(self, value):
+        """Validate that timezone is a known IANA zone name"""
+        if value not in zone_names():
+            raise serializers.ValidationError("Unknown timezone")
+        return value
@@ -0,0 +1,17 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from activities.cache import bump_user_generation
+from .utils import forget_clerk_user
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Drop the cached copy of a user and their cached responses whenever the row changes"""
+    if instance.clerk_id:
+        forget_clerk_user(instance.clerk_id)
+    bump_user_generation(instance.pk)
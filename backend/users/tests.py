@@ -1,3 +1,516 @@
-from django.test import TestCase
+from datetime import date, datetime, timezone as dt_timezone
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from cryptography.hazmat.primitives.asymmetric import rsa
+import jwt
+from jwt.algorithms import RSAAlgorithm
+import requests
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from activities.models import Activity, StreakEntry
+from streakflow.metrics import REGISTRY, REMINDERS, Counter, Histogram, Registry
+from .authentication import ClerkAuthentication, JWKSCache, VerifiedTokenCache
+from .request_metrics import RequestMetrics, activate, deactivate
+from .profiling import SAMPLER, Capture, get_profile
+from .utils import USER_CACHE_TTL, cache_clerk_user, get_cached_clerk_user, resolve_clerk_user
+from .localtime import bucket_by_local_date, get_zone, local_dates, user_local_dates
+
+User = get_user_model()
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# 12:00 UTC: already the next day in Kiritimati (UTC+14), still the same day in Honolulu (UTC-10)
+NOON_UTC = datetime(2026, 3, 10, 12, 0, tzinfo=dt_timezone.utc)
+
+
+class LocalTimeTests(TestCase):
+    """Local dates follow each user's timezone"""
+
+    def test_local_dates_per_zone(self):
+        dates = local_dates(['UTC', 'Pacific/Kiritimati', 'Pacific/Honolulu', 'Not/AZone'], now=NOON_UTC)
+        self.assertEqual(dates, {
+            'UTC': date(2026, 3, 10),
+            'Pacific/Kiritimati': date(2026, 3, 11),
+            'Pacific/Honolulu': date(2026, 3, 10),
+            'Not/AZone': date(2026, 3, 10),
+        })
+        self.assertIs(get_zone('Pacific/Kiritimati'), get_zone('Pacific/Kiritimati'))
+
+    def test_bucket_users_by_local_date(self):
+        users = [
+            User.objects.create(username=f'user{index}', clerk_id=f'user_{index}', timezone=zone)
+            for index, zone in enumerate(['UTC', 'Pacific/Kiritimati', 'Pacific/Auckland', 'Pacific/Kiritimati'])
+        ]
+
+        buckets = bucket_by_local_date(users, now=NOON_UTC)
+        self.assertEqual(buckets[date(2026, 3, 10)], [users[0]])
+        self.assertEqual(buckets[date(2026, 3, 11)], users[1:])
+
+        with self.assertNumQueries(1):
+            dates = user_local_dates([user.id for user in users], now=NOON_UTC)
+        self.assertEqual(dates[users[2].id], date(2026, 3, 11))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_completion_uses_local_today(self):
+        user = User.objects.create(username='kiritimati', clerk_id='user_kiritimati', timezone='Pacific/Kiritimati')
+        activity = Activity.objects.create(user=user, title='Swim')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with mock.patch('django.utils.timezone.now', return_value=NOON_UTC):
+            response = client.post(f'/api/activities/complete/{activity.id}/', format='json')
+            self.assertEqual(response.json()['entry']['date'], '2026-03-11')
+            self.assertTrue(response.json()['activity']['completed_today'])
+
+            listed = client.get('/api/activities/').json()
+            listed = listed.get('results', listed)
+            self.assertEqual(listed[0]['current_streak'], 1)
+
+        self.assertTrue(StreakEntry.objects.filter(activity=activity, date=date(2026, 3, 11), completed=True).exists())
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_profile_accepts_only_known_zones(self):
+        user = User.objects.create(username='zones', clerk_id='user_zones')
+        client = APIClient()
+        client.force_authenticate(user)
+        url = '/api/users/profile/update/'
+
+        self.assertEqual(client.patch(url, {'timezone': 'Mars/Olympus_Mons'}, format='json').status_code, 400)
+        self.assertEqual(client.patch(url, {'timezone': 'Europe/Lisbon'}, format='json').status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual(user.timezone, 'Europe/Lisbon')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ClerkUserCacheTests(TestCase):
+    """Resolved Clerk users come from the shared cache until their row changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username='annalee', clerk_id='user_cache', email='anna@example.com', first_name='Anna', last_name='Lee',
+        )
+
+    def test_miss_then_hit(self):
+        self.assertIsNone(get_cached_clerk_user('user_cache'))
+        with self.assertNumQueries(1):
+            resolved = resolve_clerk_user({'sub': 'user_cache'})
+        self.assertEqual(resolved, self.user)
+
+        with self.assertNumQueries(0):
+            cached = resolve_clerk_user({'sub': 'user_cache', 'first_name': 'Anna'})
+        self.assertEqual(cached.pk, self.user.pk)
+
+    def test_entries_expire(self):
+        cache_clerk_user(self.user)
+        later = time.time() + USER_CACHE_TTL + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertIsNone(get_cached_clerk_user('user_cache'))
+
+    def test_saving_the_user_invalidates(self):
+        cache_clerk_user(self.user)
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+
+        self.assertIsNone(get_cached_clerk_user('user_cache'))
+        self.assertFalse(resolve_clerk_user({'sub': 'user_cache'}).is_active)
+
+    def test_concurrent_insert_returns_the_existing_row(self):
+        def racing_username(clerk_id, profile):
+            # Another worker inserts the same Clerk ID between the lookup and the insert
+            User.objects.create(username='winner', clerk_id=clerk_id)
+            return 'loser'
+
+        with mock.patch('users.utils.username_for_profile', racing_username):
+            user = resolve_clerk_user({'sub': 'user_race', 'email': 'race@example.com'})
+
+        self.assertEqual(user.username, 'winner')
+        self.assertEqual(User.objects.filter(clerk_id='user_race').count(), 1)
+
+    def test_prefix_rename(self):
+        resolved = resolve_clerk_user({'sub': 'user_cache', 'first_name': 'Anna', 'last_name': 'Le'})
+        self.assertEqual(resolved.username, 'annale')
+        self.assertEqual(User.objects.get(pk=self.user.pk).username, 'annale')
+
+    def test_rename_to_a_taken_username_gets_a_suffix(self):
+        User.objects.create(username='annabell', clerk_id='user_other')
+        resolved = resolve_clerk_user({'sub': 'user_cache', 'first_name': 'Anna', 'last_name': 'Bell'})
+        self.assertEqual(resolved.username, 'annabell_cache')
+
+
+def rsa_jwk(kid):
+    """(private key, public JWK dict) of a fresh RSA key"""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    return private_key, {**jwk, 'kid': kid, 'use': 'sig', 'alg': 'RS256'}
+
+
+def jwks_response(*jwks):
+    response = mock.Mock()
+    response.json.return_value = {'keys': list(jwks)}
+    return response
+
+
+ISSUER = 'https://clerk.example.com'
+JWKS_URL = f'{ISSUER}/.well-known/jwks.json'
+
+
+@override_settings(CLERK={'JWT_ISSUER': ISSUER, 'JWKS_CACHE_TTL': 3600, 'JWKS_MIN_REFETCH_INTERVAL': 30, 'TOKEN_CACHE_SIZE': 2})
+class TokenVerificationCacheTests(TestCase):
+    """Signing keys and verified tokens are cached per process"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.old_private, cls.old_jwk = rsa_jwk('old')
+        cls.new_private, cls.new_jwk = rsa_jwk('new')
+
+    def setUp(self):
+        self.jwks = JWKSCache()
+        self.tokens = VerifiedTokenCache()
+
+    def test_unknown_kid_refetches_the_key_set(self):
+        with mock.patch('users.authentication.requests.get') as get:
+            get.return_value = jwks_response(self.old_jwk)
+            self.assertEqual(self.jwks.get_signing_key(JWKS_URL, 'old').key_id, 'old')
+            self.jwks.get_signing_key(JWKS_URL, 'old')
+            self.assertEqual(get.call_count, 1)
+
+            # Key rotation: the token's kid is only in the new set
+            get.return_value = jwks_response(self.old_jwk, self.new_jwk)
+            with mock.patch('users.authentication.time.monotonic', return_value=time.monotonic() + 60):
+                self.assertEqual(self.jwks.get_signing_key(JWKS_URL, 'new').key_id, 'new')
+            self.assertEqual(get.call_count, 2)
+
+    def test_unknown_kids_are_rate_limited(self):
+        with mock.patch('users.authentication.requests.get', return_value=jwks_response(self.old_jwk)) as get:
+            self.jwks.get_signing_key(JWKS_URL, 'old')
+            for _ in range(3):
+                with self.assertRaises(jwt.InvalidTokenError):
+                    self.jwks.get_signing_key(JWKS_URL, 'bogus')
+            self.assertEqual(get.call_count, 1)
+
+            with mock.patch('users.authentication.time.monotonic', return_value=time.monotonic() + 60):
+                with self.assertRaises(jwt.InvalidTokenError):
+                    self.jwks.get_signing_key(JWKS_URL, 'bogus')
+            self.assertEqual(get.call_count, 2)
+
+    def test_failed_fetches_keep_the_stale_keys(self):
+        with mock.patch('users.authentication.requests.get', return_value=jwks_response(self.old_jwk)):
+            self.jwks.get_signing_key(JWKS_URL, 'old')
+
+        later = time.monotonic() + 7200
+        with mock.patch('users.authentication.requests.get', side_effect=requests.ConnectionError('down')), \
+                mock.patch('users.authentication.time.monotonic', return_value=later):
+            with self.assertRaises(jwt.InvalidTokenError):
+                self.jwks.get_signing_key(JWKS_URL, 'new')
+            self.jwks._background_refresh(JWKS_URL)
+            self.assertEqual(self.jwks.get_signing_key(JWKS_URL, 'old').key_id, 'old')
+        self.assertGreater(self.jwks._next_refresh_attempt, later)
+
+    def test_first_fetch_failure_raises(self):
+        with mock.patch('users.authentication.requests.get', side_effect=requests.ConnectionError('down')):
+            with self.assertRaises(requests.ConnectionError):
+                self.jwks.get_signing_key(JWKS_URL, 'old')
+
+    def test_token_cache_is_a_bounded_lru(self):
+        exp = time.time() + 600
+        for token in ('a', 'b'):
+            self.tokens.set(token, {'sub': token, 'exp': exp})
+        self.tokens.get('a')
+        self.tokens.set('c', {'sub': 'c', 'exp': exp})
+
+        self.assertIsNone(self.tokens.get('b'))
+        self.assertEqual(self.tokens.get('a')['sub'], 'a')
+        self.assertEqual(self.tokens.get('c')['sub'], 'c')
+
+    def test_cached_tokens_expire_at_exp(self):
+        exp = time.time() + 600
+        self.tokens.set('token', {'sub': 'user_exp', 'exp': exp})
+        with mock.patch('users.authentication.time.time', return_value=exp - 1):
+            self.assertIsNotNone(self.tokens.get('token'))
+        with mock.patch('users.authentication.time.time', return_value=exp):
+            self.assertIsNone(self.tokens.get('token'))
+
+    def test_verified_tokens_are_counted_apart_from_responses(self):
+        token = jwt.encode(
+            {'sub': 'user_token', 'iss': ISSUER, 'exp': int(time.time()) + 600},
+            self.old_private, algorithm='RS256', headers={'kid': 'old'},
+        )
+        metrics = RequestMetrics()
+        activation = activate(metrics)
+        try:
+            with mock.patch('users.authentication.jwks_cache', self.jwks), \
+                    mock.patch('users.authentication.verified_tokens', self.tokens), \
+                    mock.patch('users.authentication.requests.get', return_value=jwks_response(self.old_jwk)):
+                for _ in range(2):
+                    self.assertEqual(ClerkAuthentication().verify_clerk_token(token)['sub'], 'user_token')
+        finally:
+            deactivate(activation)
+
+        self.assertEqual((metrics.token_cache_hits, metrics.token_cache_misses), (1, 1))
+        self.assertEqual((metrics.cache_hits, metrics.cache_misses), (0, 0))
+        self.assertIn('token-cache;desc="1 hits, 1 misses"', metrics.server_timing())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RequestMetricsTests(TestCase):
+    """Sampled /api/ requests report their queries, cache use and timings"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='metrics', clerk_id='user_metrics')
+        Activity.objects.create(user=self.user, title='Walk')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('users.middleware', 'INFO') as logs:
+            response = self.client.get('/api/activities/dashboard/')
+            cached = self.client.get('/api/activities/dashboard/')
+
+        self.assertEqual(response.status_code, 200)
+        line = logs.records[0]
+        self.assertIn('path=/api/activities/dashboard/ status=200', line.getMessage())
+        queries = line.request_metrics['queries']
+        self.assertGreater(queries, 0)
+        self.assertEqual(line.request_metrics['response_bytes'], len(response.content))
+
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{queries} queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('cache;desc="0 hits, 1 misses"', timing)
+        self.assertIn('cache;desc="1 hits, 0 misses"', cached['Server-Timing'])
+
+    @override_settings(REQUEST_METRICS={'SAMPLE_RATE': 0})
+    def test_unsampled_requests_are_untouched(self):
+        response = self.client.get('/api/activities/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, METRICS={'TOKEN': 'scrape-secret'})
+class PrometheusMetricsTests(TestCase):
+    """In-process metrics, merged across processes and served on /metrics"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='prometheus', clerk_id='user_prometheus')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_exposition_format(self):
+        registry = Registry()
+        counter = Counter(registry, 'test_events', 'Events seen', ('kind',))
+        histogram = Histogram(registry, 'test_seconds', 'Time spent', buckets=(0.1, 1.0))
+        counter.inc('a "quoted"\nvalue', amount=2)
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(3.0)
+
+        self.assertEqual(registry.exposition().splitlines(), [
+            '# HELP test_events_total Events seen',
+            '# TYPE test_events_total counter',
+            'test_events_total{kind="a \\"quoted\\"\\nvalue"} 2',
+            '# HELP test_seconds Time spent',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 1',
+            'test_seconds_bucket{le="1.0"} 2',
+            'test_seconds_bucket{le="+Inf"} 3',
+            'test_seconds_sum 3.55',
+            'test_seconds_count 3',
+        ])
+
+    def write_snapshot(self, directory, filename, kind, value):
+        with open(os.path.join(directory, filename), 'w') as handle:
+            json.dump({'streakflow_reminders': [[[kind, 'sent'], value]]}, handle)
+
+    def test_snapshots_of_other_processes_are_added(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS={'MULTIPROCESS_DIR': directory}):
+            REMINDERS.inc('merge-test', 'sent', amount=2)
+            REGISTRY.flush()
+            self.write_snapshot(directory, f'metrics-{os.getppid()}-parent.json', 'merge-test', 3)
+            # An earlier process with the same PID leaves its own snapshot
+            self.write_snapshot(directory, f'metrics-{os.getpid()}-earlier.json', 'merge-test', 4)
+
+            self.assertTrue(os.path.exists(REGISTRY.snapshot_path(directory)))
+            self.assertIn('streakflow_reminders_total{kind="merge-test",status="sent"} 9', REGISTRY.exposition())
+
+    def test_snapshots_of_exited_processes_are_archived(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS={'MULTIPROCESS_DIR': directory}):
+            REMINDERS.inc('archive-test', 'sent')
+            self.write_snapshot(directory, f'metrics-{process.pid}-first.json', 'archive-test', 3)
+            self.write_snapshot(directory, f'metrics-{process.pid}-second.json', 'archive-test', 4)
+
+            for _ in range(2):
+                self.assertIn('streakflow_reminders_total{kind="archive-test",status="sent"} 8', REGISTRY.exposition())
+            self.assertEqual(sorted(name for name in os.listdir(directory) if name.endswith('.json')), ['archive.json'])
+
+    def test_api_requests_are_timed_by_view(self):
+        self.client.get('/api/activities/dashboard/')
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(
+            'streakflow_http_request_duration_seconds_count{view="activities:dashboard_stats",method="GET",status="200"}',
+            response.content.decode(),
+        )
+
+    def test_endpoint_requires_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+
+    @override_settings(METRICS={})
+    def test_endpoint_without_token_is_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save(update_fields=['is_staff'])
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+PROFILING = {'ENABLED': True, 'TOKEN': 'profile-secret', 'THRESHOLD_MS': 0, 'INTERVAL_MS': 1}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RequestProfilingTests(TestCase):
+    """Slow or explicitly flagged requests leave a stack and SQL profile for admins"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='profiled', clerk_id='user_profiled')
+        Activity.objects.create(user=self.user, title='Walk')
+
+    def client_for(self, user):
+        # Created after the settings override, since the middleware reads its settings once
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_header_token_keeps_the_profile(self):
+        with self.settings(REQUEST_PROFILING=PROFILING):
+            client = self.client_for(self.user)
+            response = client.get('/api/activities/dashboard/', HTTP_X_PROFILE='profile-secret')
+            wrong_token = client.get('/api/activities/dashboard/', HTTP_X_PROFILE='guess')
+
+        profile = get_profile(response['X-Profile-Id'])
+        self.assertEqual(profile['trigger'], 'header')
+        self.assertEqual(profile['path'], '/api/activities/dashboard/')
+        self.assertEqual(profile['status'], 200)
+        self.assertGreater(profile['query_count'], 0)
+        self.assertEqual(len(profile['queries']), profile['query_count'])
+        self.assertNotIn('X-Profile-Id', wrong_token)
+
+    def test_flagged_users_keep_slow_requests_only(self):
+        self.user.profile_requests = True
+        self.user.save(update_fields=['profile_requests'])
+        other = User.objects.create(username='unflagged', clerk_id='user_unflagged')
+
+        with self.settings(REQUEST_PROFILING=PROFILING):
+            flagged = self.client_for(self.user).get('/api/activities/')
+            unflagged = self.client_for(other).get('/api/activities/')
+        with self.settings(REQUEST_PROFILING={**PROFILING, 'THRESHOLD_MS': 60000}):
+            fast = self.client_for(self.user).get('/api/activities/')
+
+        self.assertEqual(get_profile(flagged['X-Profile-Id'])['user_id'], self.user.id)
+        self.assertNotIn('X-Profile-Id', unflagged)
+        self.assertNotIn('X-Profile-Id', fast)
+
+    def test_slow_request_stacks_are_sampled(self):
+        def slow_analytics(*args):
+            time.sleep(0.05)
+            return {}
+
+        with self.settings(REQUEST_PROFILING=PROFILING), mock.patch('activities.views.build_analytics', slow_analytics):
+            response = self.client_for(self.user).get('/api/activities/analytics/', HTTP_X_PROFILE='profile-secret')
+
+        profile = get_profile(response['X-Profile-Id'])
+        self.assertGreater(profile['samples'], 5)
+        self.assertGreaterEqual(profile['duration_ms'], 50)
+        self.assertTrue(any('slow_analytics' in stack for stack in profile['stacks']))
+        self.assertTrue(any('analytics (activities/views.py:' in stack for stack in profile['stacks']))
+
+    def test_forced_requests_are_captured_from_the_start(self):
+        with self.settings(REQUEST_PROFILING={**PROFILING, 'THRESHOLD_MS': 60000}):
+            response = self.client_for(self.user).get('/api/activities/dashboard/', HTTP_X_PROFILE='profile-secret')
+
+        profile = get_profile(response['X-Profile-Id'])
+        self.assertEqual(profile['capture_delay_ms'], 0)
+        self.assertGreater(profile['query_count'], 0)
+
+    def test_slow_requests_are_captured_after_the_threshold(self):
+        self.user.profile_requests = True
+        self.user.save(update_fields=['profile_requests'])
+
+        def slow_analytics(*args):
+            time.sleep(0.08)
+            return {}
+
+        with self.settings(REQUEST_PROFILING={**PROFILING, 'THRESHOLD_MS': 20}), \
+                mock.patch('activities.views.build_analytics', slow_analytics):
+            response = self.client_for(self.user).get('/api/activities/analytics/')
+
+        profile = get_profile(response['X-Profile-Id'])
+        self.assertEqual((profile['trigger'], profile['capture_delay_ms']), ('user', 20))
+        self.assertGreater(profile['samples'], 0)
+        self.assertTrue(any('slow_analytics' in stack for stack in profile['stacks']))
+
+    def test_captures_record_nothing_before_they_are_armed(self):
+        capture = Capture(delay=60)
+        self.assertEqual(capture.database_wrapper(lambda *args: 'rows', 'SELECT 1', None, False, {}), 'rows')
+        self.assertEqual((capture.query_count, capture.queries), (0, []))
+
+        with self.settings(REQUEST_PROFILING=PROFILING):
+            for delay, armed in ((60, False), (0.01, True)):
+                capture = Capture(delay=delay)
+                SAMPLER.register(capture)
+                try:
+                    time.sleep(0.06)
+                finally:
+                    SAMPLER.unregister()
+                self.assertEqual(capture.armed, armed)
+                self.assertEqual(capture.samples > 0, armed)
+
+    def test_disabled_by_default(self):
+        response = self.client_for(self.user).get('/api/activities/dashboard/', HTTP_X_PROFILE='profile-secret')
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_stacks_are_collapsed_outermost_first(self):
+        capture = Capture()
+        for _ in range(2):
+            capture.add_stack(sys._getframe())
+
+        [line] = capture.collapsed_stacks()
+        stack, count = line.rsplit(' ', 1)
+        self.assertEqual(count, '2')
+        self.assertIn('RequestProfilingTests.test_stacks_are_collapsed_outermost_first (users/tests.py:', stack.split(';')[-1])
+
+    def test_admins_list_and_download_profiles(self):
+        with self.settings(REQUEST_PROFILING=PROFILING):
+            profile_id = self.client_for(self.user).get(
+                '/api/activities/calendar/?start_date=2026-01-01&end_date=2026-01-31', HTTP_X_PROFILE='profile-secret',
+            )['X-Profile-Id']
+
+        self.assertEqual(self.client_for(self.user).get('/api/users/profiles/').status_code, 403)
+
+        admin = User.objects.create(username='admin', clerk_id='user_admin', is_staff=True)
+        client = self.client_for(admin)
+        listed = client.get('/api/users/profiles/').json()
+        self.assertEqual([profile['id'] for profile in listed['profiles']], [profile_id])
+        self.assertNotIn('stacks', listed['profiles'][0])
+
+        download = client.get(f'/api/users/profiles/{profile_id}/')
+        self.assertEqual(download['Content-Disposition'], f'attachment; filename="profile-{profile_id}.json"')
+        self.assertLessEqual({'stacks', 'queries', 'duration_ms'}, set(json.loads(download.content)))
+        self.assertEqual(client.get('/api/users/profiles/0123456789abcdef/').status_code, 404)
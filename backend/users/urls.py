@@ -15,4 +15,8 @@ urlpatterns = [
     # User info endpoints
     path('current/', views.current_user_info, name='current_user_info'),
     path('all/', views.all_users_info, name='all_users_info'),
+    
+    # Profiles of slow requests (admin only)
+    path('profiles/', views.request_profiles, name='request_profiles'),
+    path('profiles/<slug:profile_id>/', views.request_profile_download, name='request_profile_download'),
 ] 
\ No newline at end of file
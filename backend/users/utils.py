@@ -1,45 +1,174 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from activities.cache import bump_user_generation
+import logging
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+# Resolved users are kept in the shared cache only, so a change to is_active or
+# is_staff reaches every worker as soon as the row is saved
+USER_CACHE_TTL = 300
+
+
+def _user_cache_key(clerk_id):
+    return f'clerk_user:{clerk_id}'
+
+
+def cache_clerk_user(user):
+    """Store a resolved user in the shared cache"""
+    cache.set(_user_cache_key(user.clerk_id), user, USER_CACHE_TTL)
+
+
+def forget_clerk_user(clerk_id):
+    """Drop a user from the shared cache"""
+    cache.delete(_user_cache_key(clerk_id))
+
+
+def get_cached_clerk_user(clerk_id):
+    """Return the cached user for a Clerk ID, or None"""
+    return cache.get(_user_cache_key(clerk_id))
+
+
+def profile_from_claims(claims):
+    """Extract email, first and last name from Clerk claims or API data"""
+    email = claims.get('email', '') or ''
+    given_name = claims.get('given_name')
+    family_name = claims.get('family_name')
+    name = claims.get('name') or claims.get('full_name')
+
+    # Prefer given_name/family_name, then name, then first_name/last_name
+    if given_name or family_name:
+        first_name = given_name or ''
+        last_name = family_name or ''
+    elif name:
+        parts = name.split()
+        first_name = parts[0]
+        last_name = ' '.join(parts[1:]) if len(parts) > 1 else ''
+    else:
+        first_name = claims.get('first_name') or ''
+        last_name = claims.get('last_name') or ''
+
+    return {'email': email, 'first_name': first_name, 'last_name': last_name}
+
+
+def username_for_profile(clerk_id, profile):
+    """Build the preferred username for a Clerk profile"""
+    first_name = profile['first_name']
+    last_name = profile['last_name']
+    if first_name and last_name:
+        username = f"{first_name.lower()}{last_name.lower().replace(' ', '')}"
+    elif first_name:
+        username = first_name.lower()
+    elif profile['email']:
+        username = profile['email'].split('@')[0]
+    else:
+        username = f"user_{clerk_id[:8]}"
+    return username[:150]
+
+
+def _unique_username(username, clerk_id):
+    """Fallback username when the preferred one is taken"""
+    suffix = clerk_id[-6:]
+    return f"{username[:150 - len(suffix)]}{suffix}"
+
+
+def _insert_user(clerk_id, username, profile):
+    """Insert a user with a single statement that ignores unique conflicts"""
+    User.objects.bulk_create([
+        User(clerk_id=clerk_id, username=username, **profile)
+    ], ignore_conflicts=True)
+    return User.objects.filter(clerk_id=clerk_id).first()
+
+
+def resolve_clerk_user(claims, fetch_profile=None):
+    """
+    Return the user row for verified Clerk claims.
+
+    Users are served from the shared cache, and written only when the
+    claims carry profile data that differs from the stored row. Unknown Clerk
+    IDs are created with one conflict-tolerant insert; fetch_profile(clerk_id)
+    is only called then, when the token itself has no profile claims.
+    """
+    clerk_id = claims.get('sub')
+    if not clerk_id:
+        raise ValueError("No user ID in token")
+
+    profile = profile_from_claims(claims)
+
+    user = get_cached_clerk_user(clerk_id)
+    if user is None:
+        user = User.objects.filter(clerk_id=clerk_id).first()
+        if user is None:
+            if not any(profile.values()) and fetch_profile is not None:
+                api_data = fetch_profile(clerk_id) or {}
+                emails = api_data.get('email_addresses') or [{}]
+                profile = profile_from_claims({
+                    'email': emails[0].get('email_address', ''),
+                    'first_name': api_data.get('first_name'),
+                    'last_name': api_data.get('last_name'),
+                    'full_name': api_data.get('full_name'),
+                })
+
+            username = username_for_profile(clerk_id, profile)
+            user = _insert_user(clerk_id, username, profile)
+            if user is None:
+                # The username is taken by someone else
+                user = _insert_user(clerk_id, _unique_username(username, clerk_id), profile)
+            if user is None:
+                raise IntegrityError(f"Could not create user for Clerk ID {clerk_id}")
+            logger.info(f"Created new user: {user.username} with Clerk ID: {clerk_id}")
+        cache_clerk_user(user)
+
+    # Only write when the claims actually changed something
+    changes = {
+        field: value for field, value in profile.items()
+        if value and getattr(user, field) != value
+    }
+    if changes.get('first_name') or changes.get('last_name'):
+        username = username_for_profile(clerk_id, {**profile, 'email': user.email})
+        if username != user.username:
+            # A name taken by someone else falls back to _unique_username below
+            changes['username'] = username
+
+    if changes:
+        changes['updated_at'] = timezone.now()
+        try:
+            with transaction.atomic():
+                User.objects.filter(pk=user.pk).update(**changes)
+        except IntegrityError:
+            if 'username' not in changes:
+                raise
+            changes['username'] = _unique_username(changes['username'], clerk_id)
+            User.objects.filter(pk=user.pk).update(**changes)
+        for field, value in changes.items():
+            setattr(user, field, value)
+        cache_clerk_user(user)
+        bump_user_generation(user.pk)
+        logger.info(f"Updated user info for: {user.username}")
+
+    return user
+
 
 def get_or_create_user_with_clerk_data(clerk_user):
     """
     Get or create a user with proper Clerk data handling.
-    Updates existing user data if new information is available.
+
+    ClerkAuthentication already resolves request.user to the stored row, in
+    which case it is returned as-is without touching the database.
     """
     if not hasattr(clerk_user, 'clerk_id') or not clerk_user.clerk_id:
         raise ValueError("User does not have a valid Clerk ID")
-    
-    clerk_id = clerk_user.clerk_id
-    
-    user, created = User.objects.get_or_create(
-        clerk_id=clerk_id,
-        defaults={
-            'username': getattr(clerk_user, 'username', '') or getattr(clerk_user, 'email', ''),
-            'email': getattr(clerk_user, 'email', ''),
-            'first_name': getattr(clerk_user, 'first_name', '') or '',
-            'last_name': getattr(clerk_user, 'last_name', '') or '',
-        }
-    )
-    
-    # Update user data if not created or if new data is available
-    if not created:
-        updated = False
-        
-        if getattr(clerk_user, 'email', None) and clerk_user.email != user.email:
-            user.email = clerk_user.email
-            updated = True
-            
-        if getattr(clerk_user, 'first_name', None) and clerk_user.first_name != user.first_name:
-            user.first_name = clerk_user.first_name
-            updated = True
-            
-        if getattr(clerk_user, 'last_name', None) and clerk_user.last_name != user.last_name:
-            user.last_name = clerk_user.last_name
-            updated = True
-        
-        if updated:
-            user.save()
-    
-    return user 
\ No newline at end of file
+
+    if isinstance(clerk_user, User) and clerk_user.pk is not None:
+        return clerk_user
+
+    return resolve_clerk_user({
+        'sub': clerk_user.clerk_id,
+        'email': getattr(clerk_user, 'email', ''),
+        'first_name': getattr(clerk_user, 'first_name', ''),
+        'last_name': getattr(clerk_user, 'last_name', ''),
+    })
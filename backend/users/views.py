@@ -3,7 +3,11 @@ from rest_framework.decorators import api_view, permission_classes, authenticati
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
+from django.http import JsonResponse
 from users.authentication import ClerkAuthentication
+from users.profiling import get_profile, list_profiles
+from users.utils import get_or_create_user_with_clerk_data
+from activities.cache import cached_user_response
 from .serializers import UserProfileSerializer, UserUpdateSerializer
 
 User = get_user_model()
@@ -16,56 +20,8 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     authentication_classes = [ClerkAuthentication]
     
     def get_object(self):
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        # Immediate debug print
-        print(f"🔍 UserProfileView.get_object() called - request.user: {self.request.user}")
-        print(f"🔍 User type: {type(self.request.user)}")
-        print(f"🔍 User authenticated: {getattr(self.request.user, 'is_authenticated', 'No is_authenticated attr')}")
-        
-        # Debug: Log the request user
-        logger.info(f"UserProfileView.get_object() - request.user: {self.request.user}")
-        logger.info(f"UserProfileView.get_object() - request.user type: {type(self.request.user)}")
-        logger.info(f"UserProfileView.get_object() - request.user attributes: {dir(self.request.user)}")
-        
-        # Get user by Clerk ID
-        if not hasattr(self.request.user, 'clerk_id') or not self.request.user.clerk_id:
-            print(f"❌ User does not have a valid Clerk ID. User: {self.request.user}")
-            logger.error(f"User does not have a valid Clerk ID. User: {self.request.user}")
-            raise ValueError("User does not have a valid Clerk ID")
-        
-        clerk_id = self.request.user.clerk_id
-        logger.info(f"Processing user with Clerk ID: {clerk_id}")
-        
-        try:
-            user, created = User.objects.get_or_create(
-                clerk_id=clerk_id,
-                defaults={
-                    'username': getattr(self.request.user, 'username', '') or getattr(self.request.user, 'email', ''),
-                    'email': getattr(self.request.user, 'email', ''),
-                    'first_name': getattr(self.request.user, 'first_name', '') or '',
-                    'last_name': getattr(self.request.user, 'last_name', '') or '',
-                }
-            )
-            
-            logger.info(f"User {'created' if created else 'found'}: {user.username}")
-            
-            # Update user data if not created
-            if not created:
-                if getattr(self.request.user, 'email', None) and self.request.user.email != user.email:
-                    user.email = self.request.user.email
-                if getattr(self.request.user, 'first_name', None) and self.request.user.first_name != user.first_name:
-                    user.first_name = self.request.user.first_name
-                if getattr(self.request.user, 'last_name', None) and self.request.user.last_name != user.last_name:
-                    user.last_name = self.request.user.last_name
-                user.save()
-            
-            return user
-            
-        except Exception as e:
-            logger.error(f"Error in get_object(): {str(e)}")
-            raise
+        # ClerkAuthentication has already resolved the stored user
+        return get_or_create_user_with_clerk_data(self.request.user)
 
 
 class UserUpdateView(generics.UpdateAPIView):
@@ -75,79 +31,37 @@ class UserUpdateView(generics.UpdateAPIView):
     authentication_classes = [ClerkAuthentication]
     
     def get_object(self):
-        if not hasattr(self.request.user, 'clerk_id') or not self.request.user.clerk_id:
-            raise ValueError("User does not have a valid Clerk ID")
-        
-        clerk_id = self.request.user.clerk_id
-        user, created = User.objects.get_or_create(
-            clerk_id=clerk_id,
-            defaults={
-                'username': getattr(self.request.user, 'username', '') or getattr(self.request.user, 'email', ''),
-                'email': getattr(self.request.user, 'email', ''),
-                'first_name': getattr(self.request.user, 'first_name', '') or '',
-                'last_name': getattr(self.request.user, 'last_name', '') or '',
-            }
-        )
-        
-        # Update user data if not created
-        if not created:
-            if getattr(self.request.user, 'email', None) and self.request.user.email != user.email:
-                user.email = self.request.user.email
-            if getattr(self.request.user, 'first_name', None) and self.request.user.first_name != user.first_name:
-                user.first_name = self.request.user.first_name
-            if getattr(self.request.user, 'last_name', None) and self.request.user.last_name != user.last_name:
-                user.last_name = self.request.user.last_name
-            user.save()
-        
-        return user
+        return get_or_create_user_with_clerk_data(self.request.user)
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 @authentication_classes([ClerkAuthentication])
+@cached_user_response('user_stats')
 def user_stats(request):
     """Get user statistics for dashboard with Clerk authentication"""
-    from activities.models import Activity
+    from activities.streaks import calculate_activity_metrics
     
     # Get or create user
     if not hasattr(request.user, 'clerk_id') or not request.user.clerk_id:
         return Response({'error': 'User does not have a valid Clerk ID'}, status=status.HTTP_400_BAD_REQUEST)
     
-    clerk_id = request.user.clerk_id
-    user, created = User.objects.get_or_create(
-        clerk_id=clerk_id,
-        defaults={
-            'username': getattr(request.user, 'username', '') or getattr(request.user, 'email', ''),
-            'email': getattr(request.user, 'email', ''),
-            'first_name': getattr(request.user, 'first_name', '') or '',
-            'last_name': getattr(request.user, 'last_name', '') or '',
-        }
-    )
-    
-    # Update user data if not created
-    if not created:
-        if request.user.email and request.user.email != user.email:
-            user.email = request.user.email
-        if request.user.first_name and request.user.first_name != user.first_name:
-            user.first_name = request.user.first_name
-        if request.user.last_name and request.user.last_name != user.last_name:
-            user.last_name = request.user.last_name
-        user.save()
+    user = get_or_create_user_with_clerk_data(request.user)
     
-    # Get user's activities
-    activities = user.activities.all()
+    # Get user's activities and their metrics in one batch
+    metrics = calculate_activity_metrics(user.activities.all()).values()
     
     # Calculate stats
-    total_activities = activities.count()
-    active_streaks = sum(1 for activity in activities if activity.current_streak > 0)
-    completed_today = sum(1 for activity in activities if activity.completed_today)
+    total_activities = len(metrics)
+    active_streaks = sum(1 for m in metrics if m['current_streak'] > 0)
+    completed_today = sum(1 for m in metrics if m['completed_today'])
     
     # Calculate average streak
-    total_streak = sum(activity.current_streak for activity in activities)
+    total_streak = sum(m['current_streak'] for m in metrics)
     average_streak = round(total_streak / total_activities, 1) if total_activities > 0 else 0
     
     # Calculate weekly progress
-    total_weekly_progress = sum(activity.weekly_progress for activity in activities)
+    total_weekly_progress = sum(m['weekly_progress'] for m in metrics)
     weekly_progress = round(total_weekly_progress / total_activities, 1) if total_activities > 0 else 0
     
     return Response({
@@ -168,69 +82,62 @@ def user_stats(request):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 @authentication_classes([ClerkAuthentication])
+@cached_user_response('user_profile_stats')
 def user_profile_stats(request):
     """Get comprehensive user statistics for profile page"""
-    from activities.models import Activity, StreakEntry
-    from django.utils import timezone
-    from datetime import timedelta
+    from activities.models import DailyUserRollup
+    from activities.streaks import current_streak_expression
+    from django.db.models import Count, Max, Min, Sum
+    from .localtime import user_today
     
     # Get or create user
     if not hasattr(request.user, 'clerk_id') or not request.user.clerk_id:
         return Response({'error': 'User does not have a valid Clerk ID'}, status=status.HTTP_400_BAD_REQUEST)
     
-    clerk_id = request.user.clerk_id
-    user, created = User.objects.get_or_create(
-        clerk_id=clerk_id,
-        defaults={
-            'username': getattr(request.user, 'username', '') or getattr(request.user, 'email', ''),
-            'email': getattr(request.user, 'email', ''),
-            'first_name': getattr(request.user, 'first_name', '') or '',
-            'last_name': getattr(request.user, 'last_name', '') or '',
-        }
-    )
-    
-    # Update user data if not created
-    if not created:
-        if request.user.email and request.user.email != user.email:
-            user.email = request.user.email
-        if request.user.first_name and request.user.first_name != user.first_name:
-            user.first_name = request.user.first_name
-        if request.user.last_name and request.user.last_name != user.last_name:
-            user.last_name = request.user.last_name
-        user.save()
+    user = get_or_create_user_with_clerk_data(request.user)
+    today = user_today(user)
     
-    # Get user's activities and entries
-    activities = user.activities.all()
-    entries = StreakEntry.objects.filter(activity__user=user)
+    # Activity totals from the stored streak state, entry totals from the daily rollups
+    activity_stats = user.activities.aggregate(
+        total=Count('id'),
+        total_streaks=Sum(current_streak_expression(today)),
+        longest_streak=Max('streak_best'),
+        first_created=Min('created_at'),
+    )
+    rollup_stats = DailyUserRollup.objects.filter(user=user).aggregate(
+        completions=Sum('completed_count'),
+        entries=Sum('active_activity_count'),
+        first_date=Min('date'),
+    )
     
     # Calculate comprehensive stats
-    total_activities = activities.count()
-    total_completions = entries.filter(completed=True).count()
-    total_streaks = sum(activity.current_streak for activity in activities)
-    longest_streak = max([activity.best_streak for activity in activities], default=0)
+    total_activities = activity_stats['total']
+    total_completions = rollup_stats['completions'] or 0
+    total_streaks = activity_stats['total_streaks'] or 0
+    longest_streak = activity_stats['longest_streak'] or 0
     
     # Calculate days active (days since first activity or user creation)
-    first_activity = activities.order_by('created_at').first()
-    first_entry = entries.order_by('date').first()
+    first_activity_date = activity_stats['first_created'].date() if activity_stats['first_created'] else None
+    first_entry_date = rollup_stats['first_date']
     
-    if first_activity or first_entry:
+    if first_activity_date or first_entry_date:
         start_date = min(
-            first_activity.created_at.date() if first_activity else timezone.now().date(),
-            first_entry.date if first_entry else timezone.now().date()
+            first_activity_date or today,
+            first_entry_date or today
         )
-        days_active = (timezone.now().date() - start_date).days + 1
+        days_active = (today - start_date).days + 1
     else:
-        days_active = (timezone.now().date() - user.date_joined.date()).days + 1
+        days_active = (today - user.date_joined.date()).days + 1
     
     # Calculate completion rate
-    total_possible_completions = entries.count()
+    total_possible_completions = rollup_stats['entries'] or 0
     completion_rate = round((total_completions / total_possible_completions * 100), 1) if total_possible_completions > 0 else 0
     
     # Calculate achievements
     achievements = []
     
     # First Streak achievement
-    first_streak_achieved = any(activity.best_streak >= 7 for activity in activities)
+    first_streak_achieved = longest_streak >= 7
     achievements.append({
         'id': 1,
         'name': 'First Streak',
@@ -340,3 +247,29 @@ def all_users_info(request):
         'total_users': users.count(),
         'users': users_data
     })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+@authentication_classes([ClerkAuthentication])
+def request_profiles(request):
+    """List the stored profiles of slow requests, newest first (admin only)"""
+    profiles = list_profiles()
+    return Response({
+        'total_profiles': len(profiles),
+        'profiles': profiles
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+@authentication_classes([ClerkAuthentication])
+def request_profile_download(request, profile_id):
+    """Download one profile with its collapsed stacks and SQL statements (admin only)"""
+    profile = get_profile(profile_id)
+    if profile is None:
+        return Response({'error': 'Profile not found or expired'}, status=status.HTTP_404_NOT_FOUND)
+    
+    response = JsonResponse(profile)
+    response['Content-Disposition'] = f'attachment; filename="profile-{profile_id}.json"'
+    return response
@@ -117,7 +117,7 @@ const ActivitiesView = () => {
     try {
       // Call API with retry mechanism
       const result = await apiCallWithRetry(() => activitiesAPI.completeActivity(activityId));
-      const returnedActivity = result.activity;
+      const returnedActivity = { ...prevActivity, ...result.activity };
       const refreshedActivities = [
         ...prevActivities.slice(0, activityIndex),
         returnedActivity,
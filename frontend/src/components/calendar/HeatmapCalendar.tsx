@@ -1,7 +1,7 @@
 
 import { useState, useEffect } from 'react';
-import { format, startOfYear, endOfYear, eachDayOfInterval, getDay, startOfWeek, isSameDay, getMonth } from 'date-fns';
-import { activitiesAPI, CalendarEntry } from '@/lib/activities';
+import { format, startOfYear, endOfYear, eachDayOfInterval, getDay, startOfWeek, isSameDay, getMonth, addDays, parseISO } from 'date-fns';
+import { activitiesAPI, CompactCalendar } from '@/lib/activities';
 import { useClerkAuth } from '@/contexts/ClerkAuthContext';
 import { useApiWithRetry } from '@/hooks/useApiWithRetry';
 
@@ -43,15 +43,17 @@ const HeatmapCalendar = () => {
       const startDate = format(yearStart, 'yyyy-MM-dd');
       const endDate = format(yearEnd, 'yyyy-MM-dd');
       
-      const calendarEntries: CalendarEntry[] = await apiCallWithRetry(() => activitiesAPI.getCalendarEntries(startDate, endDate));
+      const calendar: CompactCalendar = await apiCallWithRetry(() => activitiesAPI.getCompactCalendar(startDate, endDate));
       
-      // Transform the data to calculate completion percentages
-      const transformedData: ActivityData[] = calendarEntries.map(entry => ({
-        date: entry.date,
-        completedCount: entry.total_completed,
-        totalCount: entry.total_activities,
-        completionPercentage: entry.total_activities > 0 
-          ? (entry.total_completed / entry.total_activities) * 100 
+      // Only per-day totals are needed for the heatmap
+      const rangeStart = parseISO(calendar.start_date);
+      const totalCount = calendar.total_activities;
+      const transformedData: ActivityData[] = calendar.totals.map((completedCount, day) => ({
+        date: format(addDays(rangeStart, day), 'yyyy-MM-dd'),
+        completedCount,
+        totalCount,
+        completionPercentage: totalCount > 0 
+          ? (completedCount / totalCount) * 100 
           : 0
       }));
       
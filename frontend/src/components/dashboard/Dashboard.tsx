@@ -81,8 +81,8 @@ const Dashboard = () => {
     try {
       // Call API with retry mechanism
       const result = await apiCallWithRetry(() => activitiesAPI.completeActivity(activityId));
-      // Use the returned activity to update the state
-      const returnedActivity = result.activity;
+      // Merge the returned metrics into the activity
+      const returnedActivity = { ...prevActivity, ...result.activity };
       // Use the latest activities array (from optimistic update)
       const latestActivities = [...newActivities];
       latestActivities[activityIndex] = returnedActivity;
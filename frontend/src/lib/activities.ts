@@ -69,7 +69,48 @@ export interface CalendarEntry {
   total_activities: number;
 }
 
+// Compact calendar layout: bit n of an activity's base64 bitset (LSB first) is day n of the range
+export interface CompactCalendar {
+  start_date: string;
+  end_date: string;
+  days: number;
+  total_activities: number;
+  totals: number[];
+  activities: {
+    id: number;
+    title: string;
+    color: string;
+    completed: string;
+  }[];
+  notes: {
+    activity: number;
+    day: number;
+    note: string;
+  }[];
+}
+
+export const isCompletedOnDay = (bitset: string, day: number): boolean => {
+  const byte = atob(bitset).charCodeAt(day >> 3);
+  return ((byte >> (day & 7)) & 1) === 1;
+};
+
+// Toggling completion returns only the metrics that changed; merge them into the stored activity
+export interface CompleteActivityResult {
+  message: string;
+  entry: {
+    id: number;
+    date: string;
+    completed: boolean;
+  };
+  activity: Pick<Activity, 'id' | 'current_streak' | 'best_streak' | 'total_completions' | 'completed_today' | 'weekly_progress'>;
+}
+
+export type AnalyticsRange = '7d' | '30d' | '90d' | '365d';
+
 export interface AnalyticsData {
+  range: AnalyticsRange;
+  start_date: string;
+  end_date: string;
   total_activities: number;
   total_completions: number;
   average_streak: number;
@@ -80,7 +121,25 @@ export interface AnalyticsData {
     avg_streak: number;
     avg_completions: number;
   }>;
-  message: string;
+  range_completions: number;
+  completion_rate: number;
+  weekday_completions: {
+    weekday: string;
+    completions: number;
+  }[];
+  timeline: {
+    date: string;
+    completed: number;
+    active_activities: number;
+    completion_rate: number;
+    rolling_7: number;
+    rolling_30: number;
+  }[];
+  yearly: {
+    year: number;
+    completions: number;
+    longest_run: number;
+  }[];
 }
 
 export interface UserProfileStats {
@@ -175,7 +234,7 @@ export const activitiesAPI = {
   },
 
   // Complete activity for today
-  completeActivity: async (id: number, note?: string): Promise<{ message: string; activity: Activity }> => {
+  completeActivity: async (id: number, note?: string): Promise<CompleteActivityResult> => {
     try {
       const response = await api.post(`/activities/complete/${id}/`, { note });
       return response.data;
@@ -202,9 +261,15 @@ export const activitiesAPI = {
     return response.data;
   },
 
+  // Get calendar entries in the compact layout (for long ranges such as the year heatmap)
+  getCompactCalendar: async (startDate: string, endDate: string): Promise<CompactCalendar> => {
+    const response = await api.get(`/activities/calendar/?start_date=${startDate}&end_date=${endDate}&format=compact`);
+    return response.data;
+  },
+
   // Get analytics
-  getAnalytics: async (): Promise<AnalyticsData> => {
-    const response = await api.get('/activities/analytics/');
+  getAnalytics: async (range: AnalyticsRange = '30d'): Promise<AnalyticsData> => {
+    const response = await api.get(`/activities/analytics/?range=${range}`);
     return response.data;
   },
 
@@ -240,6 +305,20 @@ export const entriesAPI = {
     return response.data;
   },
 
+  // Create or update many entries at once (e.g. syncing offline history)
+  bulkUpsertEntries: async (entries: {
+    date: string;
+    activity: number;
+    completed: boolean;
+    note?: string;
+  }[]): Promise<{
+    saved: number;
+    activities: Pick<Activity, 'id' | 'current_streak' | 'best_streak' | 'total_completions' | 'completed_today' | 'weekly_progress'>[];
+  }> => {
+    const response = await api.post('/activities/entries/bulk/', { entries });
+    return response.data;
+  },
+
   // Update entry
   updateEntry: async (id: number, data: {
     completed?: boolean;